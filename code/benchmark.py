@@ -0,0 +1,282 @@
+#%%
+import datetime as datetime
+import os
+import re
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import yaml
+import numpy as np
+import pandas as pd
+
+import projection_functions as projection_functions
+import data_processing as data_processing
+import plotting as plotting
+import synthetic_inputs as synthetic_inputs
+from instrumentation import count_rows
+from utility_functions import find_project_root
+
+#############################################################
+# Benchmarks for the projection, aggregation, output and plotting stages
+#############################################################
+#Times each stage on the real config/parameters.yml and on copies of it scaled up to more economies and longer horizons, and saves the results to output_data/benchmarks as json so runs from different commits can be compared with compare_benchmarks. Run it as its own script, e.g.
+#   python code/benchmark.py --scales 1 10 100 --end-years 2070 2150
+#   python code/benchmark.py --compare output_data/benchmarks/benchmark_A.json output_data/benchmarks/benchmark_B.json
+#
+#python code/benchmark.py --imports checks the import time of each module against IMPORT_BUDGETS instead, in fresh processes (like the process pool workers get), and that the slow optional dependencies arent loaded by modules that dont need them.
+#
+#With --synthetic sparse (or dense/none) the scaled configs are made by synthetic_inputs.generate_synthetic_config instead of copying the real economies, so every economy has different values, units, builds and rate changes. They come from --seed, so repeat runs time exactly the same configs.
+#
+#Each stage is run repeats times for the timings (the best and median are kept) and then once more under tracemalloc for its peak memory, so the memory pass doesnt slow down the timings.
+
+BENCHMARK_OUTPUT_DIR = os.path.join('output_data', 'benchmarks')
+BENCHMARK_ENGINES = ['batched', 'numpy', 'pandas']
+#the slow stages are skipped above these numbers of economies so a run finishes in reasonable time (the monte carlo runs all its draws for every economy, and plot_projections can only facet about 200 economies)
+MAX_ECONOMIES_FOR_STAGE = {'project_energy_use_pandas': 250, 'project_energy_use_monte_carlo': 50, 'plot_projections': 200}
+#the most seconds each module can take to import (numpy and pandas are most of it) and the packages it must not load when it is imported. plotting loads plotly.express and kaleido when it makes figures, and numba is only loaded by the numba kernel backend the first time it runs. tests/test_import_budgets.py checks these too
+IMPORT_BUDGETS = {
+    'utility_functions': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba']},
+    'projection_functions': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba']},
+    'instrumentation': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba']},
+    'input_sync': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba']},
+    'data_processing': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba', 'openpyxl']},
+    'cli': {'seconds': 1.0, 'not_loaded': ['scipy', 'plotly', 'numba']},
+    'plotting': {'seconds': 1.5, 'not_loaded': ['scipy', 'plotly.express', 'numba', 'kaleido']},
+    'dashboard': {'seconds': 1.5, 'not_loaded': ['scipy', 'plotly.express', 'numba', 'kaleido']},
+}
+
+
+def scale_config(config, economy_multiplier=1, end_year=None):
+    """Copy config with each economy repeated economy_multiplier times (the copies are named e.g. 01_AUS_x002) and end_year replaced. The copies run exactly the same projection as the original, so the work scales with the number of economies."""
+    config = copy.deepcopy(config)
+    config['confidence_interval_method'] = 'simple'
+    if end_year is not None:
+        config['end_year'] = end_year
+    if economy_multiplier > 1:
+        scaled_economies = []
+        for copy_number in range(economy_multiplier):
+            for econ_entry in config['economies']:
+                econ_entry = copy.deepcopy(econ_entry)
+                if copy_number > 0:
+                    econ_entry['name'] = f"{econ_entry['name']}_x{copy_number:03d}"
+                scaled_economies.append(econ_entry)
+        config['economies'] = scaled_economies
+        config['economies_list'] = [econ_entry['name'] for econ_entry in scaled_economies]
+    return config
+
+
+def time_stage(function, repeats=3):
+    """Run function repeats times and then once under tracemalloc. Returns (result, timings dict)."""
+    wall_seconds = []
+    cpu_seconds = []
+    for _ in range(repeats):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = function()
+        cpu_seconds.append(time.process_time() - cpu_start)
+        wall_seconds.append(time.perf_counter() - wall_start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    timings = {
+        'best_seconds': min(wall_seconds),
+        'median_seconds': float(np.median(wall_seconds)),
+        'cpu_seconds': float(np.median(cpu_seconds)),
+        'peak_mb': peak_bytes / 1e6,
+        'rows': count_rows(result),
+    }
+    return result, timings
+
+
+def benchmark_case(config, case_name, repeats=3, engines=('batched',), include_plots=True, backends=('numpy',)):
+    """Benchmark every stage on one config. Returns a list of result dicts. The batched engine is timed with each of the kernel backends (the numpy one is recorded as plain batched)."""
+    n_economies = len(config['economies'])
+    n_years = config['end_year'] - config['start_year'] + 1
+    records = []
+
+    def record(stage, function, engine=None):
+        limit_key = 'project_energy_use_pandas' if engine == 'pandas' else stage
+        if n_economies > MAX_ECONOMIES_FOR_STAGE.get(limit_key, np.inf):
+            print(f'{case_name}: skipped {stage} {engine or ""} ({n_economies} economies)')
+            return None
+        try:
+            result, timings = time_stage(function, repeats)
+        except Exception as error:
+            #keep going with the other stages, the error is saved with the results
+            records.append({'case': case_name, 'economies': n_economies, 'years': n_years, 'stage': stage, 'engine': engine, 'repeats': repeats, 'error': repr(error)})
+            print(f'{case_name}: {stage} {engine or ""} failed: {error!r}')
+            return None
+        records.append({'case': case_name, 'economies': n_economies, 'years': n_years, 'stage': stage, 'engine': engine, 'repeats': repeats, **timings})
+        print(f"{case_name}: {stage} {engine or ''} {timings['best_seconds']:.3f}s (peak {timings['peak_mb']:.1f} MB)")
+        return result
+
+    for engine in engines:
+        if engine != 'batched':
+            record('project_energy_use', lambda: projection_functions.project_energy_use(config, engine=engine), engine=engine)
+            continue
+        for backend in backends:
+            #run it once first so numba is compiled before it is timed
+            backend_config = {**config, 'kernel_backend': backend}
+            projection_functions.project_energy_use(backend_config)
+            record('project_energy_use', lambda: projection_functions.project_energy_use(backend_config), engine='batched' if backend == 'numpy' else f'batched_{backend}')
+    #the later stages use the default engine's projections
+    projections = projection_functions.project_energy_use(config)
+    record('project_energy_use_monte_carlo', lambda: projection_functions.project_energy_use_monte_carlo(config))
+    apec_aggregate = record('aggregate_apec_values', lambda: data_processing.aggregate_apec_values(projections, config))
+    outlook_results = record('clean_results_for_outlook', lambda: data_processing.clean_results_for_outlook(projections, apec_aggregate))
+    with tempfile.TemporaryDirectory() as output_dir:
+        #resume=False so every repeat writes the files
+        record('save_outputs', lambda: data_processing.save_outputs(outlook_results, output_dir=output_dir, resume=False))
+        if include_plots:
+            #plot_apec_aggregate writes to plotting_output in the working directory
+            working_dir = os.getcwd()
+            os.makedirs(os.path.join(output_dir, 'plotting_output'), exist_ok=True)
+            os.chdir(output_dir)
+            try:
+                record('plot_projections', lambda: plotting.plot_projections(projections, output_dir=os.path.join(output_dir, 'plotting_output')))
+                record('plot_apec_aggregate', lambda: plotting.plot_apec_aggregate(apec_aggregate))
+            finally:
+                os.chdir(working_dir)
+    return records
+
+
+def measure_import(module_name, repeats=3):
+    """Import module_name in a new python process repeats times. Returns the best import time in seconds (from python -X importtime) and the top level packages that were loaded."""
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    best_seconds = None
+    for _ in range(repeats):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import sys, json, {module_name}; print(json.dumps(sorted(sys.modules)))'], cwd=code_dir, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise ValueError(f'Importing {module_name} failed: {process.stderr.strip().splitlines()[-1]}')
+        #lines are 'import time: self [us] | cumulative | imported package'
+        for line in process.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) == 3 and parts[2].strip() == module_name:
+                seconds = int(parts[1]) / 1e6
+                best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+        loaded_modules = json.loads(process.stdout.strip().splitlines()[-1])
+    return best_seconds, loaded_modules
+
+
+def check_import_budgets(budgets=None, repeats=3):
+    """Check each module in budgets (IMPORT_BUDGETS by default) imports within its time and doesnt load the packages in its not_loaded list. Prints a table and raises a ValueError listing the modules that are over budget."""
+    if budgets is None:
+        budgets = IMPORT_BUDGETS
+    rows = []
+    for module_name, budget in budgets.items():
+        seconds, loaded_modules = measure_import(module_name, repeats)
+        loaded = [package for package in budget['not_loaded'] if any(module == package or module.startswith(package + '.') for module in loaded_modules)]
+        rows.append({'module': module_name, 'seconds': seconds, 'budget_seconds': budget['seconds'], 'loaded_but_not_allowed': ', '.join(loaded), 'ok': seconds <= budget['seconds'] and len(loaded) == 0})
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    failures = results.loc[~results['ok']]
+    if len(failures) > 0:
+        raise ValueError(f"Modules over their import budget: {failures['module'].tolist()}")
+    return results
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(config, scales=(1, 10, 100, 1000), end_years=(None, 2150), repeats=3, engines=('batched',), include_plots=True, output_path=None, synthetic=None, seed=0, backends=('numpy',)):
+    """Benchmark the real config (scale 1 with its own end_year) and each scaled copy, and save the results as json. Returns the results as a df.
+
+    If synthetic is a density from synthetic_inputs.SYNTHETIC_DENSITIES each case is a synthetic config with scale times the number of economies in config instead (made from seed).
+    """
+    records = []
+    for scale in scales:
+        for end_year in end_years:
+            if synthetic is None:
+                case_config = scale_config(config, economy_multiplier=scale, end_year=end_year)
+                case_name = f"x{scale}_to_{case_config['end_year']}"
+            else:
+                case_config = scale_config(synthetic_inputs.generate_synthetic_config(scale * len(config['economies']), seed=seed, density=synthetic, base_config=config, end_year=end_year))
+                case_name = f"synthetic_{synthetic}_x{scale}_to_{case_config['end_year']}"
+            records.extend(benchmark_case(case_config, case_name, repeats=repeats, engines=engines, include_plots=include_plots, backends=backends))
+
+    commit = get_git_commit()
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'synthetic': synthetic,
+        'seed': seed if synthetic is not None else None,
+        'records': records,
+    }
+    if output_path is None:
+        os.makedirs(BENCHMARK_OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(BENCHMARK_OUTPUT_DIR, f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nocommit'}.json")
+    with open(output_path, 'w') as file:
+        json.dump(results, file, indent=1)
+    print(f'Saved benchmark results to {output_path}')
+    return pd.DataFrame(records)
+
+
+def load_benchmark(path):
+    with open(path, 'r') as file:
+        results = json.load(file)
+    records = pd.DataFrame(results['records'])
+    records['engine'] = records['engine'].fillna('')
+    return results, records
+
+
+def compare_benchmarks(old_path, new_path):
+    """Print and return the best times and peak memory of two benchmark files side by side, with new/old ratios (below 1 is faster or smaller)."""
+    old_results, old_records = load_benchmark(old_path)
+    new_results, new_records = load_benchmark(new_path)
+    keys = ['case', 'stage', 'engine']
+    comparison = old_records[keys + ['best_seconds', 'peak_mb']].merge(new_records[keys + ['best_seconds', 'peak_mb']], on=keys, suffixes=('_old', '_new'))
+    comparison['time_ratio'] = comparison['best_seconds_new'] / comparison['best_seconds_old']
+    comparison['memory_ratio'] = comparison['peak_mb_new'] / comparison['peak_mb_old']
+    print(f"{old_path} ({old_results.get('git_commit')}) -> {new_path} ({new_results.get('git_commit')})")
+    print(comparison.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    return comparison
+
+
+#%%
+if __name__ == '__main__':
+    # Change directory to the root of the project (the folder with config/parameters.yml)
+    os.chdir(find_project_root())
+
+    parser = argparse.ArgumentParser(description='Benchmark the data centres projection pipeline')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000], help='multiples of the number of economies in parameters.yml')
+    parser.add_argument('--end-years', type=int, nargs='+', default=[0, 2150], help='end years to run to, 0 for the end_year in parameters.yml')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--engines', nargs='+', default=['batched'], choices=BENCHMARK_ENGINES)
+    parser.add_argument('--backends', nargs='+', default=['numpy'], choices=list(projection_functions.KERNEL_BACKENDS.keys()), help='kernel backends to time the batched engine with')
+    parser.add_argument('--no-plots', action='store_true', help='skip the plotting stages')
+    parser.add_argument('--output', default=None, help='json file to save to (defaults to output_data/benchmarks/benchmark_{date}_{commit}.json)')
+    parser.add_argument('--synthetic', default=None, choices=list(synthetic_inputs.SYNTHETIC_DENSITIES.keys()), help='time synthetic configs with this density of builds and rate changes instead of copies of parameters.yml')
+    parser.add_argument('--seed', type=int, default=0, help='seed for --synthetic')
+    parser.add_argument('--imports', action='store_true', help='check the import time of each module against IMPORT_BUDGETS instead of running')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two benchmark files instead of running')
+    args = parser.parse_args()
+
+    if args.imports:
+        check_import_budgets()
+        sys.exit(0)
+    if args.compare is not None:
+        compare_benchmarks(*args.compare)
+        sys.exit(0)
+    with open('config/parameters.yml', 'r') as file:
+        config = yaml.safe_load(file)
+    end_years = [end_year if end_year > 0 else None for end_year in args.end_years]
+    run_benchmarks(config, scales=args.scales, end_years=end_years, repeats=args.repeats, engines=args.engines, include_plots=not args.no_plots, output_path=args.output, synthetic=args.synthetic, seed=args.seed, backends=args.backends)
+#%%
@@ -0,0 +1,167 @@
+#%%
+import datetime as datetime
+import os
+import importlib
+import argparse
+import yaml
+
+from utility_functions import find_project_root
+import instrumentation as instrumentation
+
+#############################################################
+# Command line entry point
+#############################################################
+#Runs the stages of main.py without the notebook cells, and only the stages the subcommand needs, e.g.
+#   python code/cli.py project                   projections only, saved to output_data (for the nightly run)
+#   python code/cli.py aggregate                 projections and the APEC aggregate
+#   python code/cli.py plot                      projections, APEC aggregate and their figures
+#   python code/cli.py compare                   the outlook comparison figures and dashboard.html
+#   python code/cli.py export --formats csv xlsx the outlook results (what save_outputs writes)
+#It finds the project folder with find_project_root, so it can be run from any working directory (or set DATA_CENTRES_ROOT). The modules for each stage are only imported when the stage runs, so project only imports projection_functions and never loads plotly, scipy or the outlook data.
+
+SUBCOMMAND_STAGES = {
+    'project': ['project'],
+    'aggregate': ['project', 'aggregate'],
+    'plot': ['project', 'aggregate', 'plot'],
+    'compare': ['project', 'aggregate', 'clean', 'compare'],
+    'export': ['project', 'aggregate', 'clean', 'export'],
+}
+SUBCOMMAND_HELP = {
+    'project': 'project energy use for every economy and scenario and save the projections',
+    'aggregate': 'also aggregate to APEC (with the confidence intervals) and save the aggregate',
+    'plot': 'also plot the projections and the APEC aggregate',
+    'compare': 'also compare the results to the outlook data and write the by economy figures and dashboard.html',
+    'export': 'also save the outlook results in output_formats (or --formats)',
+}
+
+
+def import_stage_modules(args, *module_names):
+    """Import the modules a stage needs, and wrap their functions for the trace if --trace is on."""
+    modules = {module_name: importlib.import_module(module_name) for module_name in module_names}
+    if args.trace:
+        instrumentation.instrument_functions(modules)
+    return modules
+
+
+def save_table(df, name, args):
+    """Save a df the cli made to output_data/{name}_{date}.{args.table_format}."""
+    os.makedirs('output_data', exist_ok=True)
+    path = os.path.join('output_data', f"{name}_{datetime.datetime.now().strftime('%Y%m%d')}.{args.table_format}")
+    if args.table_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    print(f'Saved {len(df)} rows to {path}')
+    return path
+
+
+def run_project(config, state, args):
+    projection_functions = import_stage_modules(args, 'projection_functions')['projection_functions']
+    cache_dir = None if args.no_cache else os.path.join('output_data', '.cache')
+    state['projections'], state['scenario_variants'] = projection_functions.project_energy_use_scenarios(config, engine=args.engine, cache_dir=cache_dir)
+    if args.subcommand == 'project':
+        save_table(state['projections'], 'data_centres_projections', args)
+    return state['projections']
+
+
+def run_aggregate(config, state, args):
+    modules = import_stage_modules(args, 'projection_functions', 'data_processing')
+    apec_bands = None
+    if config.get('confidence_interval_method', 'simple') == 'monte_carlo':
+        variant_configs, _ = modules['projection_functions'].resolve_scenario_variants(config)
+        apec_bands = {variant: modules['projection_functions'].project_energy_use_monte_carlo(variant_config)[1] for variant, variant_config in enumerate(variant_configs)}
+    state['apec_aggregate'] = modules['data_processing'].aggregate_apec_values(state['projections'], config, apec_bands=apec_bands)
+    if args.subcommand == 'aggregate':
+        save_table(state['apec_aggregate'], 'data_centres_apec_aggregate', args)
+    return state['apec_aggregate']
+
+
+def run_plot(config, state, args):
+    plotting = import_stage_modules(args, 'plotting')['plotting']
+    os.makedirs('plotting_output', exist_ok=True)
+    #the plots are of the first scenario, like in main.py
+    figures = plotting.plot_projections(state['projections'].loc[state['projections']['variant']==0].drop(columns='variant'))
+    figures.update(plotting.plot_apec_aggregate(state['apec_aggregate'].loc[state['apec_aggregate']['variant']==0]))
+    if args.static and 'static_export' in config:
+        plotting.export_static_images(figures, **plotting.static_export_settings(config))
+    return figures
+
+
+def run_clean(config, state, args):
+    data_processing = import_stage_modules(args, 'data_processing')['data_processing']
+    state['outlook_results'] = data_processing.clean_results_for_outlook(state['projections'], state['apec_aggregate'], state['scenario_variants'])
+    return state['outlook_results']
+
+
+def run_compare(config, state, args):
+    modules = import_stage_modules(args, 'data_processing', 'plotting', 'dashboard')
+    from utility_functions import get_latest_date_for_data_file, DatedFileCatalog
+    file_date_id = get_latest_date_for_data_file('input_data', 'merged_file_energy_00_APEC_', file_name_end='.csv', EXCLUDE_DATE_STR_START=False)
+    if file_date_id is None:
+        raise ValueError('There is no input_data/merged_file_energy_00_APEC_{date}.csv to compare to')
+    outlook_energy_APEC_path = os.path.join('input_data', f'merged_file_energy_00_APEC_{file_date_id}.csv')
+    file_paths = [outlook_energy_APEC_path] + modules['data_processing'].find_latest_merged_file_energy_files(config, catalog=DatedFileCatalog('input_data'))
+    outlook_energy_all_economies, _ = modules['data_processing'].load_outlook_energy_files(file_paths)
+    os.makedirs(os.path.join('plotting_output', 'by_economy'), exist_ok=True)
+    outlook_comparison = modules['plotting'].import_and_compare_to_outlook_results(state['outlook_results'], outlook_energy_all_economies)
+    modules['dashboard'].export_dashboard(state['projections'], state['apec_aggregate'], outlook_comparison, state['scenario_variants'])
+    return outlook_comparison
+
+
+def run_export(config, state, args):
+    data_processing = import_stage_modules(args, 'data_processing')['data_processing']
+    formats = args.formats or config.get('output_formats', ['csv'])
+    return data_processing.save_outputs(state['outlook_results'], formats=formats)
+
+
+STAGE_FUNCTIONS = {'project': run_project, 'aggregate': run_aggregate, 'plot': run_plot, 'clean': run_clean, 'compare': run_compare, 'export': run_export}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Run the data centres energy use projection pipeline')
+    subparsers = parser.add_subparsers(dest='subcommand', required=True)
+    for subcommand, help_text in SUBCOMMAND_HELP.items():
+        subparser = subparsers.add_parser(subcommand, help=help_text, description=help_text)
+        subparser.set_defaults(static=False, formats=None)
+        subparser.add_argument('--root', default=None, help='project folder (defaults to DATA_CENTRES_ROOT or the folder above code/)')
+        subparser.add_argument('--config', default=os.path.join('config', 'parameters.yml'), help='config file, relative to the project folder')
+        subparser.add_argument('--engine', default='batched', choices=['batched', 'numpy', 'pandas'])
+        subparser.add_argument('--backend', default=None, choices=['auto', 'numpy', 'python', 'numba'], help='override kernel_backend')
+        subparser.add_argument('--ci', default=None, choices=['simple', 'monte_carlo'], help='override confidence_interval_method')
+        subparser.add_argument('--no-cache', action='store_true', help='dont use or update the projection cache in output_data/.cache')
+        subparser.add_argument('--table-format', default='csv', choices=['csv', 'parquet'], help='format of the projections and aggregate saved by project and aggregate')
+        subparser.add_argument('--trace', action='store_true', help='print and save the time and memory of each stage (see instrumentation.py)')
+        subparser.add_argument('--profile-stage', default=None, help='stage or function to profile, implies --trace')
+        subparser.add_argument('--profile-mode', default='cprofile', choices=instrumentation.PROFILE_MODES)
+        if subcommand == 'plot':
+            subparser.add_argument('--static', action='store_true', help='also export the figures as images (static_export in parameters.yml)')
+        if subcommand == 'export':
+            subparser.add_argument('--formats', nargs='+', default=None, help='formats to save in, defaults to output_formats in parameters.yml')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile_stage is not None:
+        args.trace = True
+    os.chdir(os.path.abspath(args.root) if args.root is not None else find_project_root())
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    if args.ci is not None:
+        config['confidence_interval_method'] = args.ci
+    if args.backend is not None:
+        config['kernel_backend'] = args.backend
+
+    instrumentation.start_trace(profile_stage=args.profile_stage, profile_mode=args.profile_mode)
+    state = {}
+    for stage_name in SUBCOMMAND_STAGES[args.subcommand]:
+        instrumentation.run_stage(stage_name, STAGE_FUNCTIONS[stage_name], config, state, args)
+    if args.trace:
+        instrumentation.finish_trace()
+    return state
+
+
+#%%
+if __name__ == '__main__':
+    main()
+#%%
@@ -0,0 +1,223 @@
+import datetime as datetime
+import os
+import json
+import base64
+import numpy as np
+import pandas as pd
+
+from plotting import UNIT_DIVISORS, ENERGY_UNIT_LABELS, COMPARISON_CHART_TITLES, ensure_plotlyjs, write_file_atomic
+
+#############################################################
+# One page dashboard with the data stored once
+#############################################################
+#export_dashboard writes plotting_output/dashboard.html, which has the projections, the APEC aggregate and the outlook comparison (from import_and_compare_to_outlook_results) in it once, as columns of base64 typed arrays. The page filters them by economy, scenario and unit in the browser, so there is one file to open instead of one per economy, unit and scenario.
+
+DASHBOARD_PROJECTION_COLUMNS = ['year', 'economy', 'variant', 'traditional_data_energy_use', 'ai_training_energy_use', 'traditional_data_activity_indexed', 'ai_training_activity_indexed']
+DASHBOARD_APEC_COLUMNS = ['year', 'variant', 'traditional_data_energy_use', 'ai_training_energy_use', 'total_energy_use', 'total_energy_use_lower', 'total_energy_use_upper']
+DASHBOARD_COMPARISON_COLUMNS = ['economy', 'scenarios', 'chart', 'color', 'year', 'value']
+
+
+def encode_column(series):
+    """Numbers become little endian float32 or int32 arrays, anything else becomes int16 codes into a list of categories. The arrays are base64 so they can sit in the json."""
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        categorical = series.astype(str).astype('category')
+        return {'type': 'category', 'categories': categorical.cat.categories.tolist(), 'codes': base64.b64encode(categorical.cat.codes.to_numpy().astype('<i2').tobytes()).decode('ascii')}
+    if pd.api.types.is_integer_dtype(series):
+        return {'type': 'int32', 'data': base64.b64encode(series.to_numpy().astype('<i4').tobytes()).decode('ascii')}
+    return {'type': 'float32', 'data': base64.b64encode(series.to_numpy(dtype=float).astype('<f4').tobytes()).decode('ascii')}
+
+
+def encode_table(df, columns):
+    missing_columns = [column for column in columns if column not in df.columns]
+    if len(missing_columns) > 0:
+        raise ValueError(f'Missing columns for the dashboard: {missing_columns}')
+    return {'length': len(df), 'columns': {column: encode_column(df[column]) for column in columns}}
+
+
+def build_dashboard_data(projections, apec_aggregate, outlook_comparison=None, scenario_variants=None):
+    """Put everything the dashboard needs into one dict (see export_dashboard)."""
+    if 'variant' not in projections.columns:
+        projections = projections.assign(variant=0)
+    if 'variant' not in apec_aggregate.columns:
+        apec_aggregate = apec_aggregate.assign(variant=0)
+    if scenario_variants is None:
+        scenario_variants = {'reference': 0, 'target': 0}
+    if outlook_comparison is None:
+        outlook_comparison = pd.DataFrame({column: pd.Series(dtype=float if column in ['year', 'value'] else str) for column in DASHBOARD_COMPARISON_COLUMNS})
+    return {
+        'projections': encode_table(projections, DASHBOARD_PROJECTION_COLUMNS),
+        'apec': encode_table(apec_aggregate, DASHBOARD_APEC_COLUMNS),
+        'comparison': encode_table(outlook_comparison, DASHBOARD_COMPARISON_COLUMNS),
+        'scenario_variants': {scenario: int(variant) for scenario, variant in scenario_variants.items()},
+        'economies': ['00_APEC'] + sorted(projections['economy'].astype(str).unique().tolist()),
+        'unit_divisors': UNIT_DIVISORS,
+        'unit_labels': ENERGY_UNIT_LABELS,
+        'chart_titles': COMPARISON_CHART_TITLES,
+        'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def export_dashboard(projections, apec_aggregate, outlook_comparison=None, scenario_variants=None, path=os.path.join('plotting_output', 'dashboard.html')):
+    """Write the dashboard page to path. outlook_comparison is what import_and_compare_to_outlook_results returns, and scenario_variants is from project_energy_use_scenarios. Like the by economy figures it loads plotly.min.js from its own folder."""
+    dashboard_data = build_dashboard_data(projections, apec_aggregate, outlook_comparison, scenario_variants)
+    #stop any text in the data from closing the script tag early
+    data_json = json.dumps(dashboard_data, separators=(',', ':')).replace('</', '<\\/')
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    ensure_plotlyjs(folder)
+    write_file_atomic(path, DASHBOARD_TEMPLATE.replace('__DASHBOARD_DATA__', data_json))
+    print(f'Saved dashboard to {path} ({os.path.getsize(path) / 1e6:.2f} MB)')
+    return path
+
+
+DASHBOARD_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Data centres energy use dashboard</title>
+<script src="plotly.min.js"></script>
+<style>
+body { font-family: sans-serif; margin: 16px; }
+#controls { position: sticky; top: 0; background: white; padding: 8px 0; z-index: 10; }
+#controls label { margin-right: 16px; }
+.chart { width: 100%; height: 420px; }
+.row { display: flex; flex-wrap: wrap; }
+.row .chart { flex: 1 1 45%; min-width: 420px; }
+</style>
+</head>
+<body>
+<h2>Data centres energy use dashboard</h2>
+<div id="controls">
+<label>Economy <select id="economy"></select></label>
+<label>Scenario <select id="scenario"></select></label>
+<label>Unit <select id="unit"></select></label>
+<span id="created"></span>
+</div>
+<div class="row"><div id="energy" class="chart"></div><div id="activity" class="chart"></div></div>
+<div class="row"><div id="buildings" class="chart"></div><div id="electricity" class="chart"></div></div>
+<div class="row"><div id="data_centres" class="chart"></div></div>
+<script type="application/json" id="dashboard-data">__DASHBOARD_DATA__</script>
+<script>
+const DATA = JSON.parse(document.getElementById('dashboard-data').textContent);
+
+//decode the base64 columns into typed arrays once
+function decodeBytes(text) {
+    const binary = atob(text);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes.buffer;
+}
+function decodeTable(table) {
+    const columns = {};
+    for (const [name, column] of Object.entries(table.columns)) {
+        if (column.type === 'category') columns[name] = {categories: column.categories, codes: new Int16Array(decodeBytes(column.codes))};
+        else if (column.type === 'int32') columns[name] = new Int32Array(decodeBytes(column.data));
+        else columns[name] = new Float32Array(decodeBytes(column.data));
+    }
+    return {length: table.length, columns: columns};
+}
+const TABLES = {projections: decodeTable(DATA.projections), apec: decodeTable(DATA.apec), comparison: decodeTable(DATA.comparison)};
+
+//row indices where each category column equals the value (or every row for an empty filter)
+function filterRows(table, filters) {
+    const tests = [];
+    for (const [name, value] of Object.entries(filters)) {
+        const column = table.columns[name];
+        if (column.categories !== undefined) {
+            const code = column.categories.indexOf(String(value));
+            tests.push([column.codes, code]);
+        } else {
+            tests.push([column, value]);
+        }
+    }
+    const rows = [];
+    for (let i = 0; i < table.length; i++) {
+        let keep = true;
+        for (const [values, value] of tests) { if (values[i] !== value) { keep = false; break; } }
+        if (keep) rows.push(i);
+    }
+    return rows;
+}
+function take(column, rows, divisor) {
+    const out = new Array(rows.length);
+    for (let i = 0; i < rows.length; i++) out[i] = column[rows[i]] / divisor;
+    return out;
+}
+function categoryValues(column, rows) {
+    return rows.map(i => column.categories[column.codes[i]]);
+}
+
+function fillSelect(id, values) {
+    const select = document.getElementById(id);
+    for (const value of values) { const option = document.createElement('option'); option.value = value; option.text = value; select.appendChild(option); }
+    select.addEventListener('change', draw);
+}
+fillSelect('economy', DATA.economies);
+fillSelect('scenario', Object.keys(DATA.scenario_variants));
+fillSelect('unit', Object.keys(DATA.unit_divisors));
+document.getElementById('created').textContent = 'made ' + DATA.created;
+
+function layout(title, yTitle) {
+    return {title: {text: title}, xaxis: {title: {text: 'Year'}}, yaxis: {title: {text: yTitle}}, margin: {t: 50}, legend: {orientation: 'h'}};
+}
+function showMessage(id, title, message) {
+    Plotly.react(id, [], Object.assign(layout(title, ''), {annotations: [{text: message, showarrow: false, xref: 'paper', yref: 'paper', x: 0.5, y: 0.5}]}));
+}
+
+function drawEnergy(economy, variant, divisor, yTitle) {
+    const isApec = economy === '00_APEC';
+    const table = isApec ? TABLES.apec : TABLES.projections;
+    const rows = filterRows(table, isApec ? {variant: variant} : {economy: economy, variant: variant});
+    const year = take(table.columns.year, rows, 1);
+    const traces = [
+        {x: year, y: take(table.columns.traditional_data_energy_use, rows, divisor), name: 'traditional_data_energy_use', stackgroup: 'energy', mode: 'lines'},
+        {x: year, y: take(table.columns.ai_training_energy_use, rows, divisor), name: 'ai_training_energy_use', stackgroup: 'energy', mode: 'lines'},
+    ];
+    if (isApec) {
+        traces.push({x: year, y: take(table.columns.total_energy_use_upper, rows, divisor), mode: 'lines', line: {width: 0}, showlegend: false, hoverinfo: 'skip'});
+        traces.push({x: year, y: take(table.columns.total_energy_use_lower, rows, divisor), mode: 'lines', line: {width: 0}, fill: 'tonexty', fillcolor: 'rgba(128, 0, 128, 0.2)', name: 'Total Energy Use CI'});
+    }
+    Plotly.react('energy', traces, layout(`Data centre energy use - ${economy}`, yTitle));
+}
+
+function drawActivity(economy, variant) {
+    if (economy === '00_APEC') { showMessage('activity', 'Indexed activity', 'Indexed activity is shown for each economy'); return; }
+    const table = TABLES.projections;
+    const rows = filterRows(table, {economy: economy, variant: variant});
+    const year = take(table.columns.year, rows, 1);
+    const traces = ['traditional_data_activity_indexed', 'ai_training_activity_indexed'].map(name => ({x: year, y: take(table.columns[name], rows, 1), name: name, mode: 'lines'}));
+    Plotly.react('activity', traces, layout(`Indexed activity - ${economy}`, 'Indexed Activity (Base Year = 100)'));
+}
+
+function drawComparison(chart, economy, scenario, divisor, yTitle) {
+    const table = TABLES.comparison;
+    const title = `${DATA.chart_titles[chart]} - ${economy} - ${scenario}`;
+    const rows = filterRows(table, {economy: economy, scenarios: scenario, chart: chart});
+    if (rows.length === 0) { showMessage(chart, title, 'No outlook data for this economy'); return; }
+    //one stacked trace per color, in the order they first appear
+    const byColor = new Map();
+    const colors = categoryValues(table.columns.color, rows);
+    rows.forEach((row, i) => { if (!byColor.has(colors[i])) byColor.set(colors[i], []); byColor.get(colors[i]).push(row); });
+    const traces = [];
+    for (const [color, colorRows] of byColor) {
+        traces.push({x: take(table.columns.year, colorRows, 1), y: take(table.columns.value, colorRows, divisor), name: color, stackgroup: 'value', mode: 'lines'});
+    }
+    Plotly.react(chart, traces, layout(title, yTitle));
+}
+
+function draw() {
+    const economy = document.getElementById('economy').value;
+    const scenario = document.getElementById('scenario').value;
+    const unit = document.getElementById('unit').value;
+    const variant = DATA.scenario_variants[scenario];
+    const divisor = DATA.unit_divisors[unit];
+    const yTitle = DATA.unit_labels[unit];
+    drawEnergy(economy, variant, divisor, yTitle);
+    drawActivity(economy, variant);
+    for (const chart of Object.keys(DATA.chart_titles)) drawComparison(chart, economy, scenario, divisor, yTitle);
+}
+draw();
+</script>
+</body>
+</html>
+'''
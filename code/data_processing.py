@@ -4,144 +4,231 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
-import plotly.graph_objects as go
-import plotly.express as px
 import shutil
+import hashlib
+import time
+import json
+import importlib.util
+import inspect
+from concurrent.futures import ThreadPoolExecutor
 
-from utility_functions import get_latest_date_for_data_file
-
-def download_all_merged_file_energy_from_economys_from_onedrive(config):
-    known_double_ups_and_their_solutions = ['merged_file_energy_10_MAS_20240905_TGT1.csv']
-    
-    root_onedrive = os.path.join('C:', 'Users', 'finbar.maunsell', 'OneDrive - APERC', 'outlook 9th', 'Modelling', 'Integration')
-    #follow C: with \\
-    root_onedrive = root_onedrive.replace('C:', 'C:\\')
-    root_local = os.path.join('input_data')
-    #look for the csv's in outlook 9th\Modelling\Integration\{ECONOMY}\08_Final, if theres multiple then find the one with the latest date using get_latest_date_for_data_file().
-    file_name_start= 'merged_file_energy'
-    for economy in config['economies_list']:#need a list of econmoies
-        file_name_start_econ = file_name_start+'_'+economy
-        data_folder_path = os.path.join(root_onedrive, economy, '08_Final')
-        date_id = get_latest_date_for_data_file(data_folder_path, file_name_start_econ, file_name_end='.csv', EXCLUDE_DATE_STR_START=False)
-        csvs = [file for file in os.listdir(data_folder_path) if file_name_start_econ in file and date_id in file]
-        if len(csvs) > 1:
-            print(f'Multiple files found for {file_name_start_econ} on {date_id}')
-            found=False
-            for file in csvs:
-                if file in known_double_ups_and_their_solutions:
-                    csv = file
-                    found = True
-                    break
-            if not found:
-                breakpoint()
-                raise ValueError
-        elif len(csvs) == 0:
-            print(f'No files found for {file_name_start_econ} on {date_id}')
-            # raise ValueError
-            continue
-        else:
-            csv = csvs[0]
-        #check th local folder exists
-        if not os.path.exists(os.path.join(root_local, economy)):
-            os.makedirs(os.path.join(root_local, economy))
+from utility_functions import get_latest_date_for_data_file, write_atomic, DatedFileCatalog, OUTLOOK_ID_COLUMNS, OUTLOOK_FLAG_COLUMNS, OUTLOOK_FLAG_VALUES, parse_outlook_flags, to_compact_outlook_table
+import projection_functions
+import input_sync
+
+def download_all_merged_file_energy_from_economys_from_onedrive(config, source_root=None):
+    """Sync the latest merged_file_energy csv for each economy from the integration folders (outlook 9th/Modelling/Integration/{ECONOMY}/08_Final on OneDrive by default, or input_sync: source_root: in parameters.yml) into input_data/{ECONOMY}. See input_sync.sync_merged_file_energy_inputs."""
+    return input_sync.sync_merged_file_energy_inputs(config, source_root=source_root)
+
+
+OUTLOOK_CACHE_DIR = os.path.join('input_data', '.cache')
+
+
+def parse_outlook_csv(df, csv_path, year_dtype='float64'):
+    """Check a merged_file_energy csv read by pd.read_csv against the column contract, then make the id columns categoricals, subtotal_layout and subtotal_results bools and the year columns year_dtype."""
+    check_outlook_columns(df.columns, csv_path)
+    for col in df.columns:
+        if col in OUTLOOK_FLAG_COLUMNS:
+            df[col] = parse_outlook_flags(df[col], f'The {col} column of {csv_path}')
+        elif col in OUTLOOK_ID_COLUMNS:
+            df[col] = df[col].astype('category')
         else:
-            # if the file name is the same dont do anything, if not, empty the folder of ifles begining weith merged_file_energy and copy the new file in
-            if not os.path.exists(os.path.join(root_local, economy, csv)):
-                for file in os.listdir(os.path.join(root_local, economy)):
-                    if file_name_start_econ in file:
-                        os.remove(os.path.join(root_local, economy, file))
-        #copy the file
-        shutil.copyfile(os.path.join(data_folder_path, csv), os.path.join(root_local, economy, csv))
-    return None
+            df[col] = df[col].astype(year_dtype)
+    return df
 
 
-def concat_all_merged_file_energy_files_from_local(config):
-    all_data = pd.DataFrame()
+def outlook_parse_hash():
+    """Hash of the functions and constants parse_outlook_csv uses, so cached copies are read again when any of them change."""
+    parts = [inspect.getsource(function) for function in [parse_outlook_csv, check_outlook_columns, parse_outlook_flags]]
+    parts += [repr(constant) for constant in [OUTLOOK_ID_COLUMNS, OUTLOOK_FLAG_COLUMNS, OUTLOOK_FLAG_VALUES]]
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def read_outlook_csv_cached(csv_path, cache_dir=OUTLOOK_CACHE_DIR, year_dtype='float64'):
+    """Read one of the wide merged_file_energy csvs, using a parquet copy of it if there is one.
+
+    The first read parses the csv with parse_outlook_csv and saves it to cache_dir. The cache file name includes a hash of the csv path, modified time and size (and outlook_parse_hash), so if the csv or the parsing changes it is read again and the old copy is replaced.
+    """
+    stat = os.stat(csv_path)
+    path_id = hashlib.sha256(os.path.abspath(csv_path).encode()).hexdigest()[:12]
+    file_id = hashlib.sha256(f'{stat.st_mtime_ns}_{stat.st_size}_{year_dtype}_{outlook_parse_hash()}'.encode()).hexdigest()[:12]
+    csv_name = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(cache_dir, f'{csv_name}_{path_id}_{file_id}.parquet')
+    if os.path.exists(cache_path):
+        #a copy that cant be read is replaced, like a changed csv
+        try:
+            return pd.read_parquet(cache_path)
+        except (OSError, ValueError) as error:
+            print(f'Could not read the cached copy {cache_path} ({error}), so {csv_path} will be read again')
+    
+    df = parse_outlook_csv(pd.read_csv(csv_path), csv_path, year_dtype)
+    
+    #this runs on several threads at once (see load_outlook_energy_files), so the folder may be made by another one, and the parquet is written through a temp file so a half written copy is never read
+    os.makedirs(cache_dir, exist_ok=True)
+    write_atomic(cache_path, lambda temp_path: df.to_parquet(temp_path, index=False))
+    #remove any old copies of this csv
+    for file in os.listdir(cache_dir):
+        if file.startswith(f'{csv_name}_{path_id}_') and file.endswith('.parquet') and file != os.path.basename(cache_path):
+            try:
+                os.remove(os.path.join(cache_dir, file))
+            except FileNotFoundError:
+                pass
+    return df
+
+
+def find_latest_merged_file_energy_files(config, catalog=None):
+    """Get the path of the latest merged_file_energy csv in input_data/{economy} for each economy in config['economies_list']. Pass a DatedFileCatalog of input_data to reuse one that has already been scanned."""
+    if catalog is None:
+        catalog = DatedFileCatalog('input_data')
+    file_paths = []
     for economy in config['economies_list']:
-        #get the date of the latest file
-        if not os.path.exists(os.path.join('input_data', economy)):
+        latest_file = catalog.latest_file('merged_file_energy', economy, extension='.csv', folder=os.path.join('input_data', economy))
+        if latest_file is None:
+            print(f'No files found for {economy}')
             continue
-        date_id = get_latest_date_for_data_file(os.path.join('input_data', economy), file_name_start='merged_file_energy', file_name_end='.csv', EXCLUDE_DATE_STR_START=False)
-        #get all the files in the local folder
-        all_files = os.listdir(os.path.join('input_data', economy))
-        #filter for only the files with the correct file extension
-        latest_file = [file for file in all_files if date_id in file and 'merged_file_energy' in file]
-        if len(latest_file) == 0:
-            # raise ValueError
-            print(f'No files found for {economy} on {date_id}')
-        elif len(latest_file) > 1:
-            print(f'Multiple files found for {economy} on {date_id}')
-            breakpoint()
-            raise ValueError
+        file_paths.append(latest_file)
+    return file_paths
+
+
+def check_outlook_columns(columns, file_path, expected_columns=None):
+    """Check a merged_file_energy file has the column contract: the OUTLOOK_ID_COLUMNS in order, then only year columns. If expected_columns is given the columns must match it exactly (i.e. the same years as the other files)."""
+    columns = list(columns)
+    if columns[:len(OUTLOOK_ID_COLUMNS)] != OUTLOOK_ID_COLUMNS:
+        raise ValueError(f'{file_path} does not start with the columns {OUTLOOK_ID_COLUMNS}, it has {columns[:len(OUTLOOK_ID_COLUMNS)]}')
+    not_years = [col for col in columns[len(OUTLOOK_ID_COLUMNS):] if not re.fullmatch(r'\d{4}', str(col))]
+    if len(not_years) > 0:
+        raise ValueError(f'{file_path} has columns that are not ids or years: {not_years}')
+    if expected_columns is not None and columns != list(expected_columns):
+        raise ValueError(f'{file_path} has different columns to the other files. Missing: {[col for col in expected_columns if col not in columns]}, extra: {[col for col in columns if col not in expected_columns]}')
+
+
+def load_outlook_energy_files(file_paths, max_workers=8, use_cache=True):
+    """Read all the merged_file_energy files (on a thread pool), check them against the column contract and combine them with a single concat.
+
+    Every file must have the same columns as the first one. The id columns are categoricals with the categories of all the files combined, and the year columns are float64. Prints and returns a report of the read time and rows of each file, so slow or bloated inputs are easy to spot. If there are no files it returns an empty df with just the id columns.
+    """
+    if len(file_paths) == 0:
+        print('No outlook files to load')
+        return pd.DataFrame(columns=OUTLOOK_ID_COLUMNS), pd.DataFrame(columns=['file', 'seconds', 'rows', 'mb'])
+    
+    def read_file(file_path):
+        start = time.perf_counter()
+        if use_cache:
+            df = read_outlook_csv_cached(file_path)
         else:
-            latest_file = latest_file[0]
-        
-        all_data = pd.concat([all_data, pd.read_csv(os.path.join('input_data', economy, latest_file))])
+            df = parse_outlook_csv(pd.read_csv(file_path), file_path)
+        return df, time.perf_counter() - start
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(read_file, file_paths))
+    
+    expected_columns = None
+    all_data = []
+    report = []
+    for file_path, (df, seconds) in zip(file_paths, results):
+        check_outlook_columns(df.columns, file_path, expected_columns)
+        expected_columns = list(df.columns)
+        all_data.append(df)
+        report.append({'file': file_path, 'seconds': seconds, 'rows': len(df), 'mb': df.memory_usage(deep=True).sum() / 1e6})
+    
+    #give the categoricals the same categories in every file, otherwise concat turns them back into strings
+    for col in OUTLOOK_ID_COLUMNS:
+        if all(isinstance(df[col].dtype, pd.CategoricalDtype) for df in all_data):
+            categories = pd.api.types.union_categoricals([df[col] for df in all_data]).categories
+            for df in all_data:
+                df[col] = df[col].cat.set_categories(categories)
+    all_data = pd.concat(all_data, ignore_index=True)
+    
+    report = pd.DataFrame(report)
+    print(report.sort_values('seconds', ascending=False).to_string(index=False))
+    print(f'Loaded {len(report)} outlook files, {len(all_data)} rows in {report["seconds"].sum():.2f}s of reads')
+    return all_data, report
+
+
+def concat_all_merged_file_energy_files_from_local(config):
+    all_data, _ = load_outlook_energy_files(find_latest_merged_file_energy_files(config))
     return all_data
 
-def clean_results_for_outlook(projections, apec_aggregate):
+def clean_results_for_outlook(projections, apec_aggregate, scenario_variants=None):
+    """Put the projections and APEC aggregate into the outlook format (long format with the outlook sector and fuel labels and a scenarios column).
+
+    If the projections have a variant column (from projection_functions.project_energy_use_scenarios) each scenario in scenario_variants gets the rows of its variant. Otherwise reference and target both get the same rows.
+    """
+    if scenario_variants is None:
+        scenario_variants = {'reference': 0, 'target': 0}
+    if 'variant' not in projections.columns:
+        projections = projections.assign(variant=0)
+    if 'variant' not in apec_aggregate.columns:
+        apec_aggregate = apec_aggregate.assign(variant=0)
     #use the following labels:
     #     sectors	sub1sectors	sub2sectors	sub3sectors	sub4sectors	fuels	subfuels
     # 16_other_sector	16_01_buildings	x	x	x	17_electricity	x
     #get toal energy use and call it value
     #first metl so that apec_aggregate['data_energy_use'] and apec_aggregate['ai_training_energy_use'] are in the sae column and create a column with their names as ;sub4sectors'
-    apec_aggregate = apec_aggregate.melt(id_vars=['year', 'economy'], value_vars=['traditional_data_energy_use', 'ai_training_energy_use'], var_name='sub4sectors', value_name='value')
-    # apec_aggregate = apec_aggregate.rename(columns={'total_energy_use':'value'})
-    apec_aggregate = apec_aggregate[['year', 'economy','sub4sectors', 'value']]
+    apec_aggregate = apec_aggregate.melt(id_vars=['variant', 'year', 'economy'], value_vars=['traditional_data_energy_use', 'ai_training_energy_use'], var_name='sub4sectors', value_name='value')
     apec_aggregate['economy'] = '00_APEC'
-    apec_aggregate['sectors'] = '16_other_sector'
-    apec_aggregate['sub1sectors'] = '16_01_buildings'
-    apec_aggregate['sub2sectors'] = '16_01_01_commercial_and_public_services'
-    apec_aggregate['sub3sectors'] = '16_01_01_02_data_centres'
-    apec_aggregate['sub4sectors'] = np.where(apec_aggregate['sub4sectors']=='traditional_data_energy_use', '16_01_04_traditional_data_centres', '16_01_03_ai_training')
-    apec_aggregate['fuels'] = '17_electricity'
-    apec_aggregate['subfuels'] = 'x'
-    apec_aggregate['subtotal_layout'] = False
-    apec_aggregate['subtotal_results'] = False
-    
-    #add the reference and target scenarios   
-    apec_aggregate_ref = apec_aggregate.copy()
-    apec_aggregate_tgt = apec_aggregate.copy()
-    apec_aggregate_ref['scenarios'] = 'reference'
-    apec_aggregate_tgt['scenarios'] = 'target'
-    
     #do same for projections
-    projections = projections.melt(id_vars=['year', 'economy'], value_vars=['traditional_data_energy_use', 'ai_training_energy_use'], var_name='sub4sectors', value_name='value')
-    # projections['value'] = projections['data_energy_use'] + projections['ai_training_energy_use']
-    projections = projections[['year', 'economy','sub4sectors', 'value']]
-    projections['sectors'] = '16_other_sector'
-    projections['sub1sectors'] = '16_01_buildings'
-    projections['sub2sectors'] = '16_01_01_commercial_and_public_services'
-    projections['sub3sectors'] = '16_01_01_02_data_centres'
-    projections['sub4sectors'] = np.where(projections['sub4sectors']=='traditional_data_energy_use', '16_01_04_traditional_data_centres', '16_01_03_ai_training')
-    projections['fuels'] = '17_electricity'
-    projections['subfuels'] = 'x'
-    projections['subtotal_layout'] = False
-    projections['subtotal_results'] = False
-    
-    #add the reference and target scenarios   
-    projections_ref = projections.copy()
-    projections_tgt = projections.copy()
-    projections_ref['scenarios'] = 'reference'
-    projections_tgt['scenarios'] = 'target'
-    
-    #combine the dataframes
-    outlook_results = pd.concat([apec_aggregate_ref, apec_aggregate_tgt, projections_ref, projections_tgt])
+    projections = projections.melt(id_vars=['variant', 'year', 'economy'], value_vars=['traditional_data_energy_use', 'ai_training_energy_use'], var_name='sub4sectors', value_name='value')
+    
+    results = pd.concat([apec_aggregate, projections], ignore_index=True)
+    results['sectors'] = '16_other_sector'
+    results['sub1sectors'] = '16_01_buildings'
+    results['sub2sectors'] = '16_01_01_commercial_and_public_services'
+    results['sub3sectors'] = '16_01_01_02_data_centres'
+    results['sub4sectors'] = np.where(results['sub4sectors']=='traditional_data_energy_use', '16_01_04_traditional_data_centres', '16_01_03_ai_training')
+    results['fuels'] = '17_electricity'
+    results['subfuels'] = 'x'
+    results['subtotal_layout'] = False
+    results['subtotal_results'] = False
+    #categorical labels, bool flags and int16 years rather than a python string on every row
+    results = to_compact_outlook_table(results)
+    
+    #take the rows of each scenario's variant, rather than making a copy of the results for each scenario
+    variant = results['variant'].to_numpy()
+    scenario_rows = [np.flatnonzero(variant==scenario_variant) for scenario_variant in scenario_variants.values()]
+    outlook_results = results.iloc[np.concatenate(scenario_rows)].drop(columns='variant').reset_index(drop=True)
+    outlook_results['scenarios'] = pd.Categorical(np.repeat(list(scenario_variants.keys()), [len(rows) for rows in scenario_rows]), categories=list(scenario_variants.keys()))
     
     return outlook_results
     
 
-def aggregate_apec_values(projections, config):
+def aggregate_apec_values(projections, config, apec_bands=None):
+    """Sum the projections to an APEC aggregate and add _lower/_upper confidence interval columns.
+
+    config['confidence_interval_method'] picks how the intervals are made: 'simple' (the default) applies confidence_intervals_percentage_error to the values, 'monte_carlo' uses the percentile bands from projection_functions.project_energy_use_monte_carlo. Pass apec_bands if you have already run it so it isnt run again.
+    
+    If the projections have a variant column (from projection_functions.project_energy_use_scenarios) there is an aggregate for each variant, with a variant column.
+    """
+    if 'variant' in projections.columns:
+        #one aggregate for each scenario variant (see projection_functions.project_energy_use_scenarios). apec_bands can be a dict of {variant: apec_bands}
+        variant_configs, _ = projection_functions.resolve_scenario_variants(config)
+        all_aggregates = []
+        for variant, variant_projections in projections.groupby('variant', sort=True):
+            variant_apec_bands = apec_bands.get(variant) if isinstance(apec_bands, dict) else None
+            variant_aggregate = aggregate_apec_values(variant_projections.drop(columns='variant'), variant_configs[variant], apec_bands=variant_apec_bands)
+            variant_aggregate['variant'] = variant
+            all_aggregates.append(variant_aggregate)
+        return pd.concat(all_aggregates, ignore_index=True)
     
-    confidence_intervals = config['confidence_intervals_percentage_error']
     # Initialize APEC aggregate DataFrame
-    apec_aggregate = projections.groupby('year').sum().reset_index()
+    apec_aggregate = projections.groupby('year').sum(numeric_only=True).reset_index()
     apec_aggregate['economy'] = 'APEC'
     
     # Recalculate intensity for APEC
     apec_aggregate['data_intensity'] = (apec_aggregate['traditional_data_energy_use'] + apec_aggregate['ai_training_energy_use']) / (apec_aggregate['traditional_data_activity'] + apec_aggregate['ai_training_activity'])
     
+    if config.get('confidence_interval_method', 'simple') == 'monte_carlo':
+        if apec_bands is None:
+            _, apec_bands = projection_functions.project_energy_use_monte_carlo(config)
+        apec_aggregate['traditional_data_energy_use'] = apec_aggregate['traditional_data_activity'] * apec_aggregate['data_intensity']
+        apec_aggregate['ai_training_energy_use'] = apec_aggregate['ai_training_activity'] * apec_aggregate['data_intensity']
+        apec_aggregate['total_energy_use'] = apec_aggregate['traditional_data_energy_use'] + apec_aggregate['ai_training_energy_use']
+        #the bands come from the draws themselves, so energy is not just lower activity x lower intensity
+        band_cols = [col for col in apec_bands.columns if col.endswith('_lower') or col.endswith('_upper')]
+        apec_aggregate = apec_aggregate.merge(apec_bands[['year'] + band_cols], on='year', how='left')
+        return apec_aggregate
+    
+    confidence_intervals = config['confidence_intervals_percentage_error']
     def calculate_confidence_interval_simple(metric_values, ci_value):
         # Calculate the confidence interval based on a simple percentage error
         lower = metric_values * (1 - ci_value)
@@ -172,10 +259,67 @@ def aggregate_apec_values(projections, config):
     return apec_aggregate
 
 
-def save_outputs(outlook_results):
+#############################################################
+# Writing the outlook results
+#############################################################
+#The integration team needs csvs, parquet, feather and xlsx can be written alongside them. Each file is written to a temp file and renamed into place, and a hash of what went into each file is kept in output_data/.output_manifest.json so that a rerun (e.g. after a crash part way through) skips the files that are already written with the same data.
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'feather', 'xlsx']
+OUTPUT_MANIFEST_NAME = '.output_manifest.json'
+
+
+def write_outlook_excel(outlook_results, path, chunk_size=5000):
+    """Write the pivoted outlook results to an xlsx with a sheet for APEC and then each economy. It uses openpyxl's write only mode, which streams the rows into the file as they are appended, and the rows are converted chunk_size at a time, so memory doesnt grow with the number of rows."""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    economy_results = dict(tuple(outlook_results.groupby('economy', sort=False, observed=True)))
+    economies = sorted(economy_results.keys(), key=lambda economy: (economy != '00_APEC', economy))
+    header = [str(column) for column in outlook_results.columns]
+    for economy in economies:
+        #sheet names can only be 31 characters
+        sheet = workbook.create_sheet(title=str(economy)[:31])
+        sheet.append(header)
+        results = economy_results[economy]
+        for start in range(0, len(results), chunk_size):
+            chunk = results.iloc[start:start + chunk_size].astype(object)
+            #excel has no nan, so leave those cells empty
+            chunk = chunk.where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def write_table_atomic(df, path, output_format):
+    def write_table(temp_path):
+        if output_format == 'csv':
+            df.to_csv(temp_path, index=False)
+        elif output_format == 'xlsx':
+            write_outlook_excel(df, temp_path)
+        else:
+            #parquet and feather need string column names (the years are ints)
+            table = df.rename(columns=str).reset_index(drop=True)
+            if output_format == 'parquet':
+                table.to_parquet(temp_path, index=False)
+            else:
+                table.to_feather(temp_path)
+    return write_atomic(path, write_table)
+
+
+def save_outputs(outlook_results, formats=('csv',), output_dir='output_data', max_workers=8, resume=True):
+    """Pivot the outlook results so the years are columns and write them as one file for all economies and one for each economy (in output_dir/by_economy), in each of formats (csv, parquet or feather). xlsx is written as one workbook with a sheet for each economy (see write_outlook_excel) rather than a file for each economy.
+
+    The economies are split out in one groupby pass and all the files are written at once on a thread pool. With resume, files whose data hasnt changed since they were last written are skipped. Returns a dict of path -> 'written' or 'skipped'.
+    """
+    formats = list(formats)
+    unknown_formats = [output_format for output_format in formats if output_format not in OUTPUT_FORMATS]
+    if len(unknown_formats) > 0:
+        raise ValueError(f'Unknown output formats {unknown_formats}, expected some of {OUTPUT_FORMATS}')
+    if 'xlsx' in formats and importlib.util.find_spec('openpyxl') is None:
+        print('openpyxl is not installed, so the results were not saved as xlsx (pip install openpyxl)')
+        formats.remove('xlsx')
     #make it so the years are pivoted
-    outlook_results = outlook_results.pivot(index=['scenarios','economy','sectors','sub1sectors','sub2sectors','sub3sectors','sub4sectors','fuels','subfuels','subtotal_layout','subtotal_results'], columns='year', values='value').reset_index()
-    breakpoint()
+    outlook_results = outlook_results.pivot(index=OUTLOOK_ID_COLUMNS, columns='year', values='value').reset_index()
     ###############
     #also, TEMP FIX we are going to change things so the sub2sectr is the sub4sectr, and the sub3sectr and sub4sectr are x
     outlook_results['sub2sectors'] = outlook_results['sub4sectors']
@@ -183,12 +327,50 @@ def save_outputs(outlook_results):
     outlook_results['sub4sectors'] = 'x'
     #we should impelment this at the beginning of the code, but for now we will do it here since there will have to be some thigns changed in the plotting and so on
     ###############
-    #save  outlook energy to csv in output_data
     file_date = datetime.datetime.now().strftime("%Y%m%d")
-    outlook_results.to_csv(os.path.join('output_data', f'data_centres_energy_{file_date}.csv'), index=False)
-    #get the economies
-    economies = outlook_results['economy'].unique()
-    for economy in economies:
-        economy_results = outlook_results.loc[outlook_results['economy']==economy].copy()
-        # economy_results = economy_results.drop(columns='economy')
-        economy_results.to_csv(os.path.join('output_data', 'by_economy', f'data_centres_energy_{economy}_{file_date}.csv'), index=False)
\ No newline at end of file
+    os.makedirs(os.path.join(output_dir, 'by_economy'), exist_ok=True)
+    #the combined file, then each economy's rows from one pass over the economies
+    tables = [(f'data_centres_energy_{file_date}', outlook_results)]
+    for economy, economy_results in outlook_results.groupby('economy', sort=False, observed=True):
+        tables.append((os.path.join('by_economy', f'data_centres_energy_{economy}_{file_date}'), economy_results))
+    
+    manifest_path = os.path.join(output_dir, OUTPUT_MANIFEST_NAME)
+    manifest = {}
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    
+    status = {}
+    writes = []
+    for name, table in tables:
+        table_hash = hashlib.sha256(pd.util.hash_pandas_object(table, index=False).values.tobytes() + str(list(table.columns)).encode()).hexdigest()
+        for output_format in formats:
+            if output_format == 'xlsx' and table is not outlook_results:
+                continue
+            path = os.path.join(output_dir, f'{name}.{output_format}')
+            if manifest.get(path) == table_hash and os.path.exists(path):
+                status[path] = 'skipped'
+            else:
+                writes.append((path, table, output_format, table_hash))
+    
+    #save the manifest even if a write fails, so the files that were done are skipped next time
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(write_table_atomic, table, path, output_format): (path, table_hash) for path, table, output_format, table_hash in writes}
+            for future, (path, table_hash) in futures.items():
+                try:
+                    future.result()
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                manifest[path] = table_hash
+                status[path] = 'written'
+    finally:
+        with open(manifest_path, 'w') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+    if len(errors) > 0:
+        raise errors[0]
+    
+    print(f"Saved the outlook results to {output_dir} as {', '.join(formats)}: {list(status.values()).count('written')} files written, {list(status.values()).count('skipped')} unchanged")
+    return status
@@ -0,0 +1,198 @@
+#%%
+import os
+import copy
+import argparse
+import yaml
+import numpy as np
+import pandas as pd
+
+import projection_functions as projection_functions
+import synthetic_inputs as synthetic_inputs
+from utility_functions import find_project_root
+
+#############################################################
+# Check the projection engines and kernel backends agree
+#############################################################
+#reference_project_energy_use below is the reference. It is the original per-row loop from before the engines were added, scanning the entry lists and converting units itself, so it shares no code with projection_functions.py and a bug in compile_economy_schedule cant hide in both sides. Every engine (pandas included), and the batched engine with each kernel backend that is installed (see KERNEL_BACKENDS in projection_functions.py), is run on the same config and has to match it to within rtol/atol in every column. This is done for parameters.yml and for random synthetic configs from synthetic_inputs.py, which cover all the units, dense and sparse builds and rate changes. The monte carlo bands are also compared between the backends, since they use the same draws. Run it as its own script after changing the projection or a backend, e.g.
+#   python code/engine_equivalence.py --random-configs 20 --economies 30
+#It raises a ValueError listing what didnt match. tests/test_engine_equivalence.py runs check_config on parameters.yml and a few seeds of each density under pytest, so python -m pytest tests catches a regression without running this by hand.
+
+EQUIVALENCE_RTOL = 1e-9
+EQUIVALENCE_ATOL = 1e-9
+
+
+def entry_energy_to_pj(entry, key_start, units):
+    """Convert the first of {key_start}_{unit} found in entry to PJ, checking the units in the order given (the initial energy and the scheduled builds check them in different orders)."""
+    for unit in units:
+        key = f'{key_start}_{unit}'
+        if key in entry.keys():
+            if unit == 'pj':
+                return entry[key]
+            elif unit == 'mw':
+                return ((entry[key] * 8760) * 3.6) * 1e-6
+            elif unit == 'mwh':
+                return (entry[key] * 3.6) * 1e-6
+            elif unit == 'twh':
+                return entry[key] * 3.6
+    return None
+
+
+def reference_project_energy_use(config):
+    """The original year by year df.loc projection, kept independent of projection_functions.py so the engines can be checked against it. Slow, so only use it for checks."""
+    start_year = config['start_year']
+    end_year = config['end_year']
+    all_projections = []
+
+    for econ_entry in config['economies']:
+        initial_traditional_data_energy_pj = entry_energy_to_pj(econ_entry, 'initial_traditional_data_energy', ('pj', 'mw', 'mwh', 'twh'))
+        if initial_traditional_data_energy_pj is None:
+            raise ValueError('Initial traditional_data energy not specified')
+        initial_ai_training_energy_pj = entry_energy_to_pj(econ_entry, 'initial_ai_training_energy', ('pj', 'mw', 'mwh', 'twh'))
+        if initial_ai_training_energy_pj is None:
+            raise ValueError('Initial ai_training energy not specified')
+
+        years = np.arange(start_year, end_year + 1)
+        df = pd.DataFrame(index=years)
+        df['year'] = years
+        df['economy'] = econ_entry['name']
+        #float columns, since pandas wont upcast an int column when a float is set into it
+        df['data_growth_rate'] = float(econ_entry['initial_data_activity_growth_rate'])
+        df['data_intensity_improvement_rate'] = float(econ_entry['initial_data_intensity_improvement_rate'])
+        df['traditional_data_to_ai_training_ratio'] = float(econ_entry['initial_traditional_data_to_ai_training_ratio'])
+        #step changes apply from their year onwards, in the order they are listed
+        for new_rate in econ_entry.get('new_activity_growth_rates', []):
+            if new_rate['year'] in years:
+                if 'new_data_growth_rate' in new_rate.keys():
+                    df.loc[new_rate['year']:, 'data_growth_rate'] = new_rate['new_data_growth_rate']
+                if 'new_traditional_data_to_ai_training_ratio' in new_rate.keys():
+                    df.loc[new_rate['year']:, 'traditional_data_to_ai_training_ratio'] = new_rate['new_traditional_data_to_ai_training_ratio']
+        for new_rate in econ_entry.get('new_intensity_improvement_rates', []):
+            if new_rate['year'] in years:
+                df.loc[new_rate['year']:, 'data_intensity_improvement_rate'] = new_rate['new_data_intensity_improvement_rate']
+        df['traditional_data_activity'] = float(initial_traditional_data_energy_pj)
+        df['ai_training_activity'] = float(initial_ai_training_energy_pj)
+        df['data_intensity'] = 1.0
+
+        for year in range(start_year + 1, end_year + 1):
+            prev_year = year - 1
+            scheduled_build_found = False
+            data_growth_rate = df.loc[year, 'data_growth_rate']
+            df.loc[year, 'data_intensity'] = df.loc[prev_year, 'data_intensity'] * (1 - df.loc[year, 'data_intensity_improvement_rate'])
+            df.loc[year, 'traditional_data_activity'] = df.loc[prev_year, 'traditional_data_activity']
+            df.loc[year, 'ai_training_activity'] = df.loc[prev_year, 'ai_training_activity']
+            #scan every build each year, like the original did
+            for build in econ_entry.get('scheduled_builds', []):
+                if build['year'] == year:
+                    scheduled_build_found = True
+                    if 'new_traditional_data_to_ai_training_ratio' in build.keys():
+                        df.loc[year, 'traditional_data_to_ai_training_ratio'] = build['new_traditional_data_to_ai_training_ratio']
+                    else:
+                        df.loc[year, 'traditional_data_to_ai_training_ratio'] = df.loc[prev_year, 'traditional_data_to_ai_training_ratio']
+                    total_energy = entry_energy_to_pj(build, 'additional_energy', ('mw', 'pj', 'mwh', 'twh'))
+                    if total_energy is None:
+                        raise ValueError('Additional energy not specified')
+                    df.loc[year, 'traditional_data_activity'] += total_energy * df.loc[year, 'traditional_data_to_ai_training_ratio'] / df.loc[year, 'data_intensity']
+                    df.loc[year, 'ai_training_activity'] += total_energy * (1 - df.loc[year, 'traditional_data_to_ai_training_ratio']) / df.loc[year, 'data_intensity']
+            if not scheduled_build_found:
+                #the ai training growth uses the traditional data activity after it has grown this year, as the original did
+                df.loc[year, 'traditional_data_activity'] += (df.loc[year, 'traditional_data_activity'] + df.loc[year, 'ai_training_activity']) * data_growth_rate * df.loc[year, 'traditional_data_to_ai_training_ratio']
+                df.loc[year, 'ai_training_activity'] += (df.loc[year, 'traditional_data_activity'] + df.loc[year, 'ai_training_activity']) * data_growth_rate * (1 - df.loc[year, 'traditional_data_to_ai_training_ratio'])
+
+        df['traditional_data_energy_use'] = df['traditional_data_activity'] * df['data_intensity']
+        df['ai_training_energy_use'] = df['ai_training_activity'] * df['data_intensity']
+        df['traditional_data_activity_indexed'] = df['traditional_data_activity'] / df['traditional_data_activity'].iloc[1] * 100
+        df['ai_training_activity_indexed'] = df['ai_training_activity'] / df['ai_training_activity'].iloc[1] * 100
+        all_projections.append(df)
+
+    return pd.concat(all_projections)
+
+
+def compare_tables(reference, other, rtol=EQUIVALENCE_RTOL, atol=EQUIVALENCE_ATOL):
+    """Compare two projection dfs. Returns (whether they match, the largest relative difference in the numeric columns). The non numeric columns and the NaN/inf positions have to be exactly the same."""
+    if list(reference.columns) != list(other.columns) or len(reference) != len(other):
+        return False, np.inf
+    max_difference = 0.0
+    for column in reference.columns:
+        reference_values = reference[column].to_numpy()
+        other_values = other[column].to_numpy()
+        if not pd.api.types.is_numeric_dtype(reference[column]):
+            if not (reference_values.astype(str) == other_values.astype(str)).all():
+                return False, np.inf
+            continue
+        reference_values = reference_values.astype(float)
+        other_values = other_values.astype(float)
+        if not np.isclose(other_values, reference_values, rtol=rtol, atol=atol, equal_nan=True).all():
+            return False, np.inf
+        finite = np.isfinite(reference_values) & np.isfinite(other_values)
+        if finite.any():
+            differences = np.abs(other_values[finite] - reference_values[finite]) / np.maximum(np.abs(reference_values[finite]), atol)
+            max_difference = max(max_difference, float(differences.max()))
+    return True, max_difference
+
+
+def check_config(config, config_name, rtol=EQUIVALENCE_RTOL, atol=EQUIVALENCE_ATOL, monte_carlo_draws=200):
+    """Run every engine and installed backend on config and compare them to reference_project_energy_use. Returns a list of result dicts."""
+    config = copy.deepcopy(config)
+    config.pop('kernel_backend', None)
+    reference = reference_project_energy_use(config)
+    candidates = [('pandas', None), ('numpy', None)] + [('batched', backend) for backend in projection_functions.available_kernel_backends()]
+    results = []
+    for engine, backend in candidates:
+        candidate_config = config if backend is None else {**config, 'kernel_backend': backend}
+        matches, max_difference = compare_tables(reference, projection_functions.project_energy_use(candidate_config, engine=engine), rtol, atol)
+        results.append({'config': config_name, 'economies': len(config['economies']), 'check': 'project_energy_use', 'engine': engine, 'backend': backend or '', 'reference': 'per_row_loop', 'matches': matches, 'max_relative_difference': max_difference})
+
+    #the monte carlo only runs through the batched kernel, so compare the other backends to numpy
+    if monte_carlo_draws and 'monte_carlo' in config:
+        config['monte_carlo'] = {**config['monte_carlo'], 'n_draws': monte_carlo_draws, 'chunk_size': min(monte_carlo_draws, config['monte_carlo'].get('chunk_size', 500))}
+        reference_bands = projection_functions.project_energy_use_monte_carlo({**config, 'kernel_backend': 'numpy'})
+        for backend in projection_functions.available_kernel_backends():
+            if backend == 'numpy':
+                continue
+            bands = projection_functions.project_energy_use_monte_carlo({**config, 'kernel_backend': backend})
+            #the economy bands are float32, so they get a looser tolerance
+            economy_matches, economy_difference = compare_tables(reference_bands[0], bands[0], rtol=1e-6, atol=1e-6)
+            apec_matches, apec_difference = compare_tables(reference_bands[1], bands[1], rtol, atol)
+            results.append({'config': config_name, 'economies': len(config['economies']), 'check': 'project_energy_use_monte_carlo', 'engine': 'batched', 'backend': backend, 'reference': 'numpy', 'matches': economy_matches and apec_matches, 'max_relative_difference': max(economy_difference, apec_difference)})
+    return results
+
+
+def run_equivalence_checks(config=None, n_random_configs=10, n_economies=20, seed=0, rtol=EQUIVALENCE_RTOL, atol=EQUIVALENCE_ATOL, monte_carlo_draws=200):
+    """Check config (if given) and n_random_configs synthetic configs, cycling through the build densities and end years. Prints the results and raises a ValueError if anything doesnt match."""
+    print(f'Kernel backends installed: {projection_functions.available_kernel_backends()}')
+    results = []
+    if config is not None:
+        results.extend(check_config(config, 'parameters.yml', rtol, atol, monte_carlo_draws))
+    densities = [density for density in synthetic_inputs.SYNTHETIC_DENSITIES.keys()]
+    end_years = [2070, 2100, 2150]
+    for case in range(n_random_configs):
+        density = densities[case % len(densities)]
+        random_config = synthetic_inputs.generate_synthetic_config(n_economies, seed=seed + case, density=density, base_config=config, end_year=end_years[case % len(end_years)])
+        results.extend(check_config(random_config, f'synthetic_{density}_seed{seed + case}', rtol, atol, monte_carlo_draws))
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+    failures = results.loc[~results['matches']]
+    if len(failures) > 0:
+        raise ValueError(f"{len(failures)} engine/backend checks didnt match their reference:\n{failures.to_string(index=False)}")
+    print(f'All {len(results)} checks matched to rtol={rtol}, atol={atol}')
+    return results
+
+
+#%%
+if __name__ == '__main__':
+    # Change directory to the root of the project (the folder with config/parameters.yml)
+    os.chdir(find_project_root())
+
+    parser = argparse.ArgumentParser(description='Check every projection engine and kernel backend matches the original per-row projection')
+    parser.add_argument('--random-configs', type=int, default=10, help='number of synthetic configs to check as well as parameters.yml')
+    parser.add_argument('--economies', type=int, default=20, help='economies in each synthetic config')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rtol', type=float, default=EQUIVALENCE_RTOL)
+    parser.add_argument('--atol', type=float, default=EQUIVALENCE_ATOL)
+    parser.add_argument('--monte-carlo-draws', type=int, default=200, help='draws for the monte carlo comparison, 0 to skip it')
+    args = parser.parse_args()
+
+    with open('config/parameters.yml', 'r') as file:
+        config = yaml.safe_load(file)
+    run_equivalence_checks(config, n_random_configs=args.random_configs, n_economies=args.economies, seed=args.seed, rtol=args.rtol, atol=args.atol, monte_carlo_draws=args.monte_carlo_draws)
+#%%
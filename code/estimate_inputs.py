@@ -5,13 +5,10 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
-import plotly.graph_objects as go
-import plotly.express as px
 
-# Change directory to the root of the project 'data-centres'
-root_dir = re.split('data-centres', os.getcwd())[0] + '/data-centres'
-os.chdir(root_dir)
+# Change directory to the root of the project (the folder with config/parameters.yml)
+from utility_functions import find_project_root
+os.chdir(find_project_root())
 
 # Economies that should remain unchanged in the YAML file
 ECONOMIES_TO_KEEP_AS_IS = ['12_NZ', '18_CT', '09_ROK', '06_HKC', '10_MAS', '20_USA', '07_INA', '01_AUS']
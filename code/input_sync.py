@@ -0,0 +1,93 @@
+import os
+import time
+import shutil
+import hashlib
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from utility_functions import DatedFileCatalog, write_atomic
+
+#############################################################
+# Sync the merged_file_energy inputs from the integration folders
+#############################################################
+#The source root is where each economy's integration folder is (e.g. the OneDrive outlook 9th\Modelling\Integration folder). It can be any local folder, so a test folder can stand in for OneDrive. Set it with input_sync: source_root: in parameters.yml or pass it in.
+
+DEFAULT_SOURCE_ROOT = os.path.join('C:\\', 'Users', 'finbar.maunsell', 'OneDrive - APERC', 'outlook 9th', 'Modelling', 'Integration')
+DEFAULT_SOURCE_SUBFOLDER = '08_Final'
+DEFAULT_KNOWN_DOUBLE_UPS = ['merged_file_energy_10_MAS_20240905_TGT1.csv']
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def files_match(source_path, local_path):
+    """True if local_path exists and has the same size and contents as source_path. The size is checked first so the files are only hashed when they could be the same."""
+    if not os.path.exists(local_path):
+        return False
+    if os.path.getsize(source_path) != os.path.getsize(local_path):
+        return False
+    return file_sha256(source_path) == file_sha256(local_path)
+
+
+def copy_file_atomic(source_path, local_path):
+    """Copy to a temp file in the destination folder and then rename it into place, so a cancelled copy never leaves a half written file with the real name."""
+    write_atomic(local_path, lambda temp_path: shutil.copyfile(source_path, temp_path))
+
+
+def sync_economy_file(economy, source_path, local_root, file_name_start):
+    """Bring input_data/{economy} up to date with source_path. Returns a row for the manifest."""
+    start = time.perf_counter()
+    local_folder = os.path.join(local_root, economy)
+    if not os.path.exists(local_folder):
+        os.makedirs(local_folder, exist_ok=True)
+    csv = os.path.basename(source_path)
+    local_path = os.path.join(local_folder, csv)
+    if files_match(source_path, local_path):
+        action = 'skipped'
+    else:
+        copy_file_atomic(source_path, local_path)
+        action = 'copied'
+    #only keep the latest file for the economy in the local folder
+    for file in os.listdir(local_folder):
+        if file.startswith(f'{file_name_start}_{economy}') and file != csv:
+            os.remove(os.path.join(local_folder, file))
+    return {'economy': economy, 'file': csv, 'action': action, 'mb': os.path.getsize(local_path) / 1e6, 'seconds': time.perf_counter() - start}
+
+
+def sync_merged_file_energy_inputs(config, source_root=None, local_root='input_data', file_name_start='merged_file_energy', max_workers=8):
+    """Copy the latest merged_file_energy csv for each economy in config['economies_list'] from {source_root}/{economy}/{source_subfolder} into {local_root}/{economy}.
+
+    Files that are already there with the same size and hash are skipped, the rest are copied on a thread pool through temp files. Prints and returns a manifest of what was done for each economy.
+    """
+    sync_config = config.get('input_sync', {})
+    if source_root is None:
+        source_root = sync_config.get('source_root', DEFAULT_SOURCE_ROOT)
+    source_subfolder = sync_config.get('source_subfolder', DEFAULT_SOURCE_SUBFOLDER)
+    known_double_ups = sync_config.get('known_double_ups', DEFAULT_KNOWN_DOUBLE_UPS)
+
+    source_folders = {economy: os.path.join(source_root, economy, source_subfolder) for economy in config['economies_list']}
+    catalog = DatedFileCatalog(list(source_folders.values()))
+
+    manifest = []
+    tasks = []
+    for economy, source_folder in source_folders.items():
+        #raises a ValueError if there are multiple files on the latest date that arent in known_double_ups
+        source_path = catalog.latest_file(file_name_start, economy, extension='.csv', folder=source_folder, known_double_ups=known_double_ups)
+        if source_path is None:
+            manifest.append({'economy': economy, 'file': None, 'action': 'not found', 'mb': 0.0, 'seconds': 0.0})
+        else:
+            tasks.append((economy, source_path))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(sync_economy_file, economy, source_path, local_root, file_name_start) for economy, source_path in tasks]
+        manifest.extend(future.result() for future in futures)
+
+    manifest = pd.DataFrame(manifest).sort_values('economy').reset_index(drop=True)
+    print(manifest.to_string(index=False))
+    print(f"Synced from {source_root}: {(manifest['action'] == 'copied').sum()} copied, {(manifest['action'] == 'skipped').sum()} already up to date, {(manifest['action'] == 'not found').sum()} not found")
+    return manifest
@@ -0,0 +1,258 @@
+import datetime as datetime
+import os
+import sys
+import io
+import json
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import importlib.util
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+#############################################################
+# Stage timings and memory for the main.py pipeline
+#############################################################
+#main.py runs each of its stages through run_stage (or a with stage(...) block), and instrument_functions wraps the main functions in projection_functions, data_processing, plotting and dashboard, so a run records the wall time, cpu time, peak RSS and rows of every stage and every call to those functions. finish_trace saves them to output_data/traces/trace_{date}.json and prints a summary table.
+#
+#Peak RSS is reset at the start of each top level stage where the os allows it (linux), so a stage's peak is its own. For the functions inside a stage it is the peak since the stage started. Where it cant be reset it is the peak of the whole run so far. cpu_seconds is this process only, child_cpu_seconds is the process pools the stage waited on (linux and mac).
+#
+#Only the main thread records the functions it calls. Some instrumented functions (e.g. write_outlook_excel in save_outputs) also run inside thread pools. Their calls there arent recorded on their own, their time is part of the function or stage that waited on the pool. Each thread has its own stack of open stages, so a stage opened on another thread can never be taken as the parent of one on the main thread.
+#
+#If a profile_stage is given to start_trace, that stage (or function) is also run under cProfile or tracemalloc (profile_mode) and its hot spots are printed and saved next to the trace.
+
+TRACE_OUTPUT_DIR = os.path.join('output_data', 'traces')
+PROFILE_MODES = ['cprofile', 'tracemalloc']
+PROFILE_TOP_N = 30
+#the functions instrument_functions wraps by default. Only the ones called once or a few times per run, so the trace stays small
+INSTRUMENTED_FUNCTIONS = {
+    'projection_functions': ['project_energy_use_scenarios', 'project_energy_use_cached', 'project_energy_use', 'project_energy_use_batched', 'project_energy_use_numpy', 'project_energy_use_pandas', 'project_energy_use_monte_carlo', 'resolve_scenario_variants'],
+    'data_processing': ['aggregate_apec_values', 'clean_results_for_outlook', 'find_latest_merged_file_energy_files', 'load_outlook_energy_files', 'save_outputs', 'write_outlook_excel'],
+    'plotting': ['plot_projections', 'plot_apec_aggregate', 'import_and_compare_to_outlook_results', 'filter_and_melt_outlook_energy', 'build_outlook_comparison', 'economy_dashboard_specs', 'render_figures', 'export_static_images'],
+    'dashboard': ['export_dashboard'],
+}
+
+#the trace of the current run, see start_trace
+_trace = {'records': [], 'next_index': 0, 'profile_stage': None, 'profile_mode': 'cprofile', 'output_dir': TRACE_OUTPUT_DIR, 'started': None}
+#the names of the stages open on each thread, innermost last
+_stacks = threading.local()
+_index_lock = threading.Lock()
+
+
+def stage_stack():
+    if not hasattr(_stacks, 'names'):
+        _stacks.names = []
+    return _stacks.names
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process so the next read is the peak from now on. Only linux allows this, returns whether it worked."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_rss_mb():
+    """Returns (current RSS, peak RSS) of this process in MB. Either can be None if the os doesnt give it."""
+    if os.path.exists('/proc/self/status'):
+        values = {}
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:') or line.startswith('VmHWM:'):
+                    values[line.split(':')[0]] = int(line.split()[1]) / 1024
+        return values.get('VmRSS'), values.get('VmHWM')
+    if importlib.util.find_spec('psutil') is not None:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        #peak_wset is windows only
+        peak_wset = getattr(memory_info, 'peak_wset', None)
+        return memory_info.rss / 1e6, peak_wset / 1e6 if peak_wset is not None else None
+    try:
+        import resource
+        #ru_maxrss is in bytes on mac and KB everywhere else
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, peak / 1e6 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return None, None
+
+
+def child_cpu_seconds():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def count_rows(result):
+    """Rows in a df, or in all the dfs in a tuple. For a dict (e.g. of figures) it is the number of items."""
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, tuple):
+        counts = [count_rows(item) for item in result]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if len(counts) > 0 else None
+    if isinstance(result, dict):
+        return len(result)
+    return None
+
+
+def start_trace(profile_stage=None, profile_mode='cprofile', output_dir=TRACE_OUTPUT_DIR):
+    """Start a new trace, dropping any records from before. profile_stage is the name of a stage or instrumented function to profile with profile_mode (cprofile or tracemalloc)."""
+    if profile_mode not in PROFILE_MODES:
+        raise ValueError(f'profile_mode must be one of {PROFILE_MODES}, not {profile_mode}')
+    stage_stack().clear()
+    _trace.update({'records': [], 'next_index': 0, 'profile_stage': profile_stage, 'profile_mode': profile_mode, 'output_dir': output_dir, 'started': datetime.datetime.now()})
+
+
+def save_profile(name, profiler=None, snapshot=None):
+    """Print the top PROFILE_TOP_N hot spots of a profiled stage and save them (and the cProfile stats) to the trace folder."""
+    os.makedirs(_trace['output_dir'], exist_ok=True)
+    file_start = os.path.join(_trace['output_dir'], f"profile_{name}_{(_trace['started'] or datetime.datetime.now()).strftime('%Y%m%d_%H%M%S')}")
+    if profiler is not None:
+        profiler.dump_stats(file_start + '.prof')
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+        text = text.getvalue()
+    else:
+        lines = [f'Top {PROFILE_TOP_N} lines by memory allocated during {name} and still held at its end:']
+        for statistic in snapshot.statistics('lineno')[:PROFILE_TOP_N]:
+            lines.append(str(statistic))
+        text = '\n'.join(lines) + '\n'
+    with open(file_start + '.txt', 'w') as file:
+        file.write(text)
+    print(text)
+    print(f'Saved the {name} profile to {file_start}.txt')
+
+
+@contextmanager
+def stage(name, kind='stage'):
+    """Record the time, cpu time, memory and rows of the code in the with block. Set rows on the dict it yields to record the rows (run_stage does this from the result)."""
+    stack = stage_stack()
+    depth = len(stack)
+    with _index_lock:
+        index = _trace['next_index']
+        _trace['next_index'] += 1
+    record = {'index': index, 'name': name, 'kind': kind, 'parent': stack[-1] if depth > 0 else None, 'depth': depth, 'rows': None}
+    stack.append(name)
+    if depth == 0:
+        record['peak_rss_reset'] = reset_peak_rss()
+    record['rss_start_mb'], _ = read_rss_mb()
+    profiler = None
+    profile_this = name == _trace['profile_stage'] and not any(parent == name for parent in stack[:-1])
+    if profile_this and _trace['profile_mode'] == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile_this:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    child_cpu_start = child_cpu_seconds()
+    try:
+        yield record
+    except Exception as error:
+        record['error'] = repr(error)
+        raise
+    finally:
+        record['wall_seconds'] = time.perf_counter() - wall_start
+        record['cpu_seconds'] = time.process_time() - cpu_start
+        record['child_cpu_seconds'] = child_cpu_seconds() - child_cpu_start
+        record['rss_end_mb'], record['peak_rss_mb'] = read_rss_mb()
+        if profiler is not None:
+            profiler.disable()
+            save_profile(name, profiler=profiler)
+        elif profile_this:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record['tracemalloc_peak_mb'] = peak_bytes / 1e6
+            save_profile(name, snapshot=snapshot)
+        stack.pop()
+        _trace['records'].append(record)
+
+
+def run_stage(name, function, *args, **kwargs):
+    """Run function(*args, **kwargs) as a stage called name and return what it returns."""
+    with stage(name) as record:
+        result = function(*args, **kwargs)
+        record['rows'] = count_rows(result)
+    return result
+
+
+def instrument_function(function, name=None):
+    """Wrap function so each call is recorded as a function inside the current stage."""
+    name = name or function.__name__
+
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        #calls from worker threads are part of whatever the main thread is waiting on
+        if threading.current_thread() is not threading.main_thread():
+            return function(*args, **kwargs)
+        with stage(name, kind='function') as record:
+            result = function(*args, **kwargs)
+            record['rows'] = count_rows(result)
+        return result
+    instrumented.__wrapped_for_trace__ = True
+    return instrumented
+
+
+def instrument_functions(modules, function_names=None):
+    """Replace the functions in each module (a dict of module name -> module) with instrumented ones. The other functions in a module look them up through the module too, so their calls are recorded as well. function_names defaults to INSTRUMENTED_FUNCTIONS, and running it twice doesnt wrap anything twice."""
+    if function_names is None:
+        function_names = INSTRUMENTED_FUNCTIONS
+    for module_name, names in function_names.items():
+        if module_name not in modules:
+            continue
+        module = modules[module_name]
+        for name in names:
+            function = getattr(module, name, None)
+            if function is None:
+                raise ValueError(f'{module_name} has no function {name} to instrument')
+            if not getattr(function, '__wrapped_for_trace__', False):
+                setattr(module, name, instrument_function(function))
+
+
+def trace_summary(records=None):
+    """One row per stage or function name (and parent): calls, total wall and cpu seconds, the highest peak RSS and total rows. The rows are in the order they first started, so each stage is followed by the functions inside it."""
+    if records is None:
+        records = _trace['records']
+    columns = ['name', 'kind', 'parent', 'depth', 'calls', 'wall_seconds', 'cpu_seconds', 'child_cpu_seconds', 'peak_rss_mb', 'rows']
+    if len(records) == 0:
+        return pd.DataFrame(columns=columns)
+    records = pd.DataFrame(records)
+    records['parent'] = records['parent'].fillna('')
+    summary = records.groupby(['name', 'kind', 'parent', 'depth'], sort=False).agg(
+        index=('index', 'min'), calls=('name', 'size'), wall_seconds=('wall_seconds', 'sum'), cpu_seconds=('cpu_seconds', 'sum'), child_cpu_seconds=('child_cpu_seconds', 'sum'), peak_rss_mb=('peak_rss_mb', 'max'),
+        rows=('rows', lambda rows: pd.to_numeric(rows).sum(min_count=1))).reset_index()
+    return summary.sort_values('index')[columns].reset_index(drop=True)
+
+
+def finish_trace(path=None):
+    """Save the records of the current trace as json (to output_data/traces/trace_{date}.json by default), print the summary table and return it."""
+    summary = trace_summary()
+    started = _trace['started'] or datetime.datetime.now()
+    if path is None:
+        os.makedirs(_trace['output_dir'], exist_ok=True)
+        path = os.path.join(_trace['output_dir'], f"trace_{started.strftime('%Y%m%d_%H%M%S')}.json")
+    trace = {
+        'started': started.isoformat(timespec='seconds'),
+        'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+        'profile_stage': _trace['profile_stage'],
+        'profile_mode': _trace['profile_mode'] if _trace['profile_stage'] is not None else None,
+        'pid': os.getpid(),
+        'records': _trace['records'],
+    }
+    with open(path, 'w') as file:
+        json.dump(trace, file, indent=1, default=str)
+    #the top level stages dont overlap, so their times add up to the run
+    stages = summary.loc[summary['depth']==0]
+    #indent the names under their stage
+    names = [('  ' * depth) + name for name, depth in zip(summary['name'], summary['depth'])]
+    width = max(len(name) for name in names) if len(names) > 0 else 0
+    printed = summary.assign(name=[name.ljust(width) for name in names], rows=summary['rows'].astype('Int64')).drop(columns=['parent', 'depth'])
+    print(printed.to_string(index=False, justify='left', float_format=lambda value: f'{value:.3f}'))
+    print(f"Total of the stages: {stages['wall_seconds'].sum():.2f}s wall, {stages['cpu_seconds'].sum():.2f}s cpu. Saved the trace to {path}")
+    return summary
@@ -6,16 +6,15 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
-import plotly.graph_objects as go
-import plotly.express as px
 import shutil
-# Change directory to the root of the project 'data-centres'
-root_dir = re.split('data-centres', os.getcwd())[0] + '/data-centres'
-os.chdir(root_dir)
+# Change directory to the root of the project (the folder with config/parameters.yml)
+from utility_functions import find_project_root
+os.chdir(find_project_root())
 import plotting as plotting
+import dashboard as dashboard
+import instrumentation as instrumentation
 import data_processing as data_processing
-from utility_functions import get_latest_date_for_data_file
+from utility_functions import get_latest_date_for_data_file, DatedFileCatalog
 import projection_functions as projection_functions
 
 #%%
@@ -26,31 +25,53 @@ import projection_functions as projection_functions
 with open('config/parameters.yml', 'r') as file:
     config = yaml.safe_load(file)
 
+#record the time, cpu time, peak memory and rows of each stage and of the main functions inside them, saved to output_data/traces at the end. trace: in parameters.yml can also profile one stage
+instrumentation.instrument_functions({'projection_functions': projection_functions, 'data_processing': data_processing, 'plotting': plotting, 'dashboard': dashboard})
+instrumentation.start_trace(**(config.get('trace') or {}))
+
 #MAIN FUNCTION
-projections = projection_functions.project_energy_use(config)
+#all the scenarios in parameters.yml are projected in one pass (scenarios with identical parameters only once). Only economies whose entry has changed are recomputed, the rest come from output_data/.cache
+projections, scenario_variants = instrumentation.run_stage('projection', projection_functions.project_energy_use_scenarios, config, cache_dir=os.path.join('output_data', '.cache'))
 #MAIN FUNCTION
 #%%
-plotting.plot_projections(projections)
-apec_aggregate = data_processing.aggregate_apec_values(projections, config)
-plotting.plot_apec_aggregate(apec_aggregate)
-outlook_results = data_processing.clean_results_for_outlook(projections, apec_aggregate)
-
-file_date_id = get_latest_date_for_data_file('input_data', 'merged_file_energy_00_APEC_', file_name_end='.csv', EXCLUDE_DATE_STR_START=False)
-outlook_energy_APEC = pd.read_csv(os.path.join('input_data', f'merged_file_energy_00_APEC_{file_date_id}.csv'))#this file can be found in Modelling\Integration\APEC\01_FinalEBT
+#the projection plots are of the first scenario
+projection_figures = instrumentation.run_stage('plot_projections', plotting.plot_projections, projections.loc[projections['variant']==0].drop(columns='variant'))
+apec_bands = None
+if config.get('confidence_interval_method', 'simple') == 'monte_carlo':
+    #percentile bands for each economy and APEC from sampling the distributions in parameters.yml, for each scenario variant
+    with instrumentation.stage('monte_carlo'):
+        variant_configs, _ = projection_functions.resolve_scenario_variants(config)
+        apec_bands = {}
+        for variant, variant_config in enumerate(variant_configs):
+            economy_bands, apec_bands[variant] = projection_functions.project_energy_use_monte_carlo(variant_config)
+            economy_bands['scenarios'] = ', '.join(scenario for scenario, scenario_variant in scenario_variants.items() if scenario_variant==variant)
+            economy_bands.to_csv(os.path.join('output_data', f'data_centres_energy_bands_by_economy_variant{variant}_{datetime.datetime.now().strftime("%Y%m%d")}.csv'), index=False)
+apec_aggregate = instrumentation.run_stage('aggregation', data_processing.aggregate_apec_values, projections, config, apec_bands=apec_bands)
+apec_figures = instrumentation.run_stage('plot_apec_aggregate', plotting.plot_apec_aggregate, apec_aggregate.loc[apec_aggregate['variant']==0])
+outlook_results = instrumentation.run_stage('outlook_cleaning', data_processing.clean_results_for_outlook, projections, apec_aggregate, scenario_variants)
 
 DO_THIS=False
 if DO_THIS:
-    data_processing.download_all_merged_file_energy_from_economys_from_onedrive(config)
-    
-outlook_energy_all_economies = data_processing.concat_all_merged_file_energy_files_from_local(config) 
+    instrumentation.run_stage('input_sync', data_processing.download_all_merged_file_energy_from_economys_from_onedrive, config)
 
-if outlook_energy_all_economies.columns.to_list() == outlook_energy_APEC.columns.to_list():
-    outlook_energy_all_economies = pd.concat([outlook_energy_APEC, outlook_energy_all_economies])#assuming the structure is the same
-else:
-    raise ValueError
-plotting.import_and_compare_to_outlook_results(outlook_results, outlook_energy_all_economies)
+file_date_id = get_latest_date_for_data_file('input_data', 'merged_file_energy_00_APEC_', file_name_end='.csv', EXCLUDE_DATE_STR_START=False)
+outlook_energy_APEC_path = os.path.join('input_data', f'merged_file_energy_00_APEC_{file_date_id}.csv')#this file can be found in Modelling\Integration\APEC\01_FinalEBT
+#load the APEC file and every economy's file in one go. Their columns are checked against each other before they are combined
+with instrumentation.stage('input_loading') as record:
+    input_data_catalog = DatedFileCatalog('input_data')
+    outlook_energy_all_economies, outlook_load_report = data_processing.load_outlook_energy_files([outlook_energy_APEC_path] + data_processing.find_latest_merged_file_energy_files(config, catalog=input_data_catalog))
+    record['rows'] = len(outlook_energy_all_economies)
+outlook_comparison = instrumentation.run_stage('comparison', plotting.import_and_compare_to_outlook_results, outlook_results, outlook_energy_all_economies)
+#one page with all the economies, scenarios and units, filtered in the browser
+instrumentation.run_stage('dashboard', dashboard.export_dashboard, projections, apec_aggregate, outlook_comparison, scenario_variants)
+if (config.get('static_export') or {}).get('enabled', False):
+    #image copies of the figures for reports
+    instrumentation.run_stage('static_export', plotting.export_static_images, {**projection_figures, **apec_figures}, plotting.economy_dashboard_specs(outlook_comparison), **plotting.static_export_settings(config))
 
-data_processing.save_outputs(outlook_results)
+#csv for the integration team, plus parquet/feather if they are in output_formats in parameters.yml
+instrumentation.run_stage('save_outputs', data_processing.save_outputs, outlook_results, formats=config.get('output_formats', ['csv']))
+#print the time and memory of each stage and save them to output_data/traces
+instrumentation.finish_trace()
 
 
 #############################################################
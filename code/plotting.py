@@ -4,14 +4,55 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
+#plotly.graph_objects loads its classes when they are first used, but plotly.express is slow to import, so it is imported in the functions that use it
 import plotly.graph_objects as go
-import plotly.express as px
 import shutil
+import sys
+import time
+import importlib.util
+import json
+import hashlib
+import multiprocessing
+import plotly
+from concurrent.futures import ProcessPoolExecutor
 
-from utility_functions import get_latest_date_for_data_file
+from utility_functions import get_latest_date_for_data_file, write_atomic, OUTLOOK_ID_COLUMNS, shared_outlook_categories, to_compact_outlook_table
+
+#############################################################
+# Unit toggle
+#############################################################
+#Rather than making the same figure again for TWh and MW, the figure is made once in PJ and add_unit_toggle stores the TWh and MW values in a dropdown, which swaps them in the browser.
+
+#what the PJ values are divided by to get each unit. To produce 1 TWh of energy in a year, you would need 114.155 MW of continuous power.
+UNIT_DIVISORS = {'PJ': 1, 'TWh': 3.6, 'MW': 3.6 * 0.00876}
+ENERGY_UNIT_LABELS = {'PJ': 'Energy Use (PJ)', 'TWh': 'Energy Use (TWh)', 'MW': 'Capacity (MW)'}
+SECTOR_UNIT_TITLES = {'PJ': 'Energy Usage by Sector', 'TWh': 'Energy Usage by Sector', 'MW': 'Capacity by Sector'}
+
+
+def add_unit_toggle(fig, unit_titles=None, unit_labels=ENERGY_UNIT_LABELS, base_unit='PJ'):
+    """Add a dropdown to fig that switches the y values of every trace between the units in unit_labels. fig has to be made in base_unit, with its y axes labelled unit_labels[base_unit]. unit_titles is an optional dict of unit -> figure title, e.g. to call the MW version capacity."""
+    base_label = unit_labels[base_unit]
+    base_ys = [np.asarray(trace.y, dtype=float) for trace in fig.data]
+    yaxes = [name for name, axis in fig.layout.to_plotly_json().items() if name.startswith('yaxis') and axis.get('title', {}).get('text') == base_label]
+    has_hovertemplates = any(trace.hovertemplate is not None for trace in fig.data)
+    
+    buttons = []
+    for unit, label in unit_labels.items():
+        divisor = UNIT_DIVISORS[unit] / UNIT_DIVISORS[base_unit]
+        trace_update = {'y': [(y / divisor).tolist() for y in base_ys]}
+        if has_hovertemplates:
+            trace_update['hovertemplate'] = [None if trace.hovertemplate is None else trace.hovertemplate.replace(base_label, label) for trace in fig.data]
+        layout_update = {f'{axis}.title.text': label for axis in yaxes}
+        if unit_titles is not None:
+            layout_update['title.text'] = unit_titles[unit]
+        buttons.append(dict(label=unit, method='update', args=[trace_update, layout_update]))
+    fig.update_layout(updatemenus=[dict(buttons=buttons, direction='down', showactive=True, x=1, xanchor='right', y=1.1, yanchor='bottom')])
+    if unit_titles is not None:
+        fig.update_layout(title_text=unit_titles[base_unit])
+    return fig
 
 def plot_projections(projections, output_dir='plotting_output'):
+    import plotly.express as px
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
@@ -25,24 +66,17 @@ def plot_projections(projections, output_dir='plotting_output'):
                          color='variable', facet_col='economy', facet_col_wrap=7)
     
     fig_energy.update_yaxes(matches=None, showticklabels=True)
+    #with a dropdown for the twh and mw versions
+    add_unit_toggle(fig_energy, unit_titles=SECTOR_UNIT_TITLES)
     fig_energy_path = os.path.join(output_dir, 'data_centres_energy_use_area_by_economy.html')
     fig_energy.write_html(fig_energy_path)
     print(f'Saved energy area plot to {fig_energy_path}')
-    
-    #and do a twh version
-    energy['value'] = energy['value'] / 3.6
-    fig_energy = px.area(energy, x='year', y='value', 
-                         title='Energy Usage by Sector', labels={'value': 'Energy Use (TWh)', 'year': 'Year'}, 
-                         color='variable', facet_col='economy', facet_col_wrap=7)
-    fig_energy.update_yaxes(matches=None, showticklabels=True)
-    fig_energy_path = os.path.join(output_dir, 'data_centres_energy_use_area_by_economy_TWh.html')
-    fig_energy.write_html(fig_energy_path)
-    print(f'Saved energy area plot to {fig_energy_path}')
+    fig_energy_by_sector = fig_energy
     ##
     #and do one which is just all the economies together, no sectors:
     energy = projections[['traditional_data_energy_use', 'ai_training_energy_use', 'year', 'economy']]
     energy = energy.melt(id_vars=['year', 'economy'], var_name='variable', value_name='value')
-    energy = energy.groupby(['year', 'economy']).sum().reset_index()
+    energy = energy.groupby(['year', 'economy'])['value'].sum().reset_index()
     #put economies in order of smallest to largest energy use sum
     energy = energy.sort_values('value')
     fig_energy = px.area(energy, x='year', y='value', 
@@ -50,13 +84,7 @@ def plot_projections(projections, output_dir='plotting_output'):
                          color='economy')
     fig_energy_path = os.path.join(output_dir, 'data_centres_energy_use_area_by_economy_all.html')
     fig_energy = fig_energy.update_layout(legend_title='Economy')
-    fig_energy.write_html(fig_energy_path)
-    ##
-    #and by twh
-    energy['value'] = energy['value'] / 3.6
-    fig_energy = px.area(energy, x='year', y='value',title='Energy Usage by Economy', labels={'value': 'Energy Use (TWh)', 'year': 'Year'}, color='economy')
-    fig_energy_path = os.path.join(output_dir, 'data_centres_energy_use_area_by_economy_all_TWh.html')
-    fig_energy = fig_energy.update_layout(legend_title='Economy')
+    add_unit_toggle(fig_energy, unit_titles={'PJ': 'Energy Usage by Economy', 'TWh': 'Energy Usage by Economy', 'MW': 'Capacity by Economy'})
     fig_energy.write_html(fig_energy_path)
     ##
     # Prepare data for indexed activity line chart
@@ -86,6 +114,8 @@ def plot_projections(projections, output_dir='plotting_output'):
     fig_intensity_path = os.path.join(output_dir, 'intensity_line_by_economy.html')
     fig_intensity.write_html(fig_intensity_path)
     print(f'Saved intensity plot to {fig_intensity_path}')
+    #return the figures by file name so they can also be exported as images (export_static_images)
+    return {'data_centres_energy_use_area_by_economy': fig_energy_by_sector, 'data_centres_energy_use_area_by_economy_all': fig_energy, 'activity_indexed_line_by_economy': fig_activity, 'intensity_line_by_economy': fig_intensity}
 
 
 
@@ -269,173 +299,344 @@ def plot_apec_aggregate(apec_aggregate):
         yaxis_title='Energy Use (PJ)',
         legend_title='Metrics'
     )
+    add_unit_toggle(fig_energy, unit_titles={'PJ': 'APEC Aggregate - Total Energy Use with Confidence Intervals', 'TWh': 'APEC Aggregate - Total Energy Use with Confidence Intervals', 'MW': 'APEC Aggregate - Total Capacity with Confidence Intervals'})
 
     fig_energy_path = os.path.join('plotting_output', 'apec_energy_ci.html')
     fig_energy.write_html(fig_energy_path)
     print(f'Saved APEC total energy use plot with CI to {fig_energy_path}')
+    return {'apec_activity_ci': fig_activity, 'apec_intensity_ci': fig_intensity, 'apec_energy_ci': fig_energy}
 
 
-def import_and_compare_to_outlook_results(outlook_results, outlook_energy):
+BUILDINGS_EXCLUDED_FUELS = ['17_x_green_electricity', '19_total', '20_total_renewables', '21_modern_renewables']
 
-    #melt the df to long format ['scenarios	economy	sectors	sub1sectors	sub2sectors	sub3sectors	sub4sectors	fuels	subfuels	subtotal_layout	subtotal_results']
-    outlook_energy = outlook_energy.melt(id_vars=['scenarios','economy','sectors','sub1sectors','sub2sectors','sub3sectors','sub4sectors','fuels','subfuels','subtotal_layout','subtotal_results'], var_name='year', value_name='value')
-    
-    outlook_energy_buildings = outlook_energy.loc[(outlook_energy['sectors']=='16_other_sector') & (outlook_energy['sub1sectors']=='16_01_buildings') & (~outlook_energy['fuels'].isin([ '17_x_green_electricity', '19_total', '20_total_renewables', '21_modern_renewables']))].copy()
 
+def filter_and_melt_outlook_energy(outlook_energy):
+    """Pick out the buildings rows and the total final consumption electricity rows from the wide outlook data and melt only those to long format. Filtering on the wide data first means the other sectors, fuels and subtotals are never melted."""
+    not_subtotal = (outlook_energy['subtotal_layout']==False) & (outlook_energy['subtotal_results']==False)
+    buildings_rows = (outlook_energy['sectors']=='16_other_sector') & (outlook_energy['sub1sectors']=='16_01_buildings') & (~outlook_energy['fuels'].isin(BUILDINGS_EXCLUDED_FUELS)) & not_subtotal
+    electricity_rows = (outlook_energy['sectors']=='12_total_final_consumption') & (outlook_energy['fuels']=='17_electricity') & not_subtotal
+    
+    outlook_energy_buildings = outlook_energy.loc[buildings_rows].melt(id_vars=OUTLOOK_ID_COLUMNS, var_name='year', value_name='value')
+    outlook_electricity = outlook_energy.loc[electricity_rows].melt(id_vars=OUTLOOK_ID_COLUMNS, var_name='year', value_name='value')
     #create column outlook_energy_buildings['sub3sectors'] and set it to '16_01_01_01_commercial_and_public_services' where sub2sectors is '16_01_01_commercial_and_public_services', else set it to what it already is
     outlook_energy_buildings['sub3sectors'] = outlook_energy_buildings['sub2sectors']
+    return outlook_energy_buildings, outlook_electricity
+
+
+COMPARISON_CHART_TITLES = {'buildings': 'Energy Use in Buildings by Sector', 'electricity': 'Electricity Use by Sector', 'data_centres': 'Data Centre Electricity Use by Subsector'}
+
+
+def build_outlook_comparison(outlook_energy_buildings, outlook_electricity):
+    """Make the data for the by economy dashboards for every economy at once. Returns a long df of economy, scenarios, chart, color, year and value, where chart is one of the keys of COMPARISON_CHART_TITLES:
+    buildings: energy use in buildings by sector (with the data centre subsectors split out)
+    electricity: whole economy electricity use compared to data centre electricity use
+    data_centres: data centre electricity use by subsector
+    """
+    #create a color col in each df
+    buildings = outlook_energy_buildings.assign(color=np.where(outlook_energy_buildings['sub3sectors']=='16_01_01_02_data_centres', outlook_energy_buildings['sub4sectors'], outlook_energy_buildings['sub3sectors']))
+    data_centres = buildings.loc[buildings['sub3sectors']=='16_01_01_02_data_centres']
+    data_centres = data_centres.assign(color=data_centres['sub4sectors'].astype(str))
+    #also if a value is zero drop it (to get rid of empty sectors)
+    buildings = buildings.loc[buildings['value']!=0]
+    electricity = outlook_electricity.assign(color=np.where(outlook_electricity['sectors']=='12_total_final_consumption', outlook_electricity['sectors'], outlook_electricity['sub4sectors']))
     
-    outlook_energy_buildings = outlook_energy_buildings.loc[outlook_energy_buildings['subtotal_layout']==False].copy()
-    outlook_energy_buildings = outlook_energy_buildings.loc[outlook_energy_buildings['subtotal_results']==False].copy()
+    columns = ['economy', 'scenarios', 'chart', 'color', 'year', 'value']
+    outlook_comparison = pd.concat([buildings.assign(chart='buildings')[columns], electricity.assign(chart='electricity')[columns], data_centres.assign(chart='data_centres')[columns]], ignore_index=True)
+    return outlook_comparison.groupby(['economy', 'scenarios', 'chart', 'color', 'year'], observed=True)['value'].sum().reset_index()
 
-    outlook_electricity = outlook_energy.loc[(outlook_energy['sectors']=='12_total_final_consumption') & (outlook_energy['fuels']=='17_electricity')].copy()
-    outlook_electricity = outlook_electricity.loc[outlook_electricity['subtotal_layout']==False].copy()
-    outlook_electricity = outlook_electricity.loc[outlook_electricity['subtotal_results']==False].copy()
+
+def economy_dashboard_specs(outlook_comparison):
+    """Make a figure spec (see render_figures) for each economy's dashboard from the data from build_outlook_comparison."""
+    figure_specs = []
+    #the data for the dashboards is made for every economy at once (it is also what goes in the dashboard from dashboard.py), then split by economy in one pass
+    economy_comparison = outlook_comparison.loc[outlook_comparison['economy']!='00_APEC']
+    for economy, all_data in economy_comparison.groupby('economy', sort=False, observed=True):
+        #we will plot all charts we want in one dashboard. so that will be:
+        #energy use in buildings by sector - target
+        #energy use in buildings by sector - reference
+        #whole economy electricity use compared to data centre electricity use - target
+        #whole economy electricity use compared to data centre electricity use - reference
+        #data centre electricity use by subsector - target
+        #data centre electricity use by subsector - reference
+        #and the same for any other scenarios in parameters.yml
+        #the title column is the name of each plot, and is used to facet the plots:
+        all_data = all_data.assign(title=all_data['chart'].map(COMPARISON_CHART_TITLES).astype(str) + ' - ' + all_data['scenarios'].astype(str).str.replace('_', ' ').str.title())
+        #group and sum alll:
+        all_data = all_data.groupby(['year','color','title'], observed=True)['value'].sum().reset_index()
+        #with a dropdown for the twh and mw versions
+        figure_specs.append(make_figure_spec(os.path.join('plotting_output', 'by_economy', f'energy_use_area_econ_{economy}.html'), all_data, independent_yaxes=True, unit_titles={'PJ': f'Data centres energy usage dashbaord - {economy} - all other values are from first iteration', 'TWh': f'Data centres energy usage dashbaord - {economy} - all other values are from first iteration', 'MW': f'Data centres capacity dashbaord - {economy} - all other values are from first iteration'}, x='year', y='value', color='color', facet_col='title', facet_col_wrap=2, labels={'value': 'Energy Use (PJ)', 'year': 'Year'}))
+    return figure_specs
+
+
+def import_and_compare_to_outlook_results(outlook_results, outlook_energy):
+    """Plot the outlook results against the outlook energy data for APEC and each economy. Returns the data for the by economy dashboards from build_outlook_comparison()."""
+    import plotly.express as px
+
+    #filter the wide data down to the buildings and electricity rows, then melt them to long format ['scenarios	economy	sectors	sub1sectors	sub2sectors	sub3sectors	sub4sectors	fuels	subfuels	subtotal_layout	subtotal_results']
+    outlook_energy_buildings, outlook_electricity = filter_and_melt_outlook_energy(outlook_energy)
+    #put everything in the compact format with the same categories so the concats below stay categorical (and the years are all int16 rather than a mix of strings and ints)
+    categories = shared_outlook_categories(outlook_energy_buildings, outlook_electricity, outlook_results)
+    outlook_energy_buildings = to_compact_outlook_table(outlook_energy_buildings, categories)
+    outlook_electricity = to_compact_outlook_table(outlook_electricity, categories)
+    outlook_results = to_compact_outlook_table(outlook_results, categories)
     
     # concat with outlook_results
-    outlook_energy_buildings = pd.concat([outlook_energy_buildings, outlook_results])
-    outlook_electricity = pd.concat([outlook_electricity, outlook_results])
+    outlook_energy_buildings = pd.concat([outlook_energy_buildings, outlook_results], ignore_index=True)
+    outlook_electricity = pd.concat([outlook_electricity, outlook_results], ignore_index=True)
     
     #where fuel is not electricity, label as other_fuel
     outlook_energy_buildings['fuels'] = np.where(outlook_energy_buildings['fuels']=='17_electricity', '17_electricity', 'other_fuel')
     outlook_energy_buildings['color'] = np.where(outlook_energy_buildings['sub3sectors']=='16_01_01_02_data_centres', outlook_energy_buildings['sub4sectors'], outlook_energy_buildings['sub3sectors'])
     outlook_energy_buildings['pattern'] = outlook_energy_buildings['fuels']
     
-    outlook_results_APEC = outlook_results.loc[outlook_results['economy']=='00_APEC'].copy()
-    outlook_energy_APEC = outlook_energy.loc[outlook_energy['economy']=='00_APEC'].copy()
-    outlook_energy_buildings_APEC = outlook_energy_buildings.loc[outlook_energy_buildings['economy']=='00_APEC'].copy()
-    outlook_electricity_APEC = outlook_electricity.loc[outlook_electricity['economy']=='00_APEC'].copy()
-    outlook_results = outlook_results.loc[outlook_results['economy']!='00_APEC'].copy()
-    outlook_energy = outlook_energy.loc[outlook_energy['economy']!='00_APEC'].copy()
-    outlook_energy_buildings = outlook_energy_buildings.loc[outlook_energy_buildings['economy']!='00_APEC'].copy()
-    outlook_electricity = outlook_electricity.loc[outlook_electricity['economy']!='00_APEC'].copy()
+    #the data for the by economy dashboards, for all the economies and APEC
+    outlook_comparison = build_outlook_comparison(outlook_energy_buildings, outlook_electricity)
+    
+    #split into APEC and the economies with one mask each
+    buildings_is_apec = outlook_energy_buildings['economy']=='00_APEC'
+    electricity_is_apec = outlook_electricity['economy']=='00_APEC'
+    outlook_energy_buildings_APEC = outlook_energy_buildings.loc[buildings_is_apec]
+    outlook_electricity_APEC = outlook_electricity.loc[electricity_is_apec]
+    outlook_energy_buildings = outlook_energy_buildings.loc[~buildings_is_apec]
+    outlook_electricity = outlook_electricity.loc[~electricity_is_apec]
     #now plot.
     #sum up by color,pattern,year,scenarios
-    outlook_energy_buildings_scen = outlook_energy_buildings_APEC.groupby(['color','pattern','year','scenarios']).sum().reset_index()
+    outlook_energy_buildings_scen = outlook_energy_buildings_APEC.groupby(['color','pattern','year','scenarios'], observed=True)['value'].sum().reset_index()
     
     fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2, pattern_shape='pattern', title='Energy Usage by Sector', labels={'value': 'Energy Use (PJ)', 'year': 'Year'})
+    #with a dropdown for the twh and mw versions
+    add_unit_toggle(fig_energy_buildings, unit_titles=SECTOR_UNIT_TITLES)
     fig_energy_buildings_path = os.path.join('plotting_output', 'energy_use_area_buildings.html')
     fig_energy_buildings.write_html(fig_energy_buildings_path)
     print(f'Saved energy area plot to {fig_energy_buildings_path}')
     
-    #write it again but for twh
-    outlook_energy_buildings_scen['value'] = outlook_energy_buildings_scen['value'] / 3.6
-    fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2, pattern_shape='pattern', title='Energy Usage by Sector', labels={'value': 'Energy Use (TWh)', 'year': 'Year'})
-    fig_energy_buildings_path = os.path.join('plotting_output', 'energy_use_area_buildings_TWh.html')
-    fig_energy_buildings.write_html(fig_energy_buildings_path)
-    print(f'Saved energy area plot to {fig_energy_buildings_path}')
-    #write for mw
-    outlook_energy_buildings_scen['value'] = outlook_energy_buildings_scen['value'] / 0.00876 #To produce 1 TWh of energy in a year, you would need 114.155 MW of continuous power.
-    fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2, pattern_shape='pattern', title='Capacity by Sector', labels={'value': 'Capacity (MW)', 'year': 'Year'})
-    fig_energy_buildings_path = os.path.join('plotting_output', 'capacity_area_buildings_MW.html')
-    fig_energy_buildings.write_html(fig_energy_buildings_path)
-    print(f'Saved energy area plot to {fig_energy_buildings_path}')
-    
     ##
     #BY ECONOMY: 
-    outlook_energy_buildings_econ = outlook_energy_buildings.groupby(['economy', 'color','pattern','year','scenarios']).sum().reset_index()
+    outlook_energy_buildings_econ = outlook_energy_buildings.groupby(['economy', 'color','pattern','year','scenarios'], observed=True)['value'].sum().reset_index()
     
+    #the by economy figures are big, so they go through render_figures which only re-renders the ones whose data has changed
+    figure_specs = []
     for scenario in outlook_energy_buildings_econ['scenarios'].unique():
         outlook_energy_buildings_scen = outlook_energy_buildings_econ.loc[outlook_energy_buildings_econ['scenarios']==scenario]
-        fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='economy', facet_col_wrap=7, pattern_shape='pattern', title=f'Energy Usage by Sector and economy - {scenario}', labels={'value': 'Energy Use (PJ)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_buildings.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_buildings_path = os.path.join('plotting_output', f'energy_use_area_buildings_by_economy_{scenario}.html')
-        fig_energy_buildings.write_html(fig_energy_buildings_path)
-        print(f'Saved energy area plot to {fig_energy_buildings_path}')
-        
-        #write it again but for twh
-        outlook_energy_buildings_scen['value'] = outlook_energy_buildings_scen['value'] / 3.6
-        fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='economy', facet_col_wrap=7, pattern_shape='pattern', title=f'Energy Usage by Sector and economy - {scenario}', labels={'value': 'Energy Use (TWh)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_buildings.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_buildings_path = os.path.join('plotting_output', f'energy_use_area_buildings_TWh_by_economy_{scenario}.html')
-        fig_energy_buildings.write_html(fig_energy_buildings_path)
-        print(f'Saved energy area plot to {fig_energy_buildings_path}')
-        
-        #write it again but for mw
-        outlook_energy_buildings_scen['value'] = outlook_energy_buildings_scen['value'] / 0.00876
-        fig_energy_buildings = px.area(outlook_energy_buildings_scen, x='year', y='value', color='color', facet_col='economy', facet_col_wrap=7, pattern_shape='pattern', title=f'Capacity by Sector and economy - {scenario}', labels={'value': 'Capacity (MW)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_buildings.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_buildings_path = os.path.join('plotting_output', f'capacity_area_buildings_MW_by_economy_{scenario}.html')
-        fig_energy_buildings.write_html(fig_energy_buildings_path)
-        print(f'Saved energy area plot to {fig_energy_buildings_path}')
+        figure_specs.append(make_figure_spec(os.path.join('plotting_output', f'energy_use_area_buildings_by_economy_{scenario}.html'), outlook_energy_buildings_scen, independent_yaxes=True, unit_titles={'PJ': f'Energy Usage by Sector and economy - {scenario}', 'TWh': f'Energy Usage by Sector and economy - {scenario}', 'MW': f'Capacity by Sector and economy - {scenario}'}, x='year', y='value', color='color', facet_col='economy', facet_col_wrap=7, pattern_shape='pattern', labels={'value': 'Energy Use (PJ)', 'year': 'Year'}))
     #
     #concat the sectors for the color
     #make color the sectors where it is 12_total_final_consumption, then sub3sectors otherwise
-    outlook_electricity_APEC['color'] = np.where(outlook_electricity_APEC['sectors']=='12_total_final_consumption', outlook_electricity_APEC['sectors'], outlook_electricity_APEC['sub4sectors'])   
+    outlook_electricity_APEC = outlook_electricity_APEC.assign(color=np.where(outlook_electricity_APEC['sectors']=='12_total_final_consumption', outlook_electricity_APEC['sectors'], outlook_electricity_APEC['sub4sectors']))
     #sum up by color,year,scenarios
-    outlook_electricity_APEC = outlook_electricity_APEC.groupby(['color','year','scenarios']).sum().reset_index()
+    outlook_electricity_APEC = outlook_electricity_APEC.groupby(['color','year','scenarios'], observed=True)['value'].sum().reset_index()
     fig_energy_electricity = px.area(outlook_electricity_APEC, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2,  title='Energy Usage by Sector', labels={'value': 'Energy Use (PJ)', 'year': 'Year'})
+    add_unit_toggle(fig_energy_electricity, unit_titles=SECTOR_UNIT_TITLES)
     fig_energy_electricity_path = os.path.join('plotting_output', 'energy_use_area_electricity.html')
     fig_energy_electricity.write_html(fig_energy_electricity_path)
     print(f'Saved energy area plot to {fig_energy_electricity_path}')
-    ##
-    #write it again but for twh
-    outlook_electricity_APEC['value'] = outlook_electricity_APEC['value'] / 3.6
-    fig_energy_electricity = px.area(outlook_electricity_APEC, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2,  title='Energy Usage by Sector', labels={'value': 'Energy Use (TWh)', 'year': 'Year'})
-    fig_energy_electricity_path = os.path.join('plotting_output', 'energy_use_area_electricity_TWh.html')
-    fig_energy_electricity.write_html(fig_energy_electricity_path)
-    print(f'Saved energy area plot to {fig_energy_electricity_path}')
-    #write for mw
-    outlook_electricity_APEC['value'] = outlook_electricity_APEC['value'] / 0.00876 #To produce 1 TWh of energy in a year, you would need 114.155 MW of continuous power.
-    fig_energy_electricity = px.area(outlook_electricity_APEC, x='year', y='value', color='color', facet_col='scenarios', facet_col_wrap=2,  title='Capacity by Sector', labels={'value': 'Capacity (MW)', 'year': 'Year'})
-    fig_energy_electricity_path = os.path.join('plotting_output', 'capacity_area_electricity_MW.html')
-    fig_energy_electricity.write_html(fig_energy_electricity_path)  
-    print(f'Saved energy area plot to {fig_energy_electricity_path}')
     
     #plot these by economy
-    for economy in outlook_energy_buildings['economy'].unique():
-        outlook_energy_buildings_econ = outlook_energy_buildings.loc[outlook_energy_buildings['economy']==economy].copy()
-        outlook_electricity_econ = outlook_electricity.loc[outlook_electricity['economy']==economy].copy()
-        #we will plot all charts we want in one dashboard. so that will be:
-        #energy use in buildings by sector - target
-        #energy use in buildings by sector - reference
-        #whole economy electricity use compared to data centre electricity use - target
-        #whole economy electricity use compared to data centre electricity use - reference
-        #data centre electricity use by subsector - target
-        #data centre electricity use by subsector - reference
-        
-        #we will create a df which is the concat of the df's needed to make these plots and create a column called 'title' which will be the name of the plot
-        #we will then use this column to facet the plots:
-        outlook_energy_buildings_econ['title'] = np.where(outlook_energy_buildings_econ['scenarios']=='reference', 'Energy Use in Buildings by Sector - Reference', 'Energy Use in Buildings by Sector - Target')
-        outlook_electricity_econ['title'] = np.where(outlook_electricity_econ['scenarios']=='reference', 'Electricity Use by Sector - Reference', 'Electricity Use by Sector - Target')
-        data_centres_energy = outlook_energy_buildings_econ.loc[outlook_energy_buildings_econ['sub3sectors']=='16_01_01_02_data_centres'].copy()
-        data_centres_energy['title'] = np.where(data_centres_energy['scenarios']=='reference', 'Data Centre Electricity Use by Subsector - Reference', 'Data Centre Electricity Use by Subsector - Target')
-        #create a color col in each df
-        outlook_energy_buildings_econ['color'] = np.where(outlook_energy_buildings_econ['sub3sectors']=='16_01_01_02_data_centres', outlook_energy_buildings_econ['sub4sectors'], outlook_energy_buildings_econ['sub3sectors'])
-        #also if a value is zero drop it (to get rid of empty sectors)
-        outlook_energy_buildings_econ = outlook_energy_buildings_econ.loc[outlook_energy_buildings_econ['value']!=0].copy()
-        
-        outlook_electricity_econ['color'] = np.where(outlook_electricity_econ['sectors']=='12_total_final_consumption', outlook_electricity_econ['sectors'], outlook_electricity_econ['sub4sectors'])
-        data_centres_energy['color'] = data_centres_energy['sub4sectors']        
-        #concat
-        all_data = pd.concat([outlook_energy_buildings_econ, outlook_electricity_econ, data_centres_energy])
-        #group and sum alll:
-        all_data = all_data.groupby(['year','color','title']).sum().reset_index()
-        #plot
-        fig_energy_econ = px.area(all_data, x='year', y='value', color='color', facet_col='title', facet_col_wrap=2,  title=f'Data centres energy usage dashbaord - {economy} - all other values are from first iteration', labels={'value': 'Energy Use (PJ)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_econ.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_econ_path = os.path.join('plotting_output', 'by_economy', f'energy_use_area_econ_{economy}.html')
-        fig_energy_econ.write_html(fig_energy_econ_path)
-        print(f'Saved energy area plot to {fig_energy_econ_path}')
-        
-        #and do it by twh and by mw
-        all_data['value'] = all_data['value'] / 3.6
-        fig_energy_econ = px.area(all_data, x='year', y='value', color='color', facet_col='title', facet_col_wrap=2,  title=f'Data centres energy usage dashbaord - {economy} - all other values are from first iteration', labels={'value': 'Energy Use (TWh)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_econ.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_econ_path = os.path.join('plotting_output', 'by_economy_Twh', f'energy_use_area_econ_TWh_{economy}.html')
-        fig_energy_econ.write_html(fig_energy_econ_path)
-        
-        all_data['value'] = all_data['value'] / 0.00876 #To produce 1 TWh of energy in a year, you would need 114.155 MW of continuous power.
-        fig_energy_econ = px.area(all_data, x='year', y='value', color='color', facet_col='title', facet_col_wrap=2,  title=f'Data centres capacity dashbaord - {economy} - all other values are from first iteration', labels={'value': 'Capacity (MW)', 'year': 'Year'})
-        #make the axis independent
-        fig_energy_econ.update_yaxes(matches=None, showticklabels=True)
-        fig_energy_econ_path = os.path.join('plotting_output', 'by_economy_MW', f'capacity_area_econ_MW_{economy}.html')
-        fig_energy_econ.write_html(fig_energy_econ_path)
+    figure_specs.extend(economy_dashboard_specs(outlook_comparison))
+    render_figures(figure_specs)
+    return outlook_comparison
+
+
+#############################################################
+# Incremental, parallel rendering of figures to html
+#############################################################
+#A figure spec is the data and the px arguments for one figure. Each spec is hashed and the hash is kept in plotting_output/.render_manifest.json, so a figure is only rendered again when its data or arguments change (or its file is missing). The html files point to one plotly.min.js in their folder (include_plotlyjs='directory') instead of each embedding their own ~3MB copy.
+
+RENDER_MANIFEST_PATH = os.path.join('plotting_output', '.render_manifest.json')
+#bump this if render_figure_spec changes how figures look so they are all rendered again
+RENDER_VERSION = 2
+#the plotly.express function for each kind of figure
+PLOT_FUNCTIONS = {'area': 'area', 'line': 'line'}
+
+
+def make_figure_spec(path, data, kind='area', independent_yaxes=False, unit_titles=None, **plot_kwargs):
+    """Describe a figure without making it. plot_kwargs are passed to the px function for kind, and independent_yaxes unmatches the facet y axes. If unit_titles is given the figure gets the PJ/TWh/MW dropdown from add_unit_toggle (so the data has to be in PJ)."""
+    return {'path': path, 'data': data, 'kind': kind, 'independent_yaxes': independent_yaxes, 'unit_titles': unit_titles, 'plot_kwargs': plot_kwargs}
+
+
+def figure_spec_hash(spec):
+    sha256 = hashlib.sha256()
+    sha256.update(pd.util.hash_pandas_object(spec['data'], index=False).values.tobytes())
+    settings = {'columns': [str(column) for column in spec['data'].columns], 'kind': spec['kind'], 'independent_yaxes': spec['independent_yaxes'], 'unit_titles': spec['unit_titles'], 'plot_kwargs': spec['plot_kwargs'], 'plotly_version': plotly.__version__, 'render_version': RENDER_VERSION}
+    sha256.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return sha256.hexdigest()
+
+
+def build_figure_from_spec(spec):
+    import plotly.express as px
+    fig = getattr(px, PLOT_FUNCTIONS[spec['kind']])(spec['data'], **spec['plot_kwargs'])
+    if spec['independent_yaxes']:
+        fig.update_yaxes(matches=None, showticklabels=True)
+    if spec['unit_titles'] is not None:
+        add_unit_toggle(fig, unit_titles=spec['unit_titles'])
+    return fig
+
+
+def render_figure_spec(spec):
+    """Make and write one figure. Runs in the worker processes so it has to stay a top level function."""
+    build_figure_from_spec(spec).write_html(spec['path'], include_plotlyjs='directory')
+    return spec['path']
+
+
+def write_file_atomic(path, text):
+    def write_text(temp_path):
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+    write_atomic(path, write_text)
+
+
+def ensure_plotlyjs(folder):
+    """Put plotly.min.js in folder before the workers start, so they dont race each other to write it."""
+    plotlyjs_path = os.path.join(folder, 'plotly.min.js')
+    if not os.path.exists(plotlyjs_path):
+        write_file_atomic(plotlyjs_path, plotly.offline.get_plotlyjs())
+
+
+def can_use_process_pool():
+    """With the spawn and forkserver start methods (windows, and macos) each worker re-runs the script that started it, and main.py has no if __name__ == '__main__' guard so that it can be run in cells. So only use processes when they are forked or when running interactively."""
+    main_module = sys.modules['__main__']
+    return multiprocessing.get_start_method() == 'fork' or not hasattr(main_module, '__file__')
+
+
+def render_figures(figure_specs, manifest_path=RENDER_MANIFEST_PATH, max_workers=None, force=False):
+    """Render the figure specs whose data or arguments have changed since the last run, across a process pool. Returns the paths that were rendered.
+
+    max_workers defaults to the number of cpus when can_use_process_pool() says a pool is safe, otherwise 1 (rendered in this process). Pass it in to choose yourself, e.g. from a script with a main guard. force renders everything.
+    """
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    
+    spec_hashes = {spec['path']: figure_spec_hash(spec) for spec in figure_specs}
+    specs_to_render = [spec for spec in figure_specs if manifest.get(spec['path']) != spec_hashes[spec['path']] or not os.path.exists(spec['path'])]
+    for folder in set(os.path.dirname(spec['path']) or '.' for spec in specs_to_render):
+        os.makedirs(folder, exist_ok=True)
+        ensure_plotlyjs(folder)
     
+    if max_workers is None:
+        max_workers = os.cpu_count() if can_use_process_pool() else 1
+    max_workers = max(1, min(max_workers, len(specs_to_render)))
+    rendered_paths = []
+    #save the manifest even if a figure fails, so the ones that were done arent rendered again
+    try:
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for path in executor.map(render_figure_spec, specs_to_render):
+                    manifest[path] = spec_hashes[path]
+                    rendered_paths.append(path)
+        else:
+            for spec in specs_to_render:
+                manifest[render_figure_spec(spec)] = spec_hashes[spec['path']]
+                rendered_paths.append(spec['path'])
+    finally:
+        if os.path.dirname(manifest_path):
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        write_file_atomic(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+    print(f'Rendered {len(rendered_paths)} figures ({len(figure_specs) - len(rendered_paths)} unchanged) with {max_workers} worker(s)')
+    return rendered_paths
+
+
+#############################################################
+# Static image export
+#############################################################
+#export_static_images writes png/svg/pdf copies of figures for reports into plotting_output/static, using kaleido (an optional dependency, if it isnt installed the export is skipped). The figures are split between a few worker processes and each worker keeps one kaleido renderer running for all of its figures, rather than starting one per figure. Like render_figures, a hash of each figure is kept in a manifest so that with changed_only only new or changed figures are exported.
+#
+#NOTE this is untested with a real kaleido. It has only been run with a stand-in for fig.write_image (tests/test_static_export.py, plotly 7 needs kaleido 1.x and a Chrome to drive), so it ships turned off (static_export: enabled: false) and the images should be checked the first time it is used.
+
+STATIC_OUTPUT_DIR = os.path.join('plotting_output', 'static')
+STATIC_MANIFEST_NAME = '.export_manifest.json'
+
+
+def start_static_renderer():
+    """kaleido 1.x starts a browser for every figure unless its sync server is running, so start it once for this process. kaleido 0.2 already keeps its renderer running between figures."""
+    import kaleido
+    if hasattr(kaleido, 'start_sync_server'):
+        kaleido.start_sync_server()
 
-        
+
+def stop_static_renderer():
+    import kaleido
+    if hasattr(kaleido, 'stop_sync_server'):
+        kaleido.stop_sync_server()
+
+
+def export_static_chunk(items, formats, scale, output_dir):
+    """Export a list of items (see export_static_images) with one renderer. Returns the seconds each item took. Runs in the worker processes."""
+    start_static_renderer()
+    try:
+        timings = []
+        for item in items:
+            start = time.perf_counter()
+            fig = build_figure_from_spec(item['spec']) if 'spec' in item else go.Figure(item['figure'])
+            #the unit dropdown does nothing in an image, so leave it out (the image is in PJ)
+            fig.layout.updatemenus = ()
+            for image_format in formats:
+                path = os.path.join(output_dir, f"{item['name']}.{image_format}")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fig.write_image(path, format=image_format, scale=scale)
+            timings.append({'name': item['name'], 'seconds': time.perf_counter() - start})
+        return timings
+    finally:
+        stop_static_renderer()
+
+
+def static_export_settings(config):
+    """The export_static_images arguments from the static_export section of parameters.yml (without enabled)."""
+    return {key: value for key, value in (config.get('static_export') or {}).items() if key != 'enabled'}
+
+
+def export_static_images(figures=None, figure_specs=None, formats=('png',), scale=2, changed_only=True, output_dir=STATIC_OUTPUT_DIR, max_workers=None):
+    """Export figures (a dict of name -> plotly figure, like plot_projections and plot_apec_aggregate return) and figure_specs (e.g. from economy_dashboard_specs) as images in output_dir. Spec images are named after their html file, relative to plotting_output.
+
+    With changed_only, figures whose hash, formats and scale are the same as last time (and whose files are there) are skipped. Returns a df of the seconds each exported figure took, which is also printed.
+    """
+    if importlib.util.find_spec('kaleido') is None:
+        print('kaleido is not installed, so the static images were not exported (pip install kaleido)')
+        return pd.DataFrame(columns=['name', 'seconds'])
+    formats = list(formats)
+    items = []
+    for name, fig in (figures or {}).items():
+        fig_dict = fig.to_dict()
+        items.append({'name': name, 'figure': fig_dict, 'hash': hashlib.sha256(plotly.io.to_json(fig_dict).encode()).hexdigest()})
+    for spec in figure_specs or []:
+        name = os.path.splitext(os.path.relpath(spec['path'], 'plotting_output'))[0]
+        items.append({'name': name, 'spec': spec, 'hash': figure_spec_hash(spec)})
+    
+    manifest_path = os.path.join(output_dir, STATIC_MANIFEST_NAME)
+    manifest = {}
+    if changed_only and os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    export_settings = json.dumps({'formats': formats, 'scale': scale})
+    for item in items:
+        item['hash'] = hashlib.sha256((item['hash'] + export_settings).encode()).hexdigest()
+    items_to_export = [item for item in items if manifest.get(item['name']) != item['hash'] or not all(os.path.exists(os.path.join(output_dir, f"{item['name']}.{image_format}")) for image_format in formats)]
+    
+    if max_workers is None:
+        #each worker has a headless browser open, so dont use too many
+        max_workers = min(4, os.cpu_count()) if can_use_process_pool() else 1
+    max_workers = max(1, min(max_workers, len(items_to_export)))
+    #deal the items out so each worker gets a mix of big and small figures
+    chunks = [items_to_export[worker::max_workers] for worker in range(max_workers)]
+    timings = []
+    start = time.perf_counter()
+    try:
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for chunk_timings in executor.map(export_static_chunk, chunks, [formats] * max_workers, [scale] * max_workers, [output_dir] * max_workers):
+                    timings.extend(chunk_timings)
+        elif len(items_to_export) > 0:
+            timings = export_static_chunk(items_to_export, formats, scale, output_dir)
+    finally:
+        item_hashes = {item['name']: item['hash'] for item in items}
+        for timing in timings:
+            manifest[timing['name']] = item_hashes[timing['name']]
+        os.makedirs(output_dir, exist_ok=True)
+        write_file_atomic(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+    
+    timings = pd.DataFrame(timings, columns=['name', 'seconds']).sort_values('seconds', ascending=False).reset_index(drop=True)
+    if len(timings) > 0:
+        print(timings.to_string(index=False))
+    print(f'Exported {len(timings)} figures as {", ".join(formats)} to {output_dir} in {time.perf_counter() - start:.1f}s ({len(items) - len(timings)} unchanged) with {max_workers} worker(s)')
+    return timings
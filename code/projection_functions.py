@@ -4,12 +4,12 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
-import plotly.graph_objects as go
-import plotly.express as px
 import shutil
+import hashlib
+import json
+import importlib.util
 
-from utility_functions import get_latest_date_for_data_file
+from utility_functions import get_latest_date_for_data_file, write_atomic
 
 
 #############################################################
@@ -17,81 +17,53 @@ from utility_functions import get_latest_date_for_data_file
 #############################################################
 
 
-def project_energy_use(config):
+def project_energy_use(config, engine='batched', cache_dir=None):
+    """Project energy use for every economy in config['economies'].
+
+    engine='batched' steps all economies together on economy x year arrays (project_energy_use_batched), engine='numpy' runs the array kernel one economy at a time (project_energy_use_numpy) and engine='pandas' runs the original year by year df.loc loop (project_energy_use_pandas). They all return the same columns and are checked against the original per-row loop in engine_equivalence.py.
+    
+    If cache_dir is given, each economy's projection is saved there keyed by a hash of its entry and the start/end years, and only economies whose hash has changed are recomputed (see project_energy_use_cached).
+    """
+    if cache_dir is not None:
+        return project_energy_use_cached(config, cache_dir, engine=engine)
+    if engine == 'batched':
+        return project_energy_use_batched(config)
+    elif engine == 'numpy':
+        return project_energy_use_numpy(config)
+    elif engine == 'pandas':
+        return project_energy_use_pandas(config)
+    else:
+        raise ValueError(f'Unknown projection engine: {engine}')
+
+
+def project_energy_use_pandas(config):
     start_year = config['start_year']
     end_year = config['end_year']
+    years = np.arange(start_year, end_year + 1)
     all_projections = []
 
     for econ_entry in config['economies']:
         economy = econ_entry['name']
-        initial_data_growth_rate = econ_entry['initial_data_activity_growth_rate']
-        # initial_ai_growth_rate = econ_entry['initial_ai_training_activity_growth_rate']
-        initial_data_intensity_improvement_rate = econ_entry['initial_data_intensity_improvement_rate']
-        # initial_ai_intensity_improvement_rate = econ_entry['initial_ai_training_intensity_improvement_rate']
-        initial_ratio = econ_entry['initial_traditional_data_to_ai_training_ratio']
-        if 'initial_traditional_data_energy_pj' in econ_entry.keys():
-            initial_traditional_data_energy_pj = econ_entry['initial_traditional_data_energy_pj']
-        elif 'initial_traditional_data_energy_mw' in econ_entry.keys():
-            initial_traditional_data_energy_pj = ((econ_entry['initial_traditional_data_energy_mw'] * 8760) * 3.6) * 1e-6
-        elif 'initial_traditional_data_energy_mwh' in econ_entry.keys():
-            initial_traditional_data_energy_pj = (econ_entry['initial_traditional_data_energy_mwh'] * 3.6) * 1e-6
-        elif 'initial_traditional_data_energy_twh' in econ_entry.keys():
-            initial_traditional_data_energy_pj = econ_entry['initial_traditional_data_energy_twh'] * 3.6
-        else:
-            raise ValueError('Initial traditional_data energy not specified')
-        if 'initial_ai_training_energy_pj' in econ_entry.keys():
-            initial_ai_training_energy_pj = econ_entry['initial_ai_training_energy_pj']
-        elif 'initial_ai_training_energy_mw' in econ_entry.keys():
-            initial_ai_training_energy_pj = ((econ_entry['initial_ai_training_energy_mw'] * 8760) * 3.6) * 1e-6
-        elif 'initial_ai_training_energy_mwh' in econ_entry.keys():
-            initial_ai_training_energy_pj = (econ_entry['initial_ai_training_energy_mwh'] * 3.6) * 1e-6
-        elif 'initial_ai_training_energy_twh' in econ_entry.keys():
-            initial_ai_training_energy_pj = econ_entry['initial_ai_training_energy_twh'] * 3.6
-        else:
-            raise ValueError('Initial ai_training energy not specified')
-    
-        initial_energy_pj = initial_traditional_data_energy_pj + initial_ai_training_energy_pj
-        
-        scheduled_builds = econ_entry.get('scheduled_builds', [])
-        new_activity_growth_rates = econ_entry.get('new_activity_growth_rates', [])
-        new_intensity_improvement_rates = econ_entry.get('new_intensity_improvement_rates', [])
+        #units, step changes and scheduled builds are compiled into year indexed arrays/dicts once, rather than scanned every year
+        schedule = compile_economy_schedule(econ_entry, years)
         
-        years = np.arange(start_year, end_year + 1)
         df = pd.DataFrame(index=years)
         df['year'] = years
         df['economy'] = economy
         
-        # Set initial growth rates
-        df['data_growth_rate'] = initial_data_growth_rate
-        # df['ai_growth_rate'] = initial_ai_growth_rate
-        df['data_intensity_improvement_rate'] = initial_data_intensity_improvement_rate
+        # Set growth rates, intensity improvement rates and ratios. The step changes (new_activity_growth_rates and new_intensity_improvement_rates) are already applied from their year onwards
+        df['data_growth_rate'] = schedule['data_growth_rate']
+        df['data_intensity_improvement_rate'] = schedule['data_intensity_improvement_rate']
+        df['traditional_data_to_ai_training_ratio'] = schedule['traditional_data_to_ai_training_ratio']
         
-        df['traditional_data_to_ai_training_ratio'] = initial_ratio
-        # df['ai_intensity_improvement_rate'] = initial_ai_intensity_improvement_rate
-        # Apply any new growth rates based on the specified years and years after (also the ratio is applied too)
-        for new_rate in new_activity_growth_rates:
-            if economy =='02_BD':
-                breakpoint()
-            if new_rate['year'] in years:
-                if 'new_data_growth_rate' in new_rate.keys():
-                    df.loc[new_rate['year']:, 'data_growth_rate'] = new_rate['new_data_growth_rate']
-                if 'new_traditional_data_to_ai_training_ratio' in new_rate.keys():
-                    df.loc[new_rate['year']:,'traditional_data_to_ai_training_ratio'] = new_rate['new_traditional_data_to_ai_training_ratio']
-                # df.loc[new_rate['year']:, 'ai_growth_rate'] = new_rate['new_ai_growth_rate']
-        for new_rate in new_intensity_improvement_rates:
-            if new_rate['year'] in years:
-                df.loc[new_rate['year']:, 'data_intensity_improvement_rate'] = new_rate['new_data_intensity_improvement_rate']
-                # df.loc[new_rate['year']:, 'ai_intensity_improvement_rate'] = new_rate['new_ai_training_intensity_improvement_rate']
         # Initialize activity and intensity levels, basing them off energy. (its unimportant to know the actual activity, just to have a starting point)
-        df['traditional_data_activity'] = initial_traditional_data_energy_pj
-        df['ai_training_activity'] = initial_ai_training_energy_pj
+        df['traditional_data_activity'] = schedule['initial_traditional_data_energy_pj']
+        df['ai_training_activity'] = schedule['initial_ai_training_energy_pj']
         
-        df['data_intensity'] = 1
+        df['data_intensity'] = 1.0
         # Project activities, intensities, and scheduled builds over time
         
         for year in range(start_year + 1, end_year + 1):
-            if economy =='02_BD' and year > 2025:
-                breakpoint()
             prev_year = year - 1
             
             SCHEDULED_BUILD_FOUND = False
@@ -110,36 +82,23 @@ def project_energy_use(config):
             
             #wats going on here with weir resutls
             # Account for scheduled builds in the current year
-            for build in scheduled_builds:
-                if build['year'] == year:
-                    SCHEDULED_BUILD_FOUND = True
-                    if 'new_traditional_data_to_ai_training_ratio' in build.keys():
-                        df.loc[year, 'traditional_data_to_ai_training_ratio'] = build['new_traditional_data_to_ai_training_ratio']
-                    else:
-                        df.loc[year, 'traditional_data_to_ai_training_ratio'] = df.loc[prev_year, 'traditional_data_to_ai_training_ratio']
-                        
-                    if 'additional_energy_mw' in build.keys():
-                        total_energy = ((build['additional_energy_mw'] * 8760) * 3.6) * 1e-6
-                    elif 'additional_energy_pj' in build.keys():                    
-                        total_energy = build['additional_energy_pj']
-                    elif 'additional_energy_mwh' in build.keys():
-                        total_energy = (build['additional_energy_mwh'] * 3.6) * 1e-6
-                    elif 'additional_energy_twh' in build.keys():
-                        total_energy = build['additional_energy_twh'] * 3.6
-                    else:
-                        raise ValueError('Additional energy not specified')
-                    #calculate the energy use for data and ai_training using the ratio. This will either be based on the ratio from the previous year or a newly supplied ratio for this year:
-                    total_energy_ai_training = total_energy * (1 - df.loc[year, 'traditional_data_to_ai_training_ratio'])
-                    total_energy_data = total_energy * df.loc[year, 'traditional_data_to_ai_training_ratio']
-                    
-                    # Update activities based on the additional energy and current intensity
-                    
-                    df.loc[year, 'traditional_data_activity'] += total_energy_data / df.loc[year, 'data_intensity']
-                    df.loc[year, 'ai_training_activity'] += total_energy_ai_training / df.loc[year, 'data_intensity']
+            for total_energy, new_ratio in schedule['builds_by_year'].get(year, []):
+                SCHEDULED_BUILD_FOUND = True
+                if new_ratio is not None:
+                    df.loc[year, 'traditional_data_to_ai_training_ratio'] = new_ratio
+                else:
+                    df.loc[year, 'traditional_data_to_ai_training_ratio'] = df.loc[prev_year, 'traditional_data_to_ai_training_ratio']
                     
+                #calculate the energy use for data and ai_training using the ratio. This will either be based on the ratio from the previous year or a newly supplied ratio for this year:
+                total_energy_ai_training = total_energy * (1 - df.loc[year, 'traditional_data_to_ai_training_ratio'])
+                total_energy_data = total_energy * df.loc[year, 'traditional_data_to_ai_training_ratio']
+                
+                # Update activities based on the additional energy and current intensity
+                
+                df.loc[year, 'traditional_data_activity'] += total_energy_data / df.loc[year, 'data_intensity']
+                df.loc[year, 'ai_training_activity'] += total_energy_ai_training / df.loc[year, 'data_intensity']
+                
             if not SCHEDULED_BUILD_FOUND:
-                if economy =='18_CT':
-                    breakpoint()
                 # Apply growth rates to the activity levels since no scheduled builds were found. we woill apply the growth rate to sum of both activities and then multiply by the ratio to get the individual activities
                 # df.loc[year, 'data_activity'] *= (1 + data_growth_rate)
                 # df.loc[year, 'ai_training_activity'] *= (1 + ai_growth_rate)
@@ -160,4 +119,686 @@ def project_energy_use(config):
     combined_projections = pd.concat(all_projections)
     return combined_projections
 
+
+
+#############################################################
+# NumPy projection kernel
+#############################################################
+
+
+def energy_to_pj(entry, key_start, units=('pj', 'mw', 'mwh', 'twh')):
+    """Convert the first of {key_start}_{unit} found in entry to PJ. units sets the order the keys are looked for in, since the initial energy and the scheduled builds were written to check them in different orders."""
+    for unit in units:
+        key = f'{key_start}_{unit}'
+        if key in entry.keys():
+            value = entry[key]
+            if unit == 'pj':
+                return value
+            elif unit == 'mw':
+                return ((value * 8760) * 3.6) * 1e-6
+            elif unit == 'mwh':
+                return (value * 3.6) * 1e-6
+            elif unit == 'twh':
+                return value * 3.6
     return None
+
+
+def step_changes_to_array(initial_value, changes, key, years):
+    """Dense per-year array from a list of step changes (dicts with a year and key). Each change applies from its year onwards and where changes overlap the one listed later wins, same as applying df.loc[year:] = value for each change in order."""
+    start_year = years[0]
+    end_year = years[-1]
+    #keep the last listed change that starts in each year
+    change_in_year = {}
+    for order, change in enumerate(changes):
+        if key in change.keys() and start_year <= change['year'] <= end_year:
+            change_in_year[change['year'] - start_year] = (order, change[key])
+    
+    values = np.empty(len(years))
+    current_order = -1
+    current_value = float(initial_value)
+    for i in range(len(years)):
+        if i in change_in_year and change_in_year[i][0] > current_order:
+            current_order, current_value = change_in_year[i]
+        values[i] = current_value
+    return values
+
+
+def compile_economy_schedule(econ_entry, years):
+    """Compile one economy entry into a year indexed schedule, so the projection never has to scan the lists in the entry or convert units.
+
+    Returns a dict with the initial energies in PJ, dense per-year arrays for the growth rate, intensity improvement rate and ratio (with the scheduled build ratio overrides applied), the additional PJ from scheduled builds per year (in total and split into traditional data and ai training using that years ratio) and builds_by_year, a dict of year -> [(additional_energy_pj, new_ratio or None)] for O(1) lookups.
+    """
+    start_year = years[0]
+    end_year = years[-1]
+    n_years = len(years)
+    
+    initial_traditional_data_energy_pj = energy_to_pj(econ_entry, 'initial_traditional_data_energy')
+    if initial_traditional_data_energy_pj is None:
+        raise ValueError('Initial traditional_data energy not specified')
+    initial_ai_training_energy_pj = energy_to_pj(econ_entry, 'initial_ai_training_energy')
+    if initial_ai_training_energy_pj is None:
+        raise ValueError('Initial ai_training energy not specified')
+    
+    new_activity_growth_rates = econ_entry.get('new_activity_growth_rates', [])
+    new_intensity_improvement_rates = econ_entry.get('new_intensity_improvement_rates', [])
+    data_growth_rate = step_changes_to_array(econ_entry['initial_data_activity_growth_rate'], new_activity_growth_rates, 'new_data_growth_rate', years)
+    ratio = step_changes_to_array(econ_entry['initial_traditional_data_to_ai_training_ratio'], new_activity_growth_rates, 'new_traditional_data_to_ai_training_ratio', years)
+    data_intensity_improvement_rate = step_changes_to_array(econ_entry['initial_data_intensity_improvement_rate'], new_intensity_improvement_rates, 'new_data_intensity_improvement_rate', years)
+    
+    #the first year is never projected so builds in it are ignored
+    builds_by_year = {}
+    for build in econ_entry.get('scheduled_builds', []):
+        if start_year < build['year'] <= end_year:
+            additional_energy_pj = energy_to_pj(build, 'additional_energy', units=('mw', 'pj', 'mwh', 'twh'))
+            if additional_energy_pj is None:
+                raise ValueError('Additional energy not specified')
+            builds_by_year.setdefault(build['year'], []).append((additional_energy_pj, build.get('new_traditional_data_to_ai_training_ratio')))
+    
+    build_found = np.zeros(n_years, dtype=bool)
+    ratio_override = np.full(n_years, np.nan)
+    additional_energy_pj_by_year = np.zeros(n_years)
+    build_traditional_data_pj = np.zeros(n_years)
+    build_ai_training_pj = np.zeros(n_years)
+    #go in year order since a build without a ratio uses the previous years ratio (which may itself have been set by a build)
+    for year in sorted(builds_by_year.keys()):
+        i = year - start_year
+        build_found[i] = True
+        for additional_energy_pj, new_ratio in builds_by_year[year]:
+            ratio[i] = new_ratio if new_ratio is not None else ratio[i - 1]
+            additional_energy_pj_by_year[i] += additional_energy_pj
+            build_traditional_data_pj[i] += additional_energy_pj * ratio[i]
+            build_ai_training_pj[i] += additional_energy_pj * (1 - ratio[i])
+        ratio_override[i] = ratio[i]
+    
+    return {
+        'name': econ_entry['name'],
+        'initial_traditional_data_energy_pj': float(initial_traditional_data_energy_pj),
+        'initial_ai_training_energy_pj': float(initial_ai_training_energy_pj),
+        'data_growth_rate': data_growth_rate,
+        'data_intensity_improvement_rate': data_intensity_improvement_rate,
+        'traditional_data_to_ai_training_ratio': ratio,
+        'ratio_override': ratio_override,
+        'build_found': build_found,
+        'additional_energy_pj': additional_energy_pj_by_year,
+        'build_traditional_data_pj': build_traditional_data_pj,
+        'build_ai_training_pj': build_ai_training_pj,
+        'builds_by_year': builds_by_year,
+    }
+
+
+def projection_kernel(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, data_intensity_improvement_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj):
+    """Run the projection on plain float arrays (one value per year). Returns the activity arrays and the intensity array."""
+    #intensity doesnt depend on activity so it is just a cumulative product of the improvements (the first year is the base of 1)
+    intensity_factors = 1 - data_intensity_improvement_rate
+    intensity_factors[0] = 1.0
+    data_intensity = np.cumprod(intensity_factors)
+    
+    traditional_data_activity, ai_training_activity = activity_loop(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity)
+    return traditional_data_activity, ai_training_activity, data_intensity
+
+
+def activity_loop(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity):
+    """The year by year activity recurrence for one economy."""
+    #activity is the only part that has to be done year by year. Use python floats since indexing numpy arrays one value at a time is slow
+    growth = data_growth_rate.tolist()
+    ratios = ratio.tolist()
+    found = build_found.tolist()
+    build_data = build_traditional_data_pj.tolist()
+    build_ai = build_ai_training_pj.tolist()
+    intensities = data_intensity.tolist()
+    
+    n_years = len(growth)
+    traditional_data_activity = [float(initial_traditional_data_pj)] * n_years
+    ai_training_activity = [float(initial_ai_training_pj)] * n_years
+    data_activity = traditional_data_activity[0]
+    ai_activity = ai_training_activity[0]
+    for i in range(1, n_years):
+        if found[i]:
+            data_activity += build_data[i] / intensities[i]
+            ai_activity += build_ai[i] / intensities[i]
+        else:
+            data_activity += ((data_activity + ai_activity) * growth[i] * ratios[i])
+            ai_activity += (data_activity + ai_activity) * growth[i] * (1 - ratios[i])
+        traditional_data_activity[i] = data_activity
+        ai_training_activity[i] = ai_activity
+    
+    return np.array(traditional_data_activity), np.array(ai_training_activity)
+
+
+def projection_arrays_to_df(economy, years, schedule, traditional_data_activity, ai_training_activity, data_intensity):
+    #build the df in the same column order as project_energy_use_pandas
+    with np.errstate(divide='ignore', invalid='ignore'):
+        traditional_data_activity_indexed = traditional_data_activity / traditional_data_activity[1] * 100
+        ai_training_activity_indexed = ai_training_activity / ai_training_activity[1] * 100
+    df = pd.DataFrame({
+        'year': years,
+        'economy': economy,
+        'data_growth_rate': schedule['data_growth_rate'],
+        'data_intensity_improvement_rate': schedule['data_intensity_improvement_rate'],
+        'traditional_data_to_ai_training_ratio': schedule['traditional_data_to_ai_training_ratio'],
+        'traditional_data_activity': traditional_data_activity,
+        'ai_training_activity': ai_training_activity,
+        'data_intensity': data_intensity,
+        'traditional_data_energy_use': traditional_data_activity * data_intensity,
+        'ai_training_energy_use': ai_training_activity * data_intensity,
+        'traditional_data_activity_indexed': traditional_data_activity_indexed,
+        'ai_training_activity_indexed': ai_training_activity_indexed,
+    }, index=years)
+    return df
+
+
+def project_energy_use_numpy(config):
+    start_year = config['start_year']
+    end_year = config['end_year']
+    years = np.arange(start_year, end_year + 1)
+    all_projections = []
+    
+    for econ_entry in config['economies']:
+        schedule = compile_economy_schedule(econ_entry, years)
+        traditional_data_activity, ai_training_activity, data_intensity = projection_kernel(
+            schedule['initial_traditional_data_energy_pj'], schedule['initial_ai_training_energy_pj'],
+            schedule['data_growth_rate'], schedule['data_intensity_improvement_rate'], schedule['traditional_data_to_ai_training_ratio'],
+            schedule['build_found'], schedule['build_traditional_data_pj'], schedule['build_ai_training_pj'])
+        
+        df = projection_arrays_to_df(schedule['name'], years, schedule, traditional_data_activity, ai_training_activity, data_intensity)
+        all_projections.append(df)
+    
+    combined_projections = pd.concat(all_projections)
+    return combined_projections
+
+
+#############################################################
+# Batched (economy x year) projection engine
+#############################################################
+
+
+STACKED_SCHEDULE_KEYS = ['initial_traditional_data_energy_pj', 'initial_ai_training_energy_pj', 'data_growth_rate', 'data_intensity_improvement_rate', 'traditional_data_to_ai_training_ratio', 'build_found', 'build_traditional_data_pj', 'build_ai_training_pj']
+
+
+def stack_economy_arrays(config, years):
+    """Pack every economy's compiled schedule into 2-D (economy x year) arrays (the initial energies are 1-D, one per economy)."""
+    schedules = [compile_economy_schedule(econ_entry, years) for econ_entry in config['economies']]
+    economies = [schedule['name'] for schedule in schedules]
+    stacked = {key: np.stack([schedule[key] for schedule in schedules]) for key in STACKED_SCHEDULE_KEYS}
+    return economies, stacked
+
+
+def batched_projection_kernel(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, data_intensity_improvement_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, backend='numpy'):
+    """Same recurrence as projection_kernel but every input has a leading economy axis. The year by year activity recurrence is run by the kernel backend (see KERNEL_BACKENDS)."""
+    intensity_factors = 1 - data_intensity_improvement_rate
+    intensity_factors[:, 0] = 1.0
+    data_intensity = np.cumprod(intensity_factors, axis=1)
+    
+    recurrence = get_kernel_backend(backend)
+    traditional_data_activity, ai_training_activity = recurrence(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity)
+    return traditional_data_activity, ai_training_activity, data_intensity
+
+
+#############################################################
+# Kernel backends
+#############################################################
+#The activity in each year depends on the year before, so the recurrence can only be vectorised across economies, not years. Each backend runs it its own way on economy x year arrays and returns the (traditional data, ai training) activity arrays:
+#   numpy: one vectorised step over all the economies for each year (the default)
+#   python: projection_kernel's plain float loop, one economy at a time
+#   numba: the same loop as python but compiled with numba (if it is installed), which is fastest for many economies or monte carlo draws. It is compiled the first time it is used and cached in __pycache__
+#They all do the same float operations in the same order, so they should match project_energy_use_pandas (the reference) to rounding. Check that with engine_equivalence.py after changing any of them.
+#
+#batched_projection_kernel (the batched engine and the monte carlo) uses the backend named by kernel_backend in the config. auto picks the fastest one that is available.
+
+KERNEL_BACKEND_PREFERENCE = ['numba', 'numpy', 'python']
+#filled in by numba_recurrence the first time it is used
+_numba_recurrence = None
+#backends that have already printed that they arent installed, so the message is only printed once
+_missing_backends_reported = set()
+
+
+def numpy_recurrence(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity):
+    #work year major (year x economy) so each step reads and writes contiguous rows
+    growth = np.ascontiguousarray(data_growth_rate.T)
+    ratios = np.ascontiguousarray(ratio.T)
+    found = np.ascontiguousarray(build_found.T)
+    build_data = np.ascontiguousarray(build_traditional_data_pj.T)
+    build_ai = np.ascontiguousarray(build_ai_training_pj.T)
+    intensities = np.ascontiguousarray(data_intensity.T)
+    
+    n_economies, n_years = data_growth_rate.shape
+    traditional_data_activity = np.empty((n_years, n_economies))
+    ai_training_activity = np.empty((n_years, n_economies))
+    traditional_data_activity[0] = initial_traditional_data_pj
+    ai_training_activity[0] = initial_ai_training_pj
+    for i in range(1, n_years):
+        data_activity = traditional_data_activity[i - 1]
+        ai_activity = ai_training_activity[i - 1]
+        #growth years. The ai activity uses the already grown data activity, same as the original loop
+        grown_data_activity = data_activity + ((data_activity + ai_activity) * growth[i] * ratios[i])
+        grown_ai_activity = ai_activity + (grown_data_activity + ai_activity) * growth[i] * (1 - ratios[i])
+        #scheduled build years
+        built_data_activity = data_activity + build_data[i] / intensities[i]
+        built_ai_activity = ai_activity + build_ai[i] / intensities[i]
+        traditional_data_activity[i] = np.where(found[i], built_data_activity, grown_data_activity)
+        ai_training_activity[i] = np.where(found[i], built_ai_activity, grown_ai_activity)
+    
+    return traditional_data_activity.T, ai_training_activity.T
+
+
+def python_recurrence(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity):
+    n_economies, n_years = data_growth_rate.shape
+    initial_traditional_data_pj = np.broadcast_to(initial_traditional_data_pj, (n_economies,))
+    initial_ai_training_pj = np.broadcast_to(initial_ai_training_pj, (n_economies,))
+    traditional_data_activity = np.empty((n_economies, n_years))
+    ai_training_activity = np.empty((n_economies, n_years))
+    for e in range(n_economies):
+        traditional_data_activity[e], ai_training_activity[e] = activity_loop(initial_traditional_data_pj[e], initial_ai_training_pj[e], data_growth_rate[e], ratio[e], build_found[e], build_traditional_data_pj[e], build_ai_training_pj[e], data_intensity[e])
+    return traditional_data_activity, ai_training_activity
+
+
+def looped_recurrence(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity):
+    """The recurrence as simple loops over economies and years, for numba to compile. Slow if it is run without compiling."""
+    n_economies, n_years = data_growth_rate.shape
+    traditional_data_activity = np.empty((n_economies, n_years))
+    ai_training_activity = np.empty((n_economies, n_years))
+    for e in range(n_economies):
+        data_activity = initial_traditional_data_pj[e]
+        ai_activity = initial_ai_training_pj[e]
+        traditional_data_activity[e, 0] = data_activity
+        ai_training_activity[e, 0] = ai_activity
+        for i in range(1, n_years):
+            if build_found[e, i]:
+                data_activity = data_activity + build_traditional_data_pj[e, i] / data_intensity[e, i]
+                ai_activity = ai_activity + build_ai_training_pj[e, i] / data_intensity[e, i]
+            else:
+                data_activity = data_activity + ((data_activity + ai_activity) * data_growth_rate[e, i] * ratio[e, i])
+                ai_activity = ai_activity + (data_activity + ai_activity) * data_growth_rate[e, i] * (1 - ratio[e, i])
+            traditional_data_activity[e, i] = data_activity
+            ai_training_activity[e, i] = ai_activity
+    return traditional_data_activity, ai_training_activity
+
+
+def numba_recurrence(initial_traditional_data_pj, initial_ai_training_pj, data_growth_rate, ratio, build_found, build_traditional_data_pj, build_ai_training_pj, data_intensity):
+    global _numba_recurrence
+    #numba wants plain contiguous arrays, not the broadcast views the monte carlo makes
+    arrays = [np.ascontiguousarray(np.broadcast_to(initial_traditional_data_pj, data_growth_rate.shape[:1]), dtype=np.float64), np.ascontiguousarray(np.broadcast_to(initial_ai_training_pj, data_growth_rate.shape[:1]), dtype=np.float64)]
+    arrays += [np.ascontiguousarray(values, dtype=np.float64) for values in [data_growth_rate, ratio]]
+    arrays += [np.ascontiguousarray(build_found, dtype=np.bool_)]
+    arrays += [np.ascontiguousarray(values, dtype=np.float64) for values in [build_traditional_data_pj, build_ai_training_pj, data_intensity]]
+    if _numba_recurrence is not None:
+        return _numba_recurrence(*arrays)
+    #numba only compiles on the first call, so typing and compile errors show up there rather than at the import. Either way fall back to numpy for the rest of the run
+    try:
+        import numba
+        compiled_recurrence = numba.njit(cache=True)(looped_recurrence)
+        result = compiled_recurrence(*arrays)
+    except Exception as error:
+        #e.g. numba doesnt support the installed numpy yet
+        print(f'numba could not compile the kernel ({type(error).__name__}: {str(error).splitlines()[0] if str(error) else ""}), so the numpy kernel backend is used instead')
+        _numba_recurrence = numpy_recurrence
+        return numpy_recurrence(*arrays)
+    _numba_recurrence = compiled_recurrence
+    return result
+
+
+KERNEL_BACKENDS = {'numpy': numpy_recurrence, 'python': python_recurrence, 'numba': numba_recurrence}
+#what each backend needs installed
+KERNEL_BACKEND_REQUIREMENTS = {'numba': 'numba'}
+
+
+def available_kernel_backends():
+    return [backend for backend in KERNEL_BACKENDS if backend not in KERNEL_BACKEND_REQUIREMENTS or importlib.util.find_spec(KERNEL_BACKEND_REQUIREMENTS[backend]) is not None]
+
+
+def resolve_kernel_backend(backend):
+    """The name of the backend that will actually run for backend: auto becomes the first available one in KERNEL_BACKEND_PREFERENCE, and a backend that isnt installed falls back to numpy (with a message)."""
+    available = available_kernel_backends()
+    if backend == 'auto':
+        return [name for name in KERNEL_BACKEND_PREFERENCE if name in available][0]
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f'Unknown kernel backend: {backend}, it can be auto or one of {list(KERNEL_BACKENDS.keys())}')
+    if backend not in available:
+        if backend not in _missing_backends_reported:
+            _missing_backends_reported.add(backend)
+            print(f'The {backend} kernel backend needs {KERNEL_BACKEND_REQUIREMENTS[backend]}, which is not installed, so the numpy backend is used instead')
+        return 'numpy'
+    return backend
+
+
+def get_kernel_backend(backend='numpy'):
+    return KERNEL_BACKENDS[resolve_kernel_backend(backend)]
+
+
+def project_energy_use_batched(config):
+    start_year = config['start_year']
+    end_year = config['end_year']
+    years = np.arange(start_year, end_year + 1)
+    
+    economies, stacked = stack_economy_arrays(config, years)
+    traditional_data_activity, ai_training_activity, data_intensity = batched_projection_kernel(
+        stacked['initial_traditional_data_energy_pj'], stacked['initial_ai_training_energy_pj'],
+        stacked['data_growth_rate'], stacked['data_intensity_improvement_rate'], stacked['traditional_data_to_ai_training_ratio'],
+        stacked['build_found'], stacked['build_traditional_data_pj'], stacked['build_ai_training_pj'], backend=config.get('kernel_backend', 'numpy'))
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        traditional_data_activity_indexed = traditional_data_activity / traditional_data_activity[:, [1]] * 100
+        ai_training_activity_indexed = ai_training_activity / ai_training_activity[:, [1]] * 100
+    
+    #ravel the economy x year arrays into long format (economy major, so it is in the same order as concatenating each economy's df)
+    n_economies = len(economies)
+    combined_projections = pd.DataFrame({
+        'year': np.tile(years, n_economies),
+        'economy': np.repeat(economies, len(years)),
+        'data_growth_rate': stacked['data_growth_rate'].ravel(),
+        'data_intensity_improvement_rate': stacked['data_intensity_improvement_rate'].ravel(),
+        'traditional_data_to_ai_training_ratio': stacked['traditional_data_to_ai_training_ratio'].ravel(),
+        'traditional_data_activity': traditional_data_activity.ravel(),
+        'ai_training_activity': ai_training_activity.ravel(),
+        'data_intensity': data_intensity.ravel(),
+        'traditional_data_energy_use': (traditional_data_activity * data_intensity).ravel(),
+        'ai_training_energy_use': (ai_training_activity * data_intensity).ravel(),
+        'traditional_data_activity_indexed': traditional_data_activity_indexed.ravel(),
+        'ai_training_activity_indexed': ai_training_activity_indexed.ravel(),
+    }, index=np.tile(years, n_economies))
+    return combined_projections
+
+
+#############################################################
+# Monte Carlo uncertainty
+#############################################################
+
+
+MONTE_CARLO_PARAMETERS = ['data_growth_rate', 'data_intensity_improvement_rate', 'additional_energy']
+
+
+def sample_uncertainty_factors(rng, distribution, size):
+    """Sample multipliers (centred on 1) for one parameter of one economy. distribution is a dict from the monte_carlo section of parameters.yml, e.g. {'distribution': 'normal', 'sd': 0.2}."""
+    if distribution['distribution'] == 'normal':
+        #clip at 0 so a rate can't flip sign
+        return np.clip(1 + distribution['sd'] * rng.standard_normal(size), 0, None)
+    elif distribution['distribution'] == 'lognormal':
+        return np.exp(distribution['sigma'] * rng.standard_normal(size))
+    elif distribution['distribution'] == 'uniform':
+        return rng.uniform(distribution['low'], distribution['high'], size)
+    elif distribution['distribution'] == 'fixed':
+        return np.ones(size)
+    else:
+        raise ValueError(f"Unknown distribution: {distribution['distribution']}")
+
+
+#above max_exact_draws the percentiles come from a fixed size histogram of each value instead of keeping every draw, so memory doesnt grow with n_draws
+MONTE_CARLO_MAX_EXACT_DRAWS = 2000
+MONTE_CARLO_HISTOGRAM_BINS = 1000
+
+
+def new_band_histogram(values, n_bins=MONTE_CARLO_HISTOGRAM_BINS):
+    """A fixed size accumulator for the percentiles of each value in values (draws x ...). The bins are spread over the range of these first draws plus a quarter of it either side. Later draws outside that go in the end bins, and the exact min and max are kept so the percentiles never go past them."""
+    values = values.reshape(len(values), -1)
+    low = values.min(axis=0)
+    high = values.max(axis=0)
+    margin = (high - low) * 0.25
+    width = (high - low + 2 * margin) / n_bins
+    #values that are the same in every draw (e.g. an economy with no ai training) go in the first bin
+    width[width == 0] = 1.0
+    histogram = {'start': low - margin, 'width': width, 'min': low, 'max': high, 'n': 0, 'counts': np.zeros((values.shape[1], n_bins), dtype=np.int64)}
+    add_to_band_histogram(histogram, values)
+    return histogram
+
+
+def add_to_band_histogram(histogram, values):
+    values = values.reshape(len(values), -1)
+    n_values, n_bins = histogram['counts'].shape
+    bins = np.clip(np.floor((values - histogram['start']) / histogram['width']), 0, n_bins - 1).astype(np.int64)
+    histogram['counts'] += np.bincount((np.arange(n_values) * n_bins + bins).ravel(), minlength=n_values * n_bins).reshape(n_values, n_bins)
+    histogram['min'] = np.minimum(histogram['min'], values.min(axis=0))
+    histogram['max'] = np.maximum(histogram['max'], values.max(axis=0))
+    histogram['n'] += len(values)
+
+
+def band_histogram_percentiles(histogram, percentiles):
+    """The percentiles of each value, interpolated within the bin the percentile falls in (the draws in a bin are taken as evenly spread across it). They are within one bin width of np.percentile of all the draws."""
+    counts = histogram['counts']
+    cumulative = np.cumsum(counts, axis=1)
+    rows = np.arange(len(counts))
+    results = []
+    for percentile in percentiles:
+        #position of the percentile in the sorted draws, the same as np.percentile's default
+        rank = percentile / 100 * (histogram['n'] - 1)
+        index = np.minimum((cumulative <= rank).sum(axis=1), counts.shape[1] - 1)
+        before = cumulative[rows, index] - counts[rows, index]
+        fraction = np.clip((rank - before + 0.5) / np.maximum(counts[rows, index], 1), 0, 1)
+        results.append(np.clip(histogram['start'] + (index + fraction) * histogram['width'], histogram['min'], histogram['max']))
+    return results
+
+
+def project_energy_use_monte_carlo(config):
+    """Run the projection for many draws of the uncertain parameters at once and report percentile bands.
+
+    The growth rates, intensity improvement rates and scheduled build sizes of each economy are multiplied by factors sampled from config['monte_carlo']['distributions'] (an economy can override these with its own monte_carlo_distributions entry). Each factor is drawn once per economy per draw, so it compounds through the projection. Draws are run chunk_size at a time through batched_projection_kernel, with the draws and economies sharing the leading axis.
+
+    Up to max_exact_draws draws (MONTE_CARLO_MAX_EXACT_DRAWS by default) every draw is kept and the percentiles are exact, which takes about 12 bytes per draw per economy per year. Above that each chunk is added to fixed size histograms (see new_band_histogram) and dropped, so memory stays the same however many draws there are, and the percentiles are within a bin width (about 0.15% of the range of the draws) of the exact ones.
+
+    Returns (economy_bands, apec_bands): long format dfs with a _lower, _median and _upper column for each metric, by year and economy.
+    """
+    monte_carlo = config['monte_carlo']
+    n_draws = monte_carlo.get('n_draws', 10000)
+    chunk_size = monte_carlo.get('chunk_size', 500)
+    max_exact_draws = monte_carlo.get('max_exact_draws', MONTE_CARLO_MAX_EXACT_DRAWS)
+    percentiles = [monte_carlo.get('lower_percentile', 5), 50, monte_carlo.get('upper_percentile', 95)]
+    rng = np.random.default_rng(monte_carlo.get('seed', 1))
+    
+    years = np.arange(config['start_year'], config['end_year'] + 1)
+    economies, stacked = stack_economy_arrays(config, years)
+    n_economies = len(economies)
+    n_years = len(years)
+    distributions = [{**monte_carlo['distributions'], **econ_entry.get('monte_carlo_distributions', {})} for econ_entry in config['economies']]
+    
+    economy_metrics = ['traditional_data_energy_use', 'ai_training_energy_use', 'total_energy_use']
+    apec_metrics = ['traditional_data_activity', 'ai_training_activity', 'traditional_data_energy_use', 'ai_training_energy_use', 'data_intensity', 'total_energy_use']
+    keep_draws = n_draws <= max_exact_draws
+    economy_draws, apec_draws, economy_histograms, apec_histograms = {}, {}, {}, {}
+    if keep_draws:
+        #the economy values are kept as float32, they are only used for the bands
+        economy_draws = {metric: np.empty((n_draws, n_economies, n_years), dtype=np.float32) for metric in economy_metrics}
+        apec_draws = {metric: np.empty((n_draws, n_years)) for metric in apec_metrics}
+    
+    for chunk_start in range(0, n_draws, chunk_size):
+        n_chunk = min(chunk_size, n_draws - chunk_start)
+        factors = {parameter: np.empty((n_chunk, n_economies, 1)) for parameter in MONTE_CARLO_PARAMETERS}
+        for parameter in MONTE_CARLO_PARAMETERS:
+            for e in range(n_economies):
+                factors[parameter][:, e, 0] = sample_uncertainty_factors(rng, distributions[e][parameter], n_chunk)
+        
+        def draws(values, factor=None):
+            #broadcast an economy x year array over the draws in this chunk and flatten to (draws * economies) x year
+            values = np.broadcast_to(values, (n_chunk,) + values.shape)
+            if factor is not None:
+                values = values * factor
+            return values.reshape((n_chunk * n_economies,) + values.shape[2:])
+        
+        traditional_data_activity, ai_training_activity, data_intensity = batched_projection_kernel(
+            draws(stacked['initial_traditional_data_energy_pj']), draws(stacked['initial_ai_training_energy_pj']),
+            draws(stacked['data_growth_rate'], factors['data_growth_rate']),
+            draws(stacked['data_intensity_improvement_rate'], factors['data_intensity_improvement_rate']),
+            draws(stacked['traditional_data_to_ai_training_ratio']), draws(stacked['build_found']),
+            draws(stacked['build_traditional_data_pj'], factors['additional_energy']),
+            draws(stacked['build_ai_training_pj'], factors['additional_energy']), backend=config.get('kernel_backend', 'numpy'))
+        
+        shape = (n_chunk, n_economies, n_years)
+        traditional_data_activity = traditional_data_activity.reshape(shape)
+        ai_training_activity = ai_training_activity.reshape(shape)
+        economy_values = {
+            'traditional_data_energy_use': traditional_data_activity * data_intensity.reshape(shape),
+            'ai_training_energy_use': ai_training_activity * data_intensity.reshape(shape),
+        }
+        economy_values['total_energy_use'] = economy_values['traditional_data_energy_use'] + economy_values['ai_training_energy_use']
+        apec_values = {
+            'traditional_data_activity': traditional_data_activity.sum(axis=1),
+            'ai_training_activity': ai_training_activity.sum(axis=1),
+            'traditional_data_energy_use': economy_values['traditional_data_energy_use'].sum(axis=1),
+            'ai_training_energy_use': economy_values['ai_training_energy_use'].sum(axis=1),
+        }
+        #same as aggregate_apec_values, the APEC intensity is total energy over total activity
+        apec_values['total_energy_use'] = apec_values['traditional_data_energy_use'] + apec_values['ai_training_energy_use']
+        apec_values['data_intensity'] = apec_values['total_energy_use'] / (apec_values['traditional_data_activity'] + apec_values['ai_training_activity'])
+        
+        if keep_draws:
+            chunk = slice(chunk_start, chunk_start + n_chunk)
+            for metric in economy_metrics:
+                economy_draws[metric][chunk] = economy_values[metric]
+            for metric in apec_metrics:
+                apec_draws[metric][chunk] = apec_values[metric]
+        elif chunk_start == 0:
+            #the histogram bins are set from the first chunk
+            economy_histograms = {metric: new_band_histogram(economy_values[metric]) for metric in economy_metrics}
+            apec_histograms = {metric: new_band_histogram(apec_values[metric]) for metric in apec_metrics}
+        else:
+            for metric in economy_metrics:
+                add_to_band_histogram(economy_histograms[metric], economy_values[metric])
+            for metric in apec_metrics:
+                add_to_band_histogram(apec_histograms[metric], apec_values[metric])
+    
+    def add_bands(df, metric, draws, histograms):
+        if keep_draws:
+            lower, median, upper = np.percentile(draws[metric], percentiles, axis=0)
+        else:
+            lower, median, upper = band_histogram_percentiles(histograms[metric], percentiles)
+        df[f'{metric}_lower'] = lower.ravel()
+        df[f'{metric}_median'] = median.ravel()
+        df[f'{metric}_upper'] = upper.ravel()
+    
+    economy_bands = pd.DataFrame({'year': np.tile(years, n_economies), 'economy': np.repeat(economies, n_years)})
+    for metric in economy_metrics:
+        add_bands(economy_bands, metric, economy_draws, economy_histograms)
+    
+    apec_bands = pd.DataFrame({'year': years, 'economy': 'APEC'})
+    for metric in apec_metrics:
+        add_bands(apec_bands, metric, apec_draws, apec_histograms)
+    
+    return economy_bands, apec_bands
+
+
+#############################################################
+# Per-economy projection cache
+#############################################################
+
+
+#filled in by projection_source_hash the first time it is used
+_projection_source_hash = None
+
+
+def projection_source_hash():
+    """Hash of the source of this module, so any change to the schedules, kernels or engines means old cached results are not used."""
+    global _projection_source_hash
+    if _projection_source_hash is None:
+        with open(os.path.abspath(__file__), 'rb') as file:
+            _projection_source_hash = hashlib.sha256(file.read()).hexdigest()
+    return _projection_source_hash
+
+
+def economy_hash(econ_entry, start_year, end_year):
+    """Hash of everything that affects one economy's projection, including the projection code itself."""
+    content = {'economy': econ_entry, 'start_year': start_year, 'end_year': end_year, 'source': projection_source_hash()}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def read_cached_projection(cache_path, n_years):
+    """Read one economy's cached projection. Raises a ValueError if it doesnt have a row for each year."""
+    df = pd.read_feather(cache_path)
+    if len(df) != n_years:
+        raise ValueError(f'it has {len(df)} rows rather than {n_years}')
+    df.index = df['year'].to_numpy()
+    return df
+
+
+def project_energy_use_cached(config, cache_dir, engine='batched'):
+    """project_energy_use, but each economy's projection is stored in cache_dir as projection_{economy}_{hash}.feather and only the economies whose hash has changed are recomputed (in one call to the engine). Returns the same df as project_energy_use.
+
+    Entries with the same name but different parameters (e.g. the same economy in two scenarios) get their own files, and cached files for an economy that no entry in the config uses any more are removed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    start_year = config['start_year']
+    end_year = config['end_year']
+    n_years = end_year - start_year + 1
+    
+    cache_paths = []
+    economies_to_project = {}
+    cached_projections = {}
+    for econ_entry in config['economies']:
+        cache_path = os.path.join(cache_dir, f"projection_{econ_entry['name']}_{economy_hash(econ_entry, start_year, end_year)}.feather")
+        cache_paths.append(cache_path)
+        if cache_path in cached_projections or cache_path in economies_to_project:
+            continue
+        if os.path.exists(cache_path):
+            #a cached file that cant be read (e.g. from an older version of pyarrow) is projected again rather than stopping the run
+            try:
+                df = read_cached_projection(cache_path, n_years)
+                cached_projections[cache_path] = df
+                continue
+            except (OSError, ValueError, KeyError) as error:
+                print(f'Could not read the cached projection {cache_path} ({error}), so it will be projected again')
+        economies_to_project[cache_path] = econ_entry
+    
+    new_projections = {}
+    if len(economies_to_project) > 0:
+        print(f'Projecting {len(economies_to_project)} of {len(config["economies"])} economies, the rest are from the cache in {cache_dir}')
+        projections = project_energy_use({**config, 'economies': list(economies_to_project.values())}, engine=engine)
+        #each economy is a block of n_years rows, in the order they were passed in
+        for i, cache_path in enumerate(economies_to_project.keys()):
+            df = projections.iloc[i * n_years:(i + 1) * n_years]
+            #written through a temp file, so an interrupted run cant leave a truncated file that looks like a cache hit
+            write_atomic(cache_path, lambda temp_path: df.reset_index(drop=True).to_feather(temp_path))
+            new_projections[cache_path] = df
+        #remove the old cached versions of these economies
+        economies = set(economies_to_project[cache_path]['name'] for cache_path in economies_to_project.keys())
+        current_files = set(os.path.basename(cache_path) for cache_path in cache_paths)
+        for file in os.listdir(cache_dir):
+            economy = re.sub(r'^projection_(.*)_[0-9a-f]{16}\.feather$', r'\1', file)
+            if economy in economies and file not in current_files:
+                os.remove(os.path.join(cache_dir, file))
+    
+    all_projections = [new_projections[cache_path] if cache_path in new_projections else cached_projections[cache_path] for cache_path in cache_paths]
+    combined_projections = pd.concat(all_projections)
+    return combined_projections
+
+
+#############################################################
+# Scenarios
+#############################################################
+
+
+#used when parameters.yml has no scenarios, both get the base parameters
+DEFAULT_SCENARIOS = {'reference': {}, 'target': {}}
+
+
+def resolve_scenario_variants(config):
+    """Apply each scenario's per-economy overrides (config['scenarios'][scenario]['economies'][economy] = {parameter: value}) to the base economies, and group scenarios that end up with identical parameters.
+
+    Returns (variant_configs, scenario_variants): a config for each distinct set of parameters, and {scenario: index of its variant_config}.
+    """
+    scenarios = config.get('scenarios') or DEFAULT_SCENARIOS
+    economy_names = [econ_entry['name'] for econ_entry in config['economies']]
+    variant_configs = []
+    variant_keys = {}
+    scenario_variants = {}
+    for scenario, scenario_entry in scenarios.items():
+        overrides = (scenario_entry or {}).get('economies') or {}
+        unknown_economies = [economy for economy in overrides.keys() if economy not in economy_names]
+        if len(unknown_economies) > 0:
+            raise ValueError(f'Scenario {scenario} has overrides for economies that are not in the config: {unknown_economies}')
+        economies = [{**econ_entry, **(overrides.get(econ_entry['name']) or {})} for econ_entry in config['economies']]
+        key = json.dumps(economies, sort_keys=True, default=str)
+        if key not in variant_keys:
+            variant_keys[key] = len(variant_configs)
+            variant_configs.append({**config, 'economies': economies})
+        scenario_variants[scenario] = variant_keys[key]
+    return variant_configs, scenario_variants
+
+
+def project_energy_use_scenarios(config, engine='batched', cache_dir=None):
+    """Project every scenario in config['scenarios'] in one pass of the engine. Scenarios with identical parameters are only projected (and stored) once.
+
+    Returns (projections, scenario_variants): the projections with a variant column (see resolve_scenario_variants), and {scenario: variant}.
+    """
+    variant_configs, scenario_variants = resolve_scenario_variants(config)
+    all_economies = [econ_entry for variant_config in variant_configs for econ_entry in variant_config['economies']]
+    projections = project_energy_use({**config, 'economies': all_economies}, engine=engine, cache_dir=cache_dir)
+    n_years = config['end_year'] - config['start_year'] + 1
+    projections['variant'] = np.repeat(np.arange(len(variant_configs)), len(config['economies']) * n_years)
+    return projections, scenario_variants
@@ -0,0 +1,138 @@
+#%%
+import datetime as datetime
+import os
+import re
+import copy
+import itertools
+import yaml
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+import projection_functions as projection_functions
+import data_processing as data_processing
+from utility_functions import find_project_root
+
+#############################################################
+# Scenario sweeps over parameter overrides
+#############################################################
+#Run project_energy_use and aggregate_apec_values for many sets of overrides on top of the base config, across a process pool. Run this as its own script (like estimate_inputs.py), since the process pool needs the if __name__ == '__main__' guard on windows.
+#
+#An override is a dict. These keys are understood:
+#   economies: list of economy names the override applies to (defaults to all economies)
+#   start_year / end_year: replace the years in the config
+#   build_size_multiplier: multiply the additional_energy_* of every scheduled build
+#   new_data_growth_rate: replace the new_data_growth_rate of every new_activity_growth_rates entry (new_data_growth_rate_multiplier multiplies them instead)
+#   any other key: set that key in each economy entry, or if it ends in _multiplier, multiply the key without the _multiplier (e.g. initial_data_activity_growth_rate_multiplier)
+
+SWEEP_OUTPUT_METRICS = ['traditional_data_energy_use', 'ai_training_energy_use', 'total_energy_use']
+
+#filled in by init_sweep_worker so the base config is only sent to each worker once
+_worker_config = None
+
+
+def build_sweep_cases(grid=None, cases=None):
+    """Make the list of overrides to run. grid is a dict of key -> list of values and every combination of them is a case, cases is a list of override dicts that are run as they are. Both can be given."""
+    all_cases = []
+    if grid is not None:
+        keys = list(grid.keys())
+        for values in itertools.product(*[grid[key] for key in keys]):
+            all_cases.append(dict(zip(keys, values)))
+    if cases is not None:
+        all_cases.extend(cases)
+    return all_cases
+
+
+def apply_overrides(config, overrides):
+    """Return a copy of config with the overrides applied (see the top of this file for the keys)."""
+    config = copy.deepcopy(config)
+    economies_to_change = overrides.get('economies', None)
+    for key, value in overrides.items():
+        if key == 'economies':
+            continue
+        elif key in ['start_year', 'end_year']:
+            config[key] = value
+            continue
+        for econ_entry in config['economies']:
+            if economies_to_change is not None and econ_entry['name'] not in economies_to_change:
+                continue
+            if key == 'build_size_multiplier':
+                for build in econ_entry.get('scheduled_builds', []):
+                    for build_key in build.keys():
+                        if build_key.startswith('additional_energy_'):
+                            build[build_key] = build[build_key] * value
+            elif key in ['new_data_growth_rate', 'new_data_growth_rate_multiplier']:
+                for new_rate in econ_entry.get('new_activity_growth_rates', []):
+                    if 'new_data_growth_rate' in new_rate.keys():
+                        new_rate['new_data_growth_rate'] = new_rate['new_data_growth_rate'] * value if key.endswith('_multiplier') else value
+            elif key.endswith('_multiplier'):
+                econ_entry[key[:-len('_multiplier')]] = econ_entry[key[:-len('_multiplier')]] * value
+            else:
+                econ_entry[key] = value
+    return config
+
+
+def init_sweep_worker(config):
+    global _worker_config
+    _worker_config = config
+
+
+def run_sweep_case(args):
+    """Run one case in a worker. Returns a tidy df of year, economy and the energy use metrics for each economy and APEC."""
+    scenario_id, overrides, years = args
+    case_config = apply_overrides(_worker_config, overrides)
+    projections = projection_functions.project_energy_use(case_config)
+    apec_aggregate = data_processing.aggregate_apec_values(projections, case_config)
+
+    projections = projections.reset_index(drop=True)
+    projections['total_energy_use'] = projections['traditional_data_energy_use'] + projections['ai_training_energy_use']
+    results = pd.concat([projections[['year', 'economy'] + SWEEP_OUTPUT_METRICS], apec_aggregate[['year', 'economy'] + SWEEP_OUTPUT_METRICS]], ignore_index=True)
+    if years is not None:
+        results = results.loc[results['year'].isin(years)]
+    results.insert(0, 'scenario_id', scenario_id)
+    return results
+
+
+def run_scenario_sweep(config, grid=None, cases=None, years=None, max_workers=None, chunksize=None):
+    """Run every case from build_sweep_cases(grid, cases) across a process pool and collect the results into one tidy table keyed by scenario_id.
+
+    years limits the rows kept for each case (e.g. [2050, 2070]) so large sweeps stay small. Returns (results, scenarios) where scenarios has one row per scenario_id with its overrides.
+    """
+    all_cases = build_sweep_cases(grid, cases)
+    if len(all_cases) == 0:
+        raise ValueError('No sweep cases to run')
+    #the sweep is for comparing central values, so dont run the monte carlo for every case
+    config = copy.deepcopy(config)
+    config['confidence_interval_method'] = 'simple'
+
+    tasks = [(scenario_id, overrides, years) for scenario_id, overrides in enumerate(all_cases)]
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_sweep_worker, initargs=(config,)) as executor:
+        all_results = list(executor.map(run_sweep_case, tasks, chunksize=chunksize))
+    results = pd.concat(all_results, ignore_index=True)
+
+    scenarios = pd.DataFrame([{'scenario_id': scenario_id, **{key: str(value) if isinstance(value, list) else value for key, value in overrides.items()}} for scenario_id, overrides in enumerate(all_cases)])
+    return results, scenarios
+
+
+#%%
+if __name__ == '__main__':
+    # Change directory to the root of the project (the folder with config/parameters.yml)
+    os.chdir(find_project_root())
+
+    with open('config/parameters.yml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    grid = {
+        'initial_data_activity_growth_rate_multiplier': [0.5, 0.75, 1, 1.25, 1.5],
+        'new_data_growth_rate_multiplier': [0.5, 0.75, 1, 1.25, 1.5],
+        'build_size_multiplier': [0.5, 1, 1.5, 2],
+    }
+    results, scenarios = run_scenario_sweep(config, grid=grid, years=[2050, 2070])
+    file_date = datetime.datetime.now().strftime("%Y%m%d")
+    results.merge(scenarios, on='scenario_id').to_csv(os.path.join('output_data', f'scenario_sweep_{file_date}.csv'), index=False)
+    print(f'Saved {len(scenarios)} sweep scenarios to output_data/scenario_sweep_{file_date}.csv')
+#%%
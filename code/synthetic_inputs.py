@@ -0,0 +1,214 @@
+#%%
+import os
+import re
+import copy
+import argparse
+import yaml
+import numpy as np
+import pandas as pd
+
+from utility_functions import OUTLOOK_ID_COLUMNS, find_project_root
+
+#############################################################
+# Synthetic configs and outlook files for testing and timing
+#############################################################
+#generate_synthetic_config makes a config in the same schema as config/parameters.yml for any number of economies, and write_synthetic_outlook_files makes merged_file_energy csvs to go with it, so the whole pipeline can be run (or timed by benchmark.py) without the real inputs. Everything comes from one seed, so the same arguments always give exactly the same files. Run it as its own script, e.g.
+#   python code/synthetic_inputs.py --economies 500 --density dense --seed 1 --output-dir synthetic
+#which writes synthetic/config/parameters.yml and synthetic/input_data/...
+#
+#The economies are named like 01_SYNA ... 99_SYNA, 01_SYNB ... so they match the two digit code and letters that DatedFileCatalog expects. Each economy gets a random mix of the pj/mw/mwh/twh keys for its initial energies and builds, so the unit conversions are all exercised.
+
+SYNTHETIC_INITIAL_UNITS = ['pj', 'mw', 'mwh', 'twh']
+SYNTHETIC_BUILD_UNITS = ['mw', 'pj', 'mwh', 'twh']
+#how likely each year is to have a scheduled build or a step change in each of the rate lists
+SYNTHETIC_DENSITIES = {
+    'none': {'build_probability': 0, 'rate_change_probability': 0},
+    'sparse': {'build_probability': 0.1, 'rate_change_probability': 0.05},
+    'dense': {'build_probability': 1, 'rate_change_probability': 0.5},
+}
+#used when there is no base config to take the other settings from
+SYNTHETIC_BASE_SETTINGS = {
+    'start_year': 2021,
+    'end_year': 2070,
+    'confidence_intervals_percentage_error': {'traditional_data_activity': 0.2, 'ai_training_activity': 1, 'data_intensity': 0.05},
+    'scenarios': {'reference': {}, 'target': {}},
+    'confidence_interval_method': 'simple',
+}
+#the rows in each synthetic merged_file_energy file: (sectors, sub1sectors, sub2sectors, fuels). The buildings and total final consumption electricity rows are what import_and_compare_to_outlook_results uses, the industry rows are there so it has something to filter out
+SYNTHETIC_OUTLOOK_ROWS = [
+    ('16_other_sector', '16_01_buildings', '16_01_01_commercial_and_public_services', '17_electricity'),
+    ('16_other_sector', '16_01_buildings', '16_01_01_commercial_and_public_services', '08_gas'),
+    ('16_other_sector', '16_01_buildings', '16_01_02_residential', '17_electricity'),
+    ('16_other_sector', '16_01_buildings', '16_01_02_residential', '07_petroleum_products'),
+    ('16_other_sector', '16_01_buildings', '16_01_02_residential', '08_gas'),
+    ('14_industry_sector', 'x', 'x', '17_electricity'),
+    ('14_industry_sector', 'x', 'x', '08_gas'),
+    ('12_total_final_consumption', 'x', 'x', '17_electricity'),
+    ('12_total_final_consumption', 'x', 'x', '08_gas'),
+]
+PJ_PER_UNIT = {'pj': 1, 'mw': 8760 * 3.6 * 1e-6, 'mwh': 3.6 * 1e-6, 'twh': 3.6}
+
+
+def synthetic_economy_name(index):
+    """01_SYNA for index 0, 99_SYNA for 98, 01_SYNB for 99 and so on."""
+    number = index % 99 + 1
+    letters = ''
+    group = index // 99
+    while True:
+        letters = chr(ord('A') + group % 26) + letters
+        group = group // 26 - 1
+        if group < 0:
+            break
+    return f'{number:02d}_SYN{letters}'
+
+
+def random_step_changes(rng, years, probability, key, ratio_key=None):
+    """A list of step changes (dicts with year and key) for the years picked with the given probability, in year order like parameters.yml. If ratio_key is given about half of them also change the ratio."""
+    changes = []
+    for year in years[rng.random(len(years)) < probability]:
+        change = {'year': int(year), key: round(float(rng.uniform(0.005, 0.15)), 4)}
+        if ratio_key is not None and rng.random() < 0.5:
+            change[ratio_key] = round(float(rng.uniform(0.5, 0.9999)), 4)
+        changes.append(change)
+    return changes
+
+
+def generate_synthetic_economy(rng, name, start_year, end_year, density='sparse'):
+    """One economy entry with random values in the ranges of the real ones."""
+    if density not in SYNTHETIC_DENSITIES:
+        raise ValueError(f'density must be one of {list(SYNTHETIC_DENSITIES.keys())}, not {density}')
+    probabilities = SYNTHETIC_DENSITIES[density]
+    econ_entry = {
+        'name': name,
+        'initial_data_activity_growth_rate': round(float(rng.uniform(0.02, 0.15)), 4),
+        'initial_traditional_data_to_ai_training_ratio': round(float(rng.uniform(0.8, 0.9999)), 4),
+        'initial_data_intensity_improvement_rate': round(float(rng.uniform(0.005, 0.04)), 4),
+    }
+    #initial energies are drawn in pj and then written in a random unit
+    initial_energy_pj = {
+        'initial_traditional_data_energy': float(rng.lognormal(np.log(20), 1)),
+        'initial_ai_training_energy': 0.0 if rng.random() < 0.5 else float(rng.lognormal(np.log(2), 1)),
+    }
+    for key_start, energy_pj in initial_energy_pj.items():
+        unit = SYNTHETIC_INITIAL_UNITS[rng.integers(len(SYNTHETIC_INITIAL_UNITS))]
+        econ_entry[f'{key_start}_{unit}'] = round(energy_pj / PJ_PER_UNIT[unit], 6)
+
+    #builds and step changes can be in any year after the start year
+    years = np.arange(start_year + 1, end_year + 1)
+    scheduled_builds = []
+    for year in years[rng.random(len(years)) < probabilities['build_probability']]:
+        unit = SYNTHETIC_BUILD_UNITS[rng.integers(len(SYNTHETIC_BUILD_UNITS))]
+        build = {'year': int(year), f'additional_energy_{unit}': round(float(rng.uniform(10, 500)) * PJ_PER_UNIT['mw'] / PJ_PER_UNIT[unit], 6)}
+        if rng.random() < 0.5:
+            build['new_traditional_data_to_ai_training_ratio'] = round(float(rng.uniform(0.5, 0.9999)), 4)
+        scheduled_builds.append(build)
+    new_activity_growth_rates = random_step_changes(rng, years, probabilities['rate_change_probability'], 'new_data_growth_rate', ratio_key='new_traditional_data_to_ai_training_ratio')
+    new_intensity_improvement_rates = random_step_changes(rng, years, probabilities['rate_change_probability'], 'new_data_intensity_improvement_rate')
+    #like parameters.yml, the lists are left out when they are empty
+    for key, changes in [('scheduled_builds', scheduled_builds), ('new_activity_growth_rates', new_activity_growth_rates), ('new_intensity_improvement_rates', new_intensity_improvement_rates)]:
+        if len(changes) > 0:
+            econ_entry[key] = changes
+    return econ_entry
+
+
+def generate_synthetic_config(n_economies, seed=0, density='sparse', base_config=None, start_year=None, end_year=None):
+    """Make a config with n_economies synthetic economies. The other settings (years, scenarios, monte_carlo etc.) are copied from base_config, or SYNTHETIC_BASE_SETTINGS if it is None. The same arguments always give the same config."""
+    if base_config is None:
+        base_config = SYNTHETIC_BASE_SETTINGS
+    config = copy.deepcopy({key: value for key, value in base_config.items() if key not in ['economies', 'economies_list']})
+    if start_year is not None:
+        config['start_year'] = start_year
+    if end_year is not None:
+        config['end_year'] = end_year
+    #the economies each get their own generator from the seed, so economy i is the same whatever n_economies is
+    economy_seeds = np.random.SeedSequence(seed).spawn(n_economies)
+    config['economies'] = [generate_synthetic_economy(np.random.default_rng(economy_seed), synthetic_economy_name(index), config['start_year'], config['end_year'], density) for index, economy_seed in enumerate(economy_seeds)]
+    config['economies_list'] = [econ_entry['name'] for econ_entry in config['economies']]
+    return config
+
+
+def generate_synthetic_outlook_energy(config, seed=0, first_year=1980, scenarios=('reference', 'target')):
+    """Make the wide outlook data (OUTLOOK_ID_COLUMNS then a string column for each year from first_year to the config end_year) for every economy in config and 00_APEC. Returns a dict of economy -> df.
+
+    Each economy has the rows in SYNTHETIC_OUTLOOK_ROWS growing at a random rate, plus a 19_total subtotal row for each sub2sector, and 00_APEC is the sum of the economies.
+    """
+    years = np.arange(first_year, config['end_year'] + 1)
+    year_columns = [str(year) for year in years]
+    n_rows = len(SYNTHETIC_OUTLOOK_ROWS)
+    economy_seeds = np.random.SeedSequence([seed, 1]).spawn(len(config['economies_list']))
+    outlook_energy = {}
+    for economy, economy_seed in zip(config['economies_list'], economy_seeds):
+        rng = np.random.default_rng(economy_seed)
+        economy_data = []
+        for scenario in scenarios:
+            labels = pd.DataFrame(SYNTHETIC_OUTLOOK_ROWS, columns=['sectors', 'sub1sectors', 'sub2sectors', 'fuels'])
+            #smooth growth from a random starting level, with a little noise
+            start_values = rng.lognormal(np.log(50), 1, size=(n_rows, 1))
+            growth_rates = rng.uniform(-0.01, 0.04, size=(n_rows, 1))
+            values = start_values * (1 + growth_rates) ** (years - first_year) * rng.uniform(0.97, 1.03, size=(n_rows, len(years)))
+            #total final consumption is the sum of the sectors, so make it the biggest row
+            values[labels['sectors'].to_numpy()=='12_total_final_consumption'] *= 10
+            rows = pd.concat([labels, pd.DataFrame(values.round(6), columns=year_columns)], axis=1)
+            rows['subtotal_layout'] = False
+            rows['subtotal_results'] = False
+            subtotals = rows.loc[rows['sectors']=='16_other_sector'].groupby(['sectors', 'sub1sectors', 'sub2sectors'], as_index=False)[year_columns].sum()
+            subtotals['fuels'] = '19_total'
+            subtotals['subtotal_layout'] = False
+            subtotals['subtotal_results'] = True
+            rows = pd.concat([rows, subtotals], ignore_index=True)
+            rows['scenarios'] = scenario
+            economy_data.append(rows)
+        economy_data = pd.concat(economy_data, ignore_index=True)
+        economy_data['economy'] = economy
+        for col in ['sub3sectors', 'sub4sectors', 'subfuels']:
+            economy_data[col] = 'x'
+        outlook_energy[economy] = economy_data[OUTLOOK_ID_COLUMNS + year_columns]
+
+    apec = pd.concat(outlook_energy.values(), ignore_index=True).groupby([col for col in OUTLOOK_ID_COLUMNS if col != 'economy'], sort=False, as_index=False)[year_columns].sum()
+    apec['economy'] = '00_APEC'
+    outlook_energy = {'00_APEC': apec[OUTLOOK_ID_COLUMNS + year_columns], **outlook_energy}
+    return outlook_energy
+
+
+def write_synthetic_outlook_files(config, root='input_data', seed=0, file_date='20240101', first_year=1980):
+    """Write the data from generate_synthetic_outlook_energy where main.py looks for it: root/merged_file_energy_00_APEC_{file_date}.csv and root/{economy}/merged_file_energy_{economy}_{file_date}.csv. Returns the paths."""
+    paths = []
+    for economy, df in generate_synthetic_outlook_energy(config, seed=seed, first_year=first_year).items():
+        folder = root if economy == '00_APEC' else os.path.join(root, economy)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'merged_file_energy_{economy}_{file_date}.csv')
+        df.to_csv(path, index=False)
+        paths.append(path)
+    print(f'Saved {len(paths)} synthetic merged_file_energy files to {root}')
+    return paths
+
+
+def write_synthetic_inputs(output_dir, n_economies, seed=0, density='sparse', base_config=None, start_year=None, end_year=None, file_date='20240101'):
+    """Write a synthetic output_dir/config/parameters.yml and the matching output_dir/input_data files. Returns the config."""
+    config = generate_synthetic_config(n_economies, seed=seed, density=density, base_config=base_config, start_year=start_year, end_year=end_year)
+    os.makedirs(os.path.join(output_dir, 'config'), exist_ok=True)
+    with open(os.path.join(output_dir, 'config', 'parameters.yml'), 'w') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+    write_synthetic_outlook_files(config, root=os.path.join(output_dir, 'input_data'), seed=seed, file_date=file_date)
+    return config
+
+
+#%%
+if __name__ == '__main__':
+    # Change directory to the root of the project (the folder with config/parameters.yml)
+    os.chdir(find_project_root())
+
+    parser = argparse.ArgumentParser(description='Write a synthetic parameters.yml and merged_file_energy files')
+    parser.add_argument('--economies', type=int, default=21)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--density', default='sparse', choices=list(SYNTHETIC_DENSITIES.keys()), help='how many scheduled builds and rate changes each economy has')
+    parser.add_argument('--end-year', type=int, default=None)
+    parser.add_argument('--output-dir', default='synthetic', help='folder to write config/parameters.yml and input_data to')
+    parser.add_argument('--file-date', default='20240101', help='date in the merged_file_energy file names (fixed so repeat runs write the same files)')
+    args = parser.parse_args()
+
+    #the settings other than the economies come from the real parameters.yml
+    with open('config/parameters.yml', 'r') as file:
+        base_config = yaml.safe_load(file)
+    write_synthetic_inputs(args.output_dir, args.economies, seed=args.seed, density=args.density, base_config=base_config, end_year=args.end_year, file_date=args.file_date)
+#%%
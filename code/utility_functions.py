@@ -4,10 +4,31 @@ import yaml
 import numpy as np
 import pandas as pd
 import re
-from scipy.stats import norm
-import plotly.graph_objects as go
-import plotly.express as px
 import shutil
+import time
+import tempfile
+
+
+#set this to the project folder to override find_project_root
+PROJECT_ROOT_ENV_VAR = 'DATA_CENTRES_ROOT'
+
+
+def find_project_root(start=None):
+    """Find the project folder (the one with config/parameters.yml) from the DATA_CENTRES_ROOT environment variable if it is set, else by looking up from start and then from the folder this file is in. Unlike splitting the working directory on 'data-centres' it works from any working directory and whatever the folder is called."""
+    if os.environ.get(PROJECT_ROOT_ENV_VAR):
+        return os.path.abspath(os.environ[PROJECT_ROOT_ENV_VAR])
+    start_folders = [start] if start is not None else []
+    start_folders.append(os.path.dirname(os.path.abspath(__file__)))
+    for folder in start_folders:
+        folder = os.path.abspath(folder)
+        while True:
+            if os.path.exists(os.path.join(folder, 'config', 'parameters.yml')):
+                return folder
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                break
+            folder = parent
+    raise ValueError(f'Could not find the project root (a folder with config/parameters.yml) above {start_folders}. Set {PROJECT_ROOT_ENV_VAR} to it')
 
 
 def get_latest_date_for_data_file(data_folder_path, file_name_start, file_name_end='', EXCLUDE_DATE_STR_START=False):
@@ -33,10 +54,10 @@ def get_latest_date_for_data_file(data_folder_path, file_name_start, file_name_e
         all_files = [file for file in all_files if file_name_start in file]
     else:
         all_files = [file for file in all_files if file_name_start in file and file_name_end in file]
-    #drop any files with no date in the name
-    all_files = [file for file in all_files if re.search(regex_pattern_date, file)]
-    #get the date from the file name
-    all_files = [re.search(regex_pattern_date, file).group() for file in all_files]
+    #get the date from the file name (dropping any files with no date in the name)
+    regex_pattern_date = re.compile(regex_pattern_date)
+    all_files = [regex_pattern_date.search(file) for file in all_files]
+    all_files = [match.group() for match in all_files if match is not None]
     #convert the dates to datetime objects
     all_files = [datetime.datetime.strptime(date, '%Y%m%d') for date in all_files]
     #get the latest date
@@ -51,3 +72,179 @@ def get_latest_date_for_data_file(data_folder_path, file_name_start, file_name_e
     #convert the latest date to a string
     latest_date = latest_date.strftime('%Y%m%d')
     return latest_date
+
+
+class DatedFileCatalog:
+    """Index of the dated files (e.g. merged_file_energy_01_AUS_20240905.csv) under one or more root folders, so the latest file for a prefix and economy can be looked up without listing folders or parsing dates each time.
+
+    File names are split into prefix, economy, date and suffix (merged_file_energy, 01_AUS, 20240905, _TGT1.csv) and indexed by the folder they are in, so a lookup only finds files directly in the folder it asks for (not an old/ subfolder or a file further up). Folders are walked once (skipping hidden ones like .cache) and the catalog rescans itself if any folder's modified time has changed, checking at most once every refresh_interval seconds.
+    """
+    FILE_NAME_PATTERN = re.compile(r'^(?P<prefix>.+?)_(?P<economy>\d{2}_[A-Z]+)_(?P<date>\d{8})(?P<suffix>.*)$')
+
+    def __init__(self, roots, refresh_interval=1):
+        if isinstance(roots, str):
+            roots = [roots]
+        self.roots = list(roots)
+        self.refresh_interval = refresh_interval
+        self.scan()
+
+    def scan(self):
+        self.folder_mtimes = {}
+        #(folder, prefix, economy, extension) -> (latest date, [paths of the files with that date])
+        self.latest = {}
+        for root in self.roots:
+            if not os.path.exists(root):
+                continue
+            for folder, subfolders, files in os.walk(root):
+                subfolders[:] = [subfolder for subfolder in subfolders if not subfolder.startswith('.')]
+                self.folder_mtimes[folder] = os.stat(folder).st_mtime_ns
+                for file in files:
+                    match = self.FILE_NAME_PATTERN.match(file)
+                    if match is None:
+                        continue
+                    key = (os.path.normpath(folder), match['prefix'], match['economy'], os.path.splitext(file)[1])
+                    #dates are YYYYMMDD so comparing the strings is the same as comparing the dates
+                    date = match['date']
+                    path = os.path.join(folder, file)
+                    if key not in self.latest or date > self.latest[key][0]:
+                        self.latest[key] = (date, [path])
+                    elif date == self.latest[key][0]:
+                        self.latest[key][1].append(path)
+        self.last_checked = time.monotonic()
+
+    def refresh(self, force=False):
+        """Rescan if a folder has been changed, added or removed. Returns True if it rescanned."""
+        if not force and time.monotonic() - self.last_checked < self.refresh_interval:
+            return False
+        self.last_checked = time.monotonic()
+        roots_found = [root for root in self.roots if os.path.exists(root)]
+        changed = any(root not in self.folder_mtimes for root in roots_found)
+        for folder, mtime in self.folder_mtimes.items():
+            if changed:
+                break
+            changed = not os.path.exists(folder) or os.stat(folder).st_mtime_ns != mtime
+        if changed:
+            self.scan()
+        return changed
+
+    def latest_files(self, prefix, economy, extension='.csv', folder=None):
+        """Get (date, [paths]) for the latest date of the files with this prefix, economy and extension in folder (e.g. input_data/01_AUS), or (None, []) if there are none. If folder is None every folder under the roots is looked in."""
+        self.refresh()
+        if folder is not None:
+            date, paths = self.latest.get((os.path.normpath(folder), prefix, economy, extension), (None, []))
+            return date, list(paths)
+        date, paths = None, []
+        for (_, prefix_, economy_, extension_), (folder_date, folder_paths) in self.latest.items():
+            if (prefix_, economy_, extension_) != (prefix, economy, extension):
+                continue
+            if date is None or folder_date > date:
+                date, paths = folder_date, list(folder_paths)
+            elif folder_date == date:
+                paths.extend(folder_paths)
+        return date, paths
+
+    def latest_file(self, prefix, economy, extension='.csv', folder=None, known_double_ups=None):
+        """Get the path of the latest file, or None if there isnt one. If there are multiple files on the latest date, the one whose name is in known_double_ups is used, otherwise a ValueError is raised."""
+        if known_double_ups is None:
+            known_double_ups = []
+        date, paths = self.latest_files(prefix, economy, extension, folder)
+        if len(paths) == 0:
+            return None
+        elif len(paths) == 1:
+            return paths[0]
+        for path in paths:
+            if os.path.basename(path) in known_double_ups:
+                return path
+        raise ValueError(f'Multiple files found for {prefix}_{economy} on {date}: {paths}')
+
+    def double_ups(self, folder=None):
+        """Get {(folder, prefix, economy, extension): [paths]} for every key with more than one file on its latest date."""
+        self.refresh()
+        return {key: paths for key, (date, paths) in self.latest.items() if len(paths) > 1 and (folder is None or key[0] == os.path.normpath(folder))}
+
+
+#############################################################
+# Atomic file writes
+#############################################################
+
+
+#read once at import, because reading the umask means setting it, which isnt safe to do while other threads are creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path, write):
+    """Call write(temp_path) to write a temp file in the same folder as path, then rename it to path, so an interrupted write never leaves a half written file with the real name (and readers only ever see a whole file). The temp file is removed if write fails. Returns path."""
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp')
+    os.close(file_descriptor)
+    try:
+        write(temp_path)
+        #mkstemp makes the file readable only by us, so give it the permissions a normal new file would get
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+#############################################################
+# Compact long format outlook tables
+#############################################################
+
+
+OUTLOOK_ID_COLUMNS = ['scenarios', 'economy', 'sectors', 'sub1sectors', 'sub2sectors', 'sub3sectors', 'sub4sectors', 'fuels', 'subfuels', 'subtotal_layout', 'subtotal_results']
+OUTLOOK_LABEL_COLUMNS = ['scenarios', 'economy', 'sectors', 'sub1sectors', 'sub2sectors', 'sub3sectors', 'sub4sectors', 'fuels', 'subfuels']
+OUTLOOK_FLAG_COLUMNS = ['subtotal_layout', 'subtotal_results']
+#what the flag columns can hold in the csvs. Anything else (including blanks) is an error rather than being read as True
+OUTLOOK_FLAG_VALUES = {True: True, False: False, 'True': True, 'False': False, 'TRUE': True, 'FALSE': False, 'true': True, 'false': False}
+
+
+def parse_outlook_flags(values, description):
+    """Turn a subtotal_layout/subtotal_results column into a bool array. Raises a ValueError naming description (e.g. the file and column) if it has anything that isnt True or False."""
+    if pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=bool)
+    parsed = values.map(OUTLOOK_FLAG_VALUES)
+    if parsed.isna().any():
+        bad_values = sorted(set(str(value) for value in values[parsed.isna()].unique()))
+        raise ValueError(f'{description} should only have True or False, but has: {bad_values[:10]}')
+    return parsed.to_numpy(dtype=bool)
+
+
+def shared_outlook_categories(*dfs):
+    """Make one category dictionary ({column: categories}) for the label columns of all the dfs, so tables converted with it can be concatenated, compared and grouped without falling back to strings."""
+    categories = {}
+    for col in OUTLOOK_LABEL_COLUMNS:
+        values = set()
+        for df in dfs:
+            if col not in df.columns:
+                continue
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                values.update(df[col].cat.categories)
+            else:
+                values.update(value for value in df[col].unique() if pd.notna(value))
+        categories[col] = pd.Index(sorted(values, key=str))
+    return categories
+
+
+def to_compact_outlook_table(df, categories=None):
+    """Convert a long format outlook table (the outlook data after melting, or the results from clean_results_for_outlook) to a compact one: the label columns become categoricals (using the shared categories from shared_outlook_categories if given), subtotal_layout/subtotal_results become bools and year becomes int16. Other columns are left as they are.
+
+    If categories is given every label has to be in it (pd.Categorical would turn the others into NaN), otherwise a ValueError listing the unknown labels is raised.
+    """
+    compact = {}
+    for col in df.columns:
+        if col in OUTLOOK_LABEL_COLUMNS:
+            if categories is not None:
+                unknown = df[col].notna() & ~df[col].isin(categories[col])
+                if unknown.any():
+                    raise ValueError(f'The {col} column has labels that are not in the shared categories: {sorted(set(str(value) for value in df.loc[unknown, col].unique()))[:10]}')
+            compact[col] = pd.Categorical(df[col], categories=None if categories is None else categories[col])
+        elif col in OUTLOOK_FLAG_COLUMNS:
+            compact[col] = parse_outlook_flags(df[col], col)
+        elif col == 'year':
+            compact[col] = df[col].astype('int16').to_numpy()
+        else:
+            compact[col] = df[col].to_numpy()
+    return pd.DataFrame(compact, index=df.index)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#the modules in code/ import each other by name, like when they are run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code'))
@@ -0,0 +1,21 @@
+import pandas as pd
+import pytest
+
+from utility_functions import shared_outlook_categories, to_compact_outlook_table
+
+
+def long_outlook_table(fuels):
+    return pd.DataFrame({'scenarios': 'reference', 'economy': '01_AUS', 'sectors': '16_other_sector', 'fuels': fuels, 'subtotal_layout': False, 'subtotal_results': False, 'year': 2030, 'value': 1.0})
+
+
+def test_shared_categories_keep_every_label():
+    df = long_outlook_table(['17_electricity', '08_gas'])
+    compact = to_compact_outlook_table(df, shared_outlook_categories(df))
+    assert compact['fuels'].astype(str).tolist() == ['17_electricity', '08_gas']
+    assert compact['year'].dtype == 'int16'
+
+
+def test_label_missing_from_shared_categories_raises():
+    categories = shared_outlook_categories(long_outlook_table(['17_electricity']))
+    with pytest.raises(ValueError, match='99_new_fuel'):
+        to_compact_outlook_table(long_outlook_table(['17_electricity', '99_new_fuel']), categories)
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from plotting import COMPARISON_CHART_TITLES, economy_dashboard_specs
+
+
+def test_each_scenario_gets_its_own_facets():
+    #what build_outlook_comparison returns, for one economy with a third scenario as well as reference and target
+    scenarios = ['reference', 'target', 'high_ai']
+    outlook_comparison = pd.DataFrame([
+        {'economy': '01_AUS', 'scenarios': scenario, 'chart': chart, 'color': 'data_centres', 'year': year, 'value': float(value)}
+        for value, scenario in enumerate(scenarios, start=1) for chart in COMPARISON_CHART_TITLES.keys() for year in [2030, 2031]])
+    specs = economy_dashboard_specs(outlook_comparison)
+    assert len(specs) == 1
+    data = specs[0]['data']
+    expected_titles = {f'{title} - {scenario}' for title in COMPARISON_CHART_TITLES.values() for scenario in ['Reference', 'Target', 'High Ai']}
+    assert set(data['title']) == expected_titles
+    #the scenarios arent summed together
+    high_ai = data.loc[data['title'] == f"{COMPARISON_CHART_TITLES['buildings']} - High Ai", 'value']
+    assert np.allclose(high_ai, 3.0)
@@ -0,0 +1,75 @@
+import os
+import yaml
+import pandas as pd
+import pytest
+
+import projection_functions as projection_functions
+import synthetic_inputs as synthetic_inputs
+from engine_equivalence import check_config, compare_tables
+from utility_functions import find_project_root
+
+#a few seeds of each build density, with the end years engine_equivalence.py cycles through
+SYNTHETIC_CASES = [(density, seed, end_year) for density in synthetic_inputs.SYNTHETIC_DENSITIES.keys() for seed, end_year in [(0, 2070), (1, 2150)]]
+SYNTHETIC_ECONOMIES = 15
+
+
+def load_parameters():
+    with open(os.path.join(find_project_root(), 'config', 'parameters.yml'), 'r') as file:
+        return yaml.safe_load(file)
+
+
+def assert_all_match(results):
+    results = pd.DataFrame(results)
+    #the monte carlo bands are only compared when there is a second backend installed
+    assert (results['check'] == 'project_energy_use').sum() == 2 + len(projection_functions.available_kernel_backends())
+    failures = results.loc[~results['matches']]
+    assert len(failures) == 0, f'engine/backend checks didnt match their reference:\n{failures.to_string(index=False)}'
+
+
+def test_parameters_config_engines_match():
+    assert_all_match(check_config(load_parameters(), 'parameters.yml'))
+
+
+@pytest.mark.parametrize('density, seed, end_year', SYNTHETIC_CASES)
+def test_synthetic_config_engines_match(density, seed, end_year):
+    config = synthetic_inputs.generate_synthetic_config(SYNTHETIC_ECONOMIES, seed=seed, density=density, base_config=load_parameters(), end_year=end_year)
+    assert_all_match(check_config(config, f'synthetic_{density}_seed{seed}'))
+
+
+@pytest.mark.parametrize('backend', [backend for backend in projection_functions.available_kernel_backends() if backend != 'numpy'])
+def test_monte_carlo_bands_match_between_backends(backend):
+    config = load_parameters()
+    config['monte_carlo'] = {**config['monte_carlo'], 'n_draws': 200, 'chunk_size': 100}
+    reference_bands = projection_functions.project_energy_use_monte_carlo({**config, 'kernel_backend': 'numpy'})
+    bands = projection_functions.project_energy_use_monte_carlo({**config, 'kernel_backend': backend})
+    if backend == 'numba':
+        #make sure it was numba that ran, not the numpy fallback
+        assert projection_functions._numba_recurrence is not projection_functions.numpy_recurrence
+    pd.testing.assert_frame_equal(bands[0], reference_bands[0], rtol=1e-6)
+    pd.testing.assert_frame_equal(bands[1], reference_bands[1], rtol=1e-9)
+
+
+def test_numba_compile_error_falls_back_to_numpy(monkeypatch):
+    pytest.importorskip('numba')
+    def untypeable_recurrence(*arrays):
+        #numba cant type a pandas object, so compiling this fails on the first call
+        return pd.DataFrame(), arrays
+    monkeypatch.setattr(projection_functions, 'looped_recurrence', untypeable_recurrence)
+    monkeypatch.setattr(projection_functions, '_numba_recurrence', None)
+    config = load_parameters()
+    reference = projection_functions.project_energy_use(config, engine='numpy')
+    projections = projection_functions.project_energy_use({**config, 'kernel_backend': 'numba'}, engine='batched')
+    assert projection_functions._numba_recurrence is projection_functions.numpy_recurrence
+    assert compare_tables(reference, projections)[0]
+
+
+def test_schedule_bug_is_caught_in_every_engine(monkeypatch):
+    #the engines all compile their inputs with compile_economy_schedule, so a bug there only shows up against the independent per-row reference
+    compile_economy_schedule = projection_functions.compile_economy_schedule
+    def schedule_without_ratio_overrides(econ_entry, years):
+        econ_entry = {**econ_entry, 'scheduled_builds': [{key: value for key, value in build.items() if key != 'new_traditional_data_to_ai_training_ratio'} for build in econ_entry.get('scheduled_builds', [])]}
+        return compile_economy_schedule(econ_entry, years)
+    monkeypatch.setattr(projection_functions, 'compile_economy_schedule', schedule_without_ratio_overrides)
+    config = synthetic_inputs.generate_synthetic_config(SYNTHETIC_ECONOMIES, seed=0, density='dense', base_config=load_parameters(), end_year=2070)
+    results = pd.DataFrame(check_config(config, 'synthetic_dense_seed0', monte_carlo_draws=0))
+    assert not results['matches'].any()
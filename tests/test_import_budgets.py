@@ -0,0 +1,20 @@
+import pytest
+
+from benchmark import IMPORT_BUDGETS, measure_import
+
+#the time budgets are for a quiet machine, so only fail when a module takes a lot longer than that (e.g. a heavy package is imported at the top of it again). benchmark.py --imports checks the exact budgets
+IMPORT_TIME_TOLERANCE = 3
+
+
+@pytest.mark.parametrize('module_name', list(IMPORT_BUDGETS.keys()))
+def test_import_does_not_load_slow_packages(module_name):
+    _, loaded_modules = measure_import(module_name, repeats=1)
+    loaded = [package for package in IMPORT_BUDGETS[module_name]['not_loaded'] if any(module == package or module.startswith(package + '.') for module in loaded_modules)]
+    assert loaded == [], f'importing {module_name} loads {loaded}'
+
+
+@pytest.mark.parametrize('module_name', list(IMPORT_BUDGETS.keys()))
+def test_import_time_within_budget(module_name):
+    seconds, _ = measure_import(module_name, repeats=3)
+    assert seconds is not None
+    assert seconds <= IMPORT_BUDGETS[module_name]['seconds'] * IMPORT_TIME_TOLERANCE, f'{module_name} took {seconds:.2f}s to import, its budget is {IMPORT_BUDGETS[module_name]["seconds"]}s'
@@ -0,0 +1,36 @@
+import types
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation as instrumentation
+
+
+def make_module():
+    module = types.SimpleNamespace()
+    def write_one(i):
+        time.sleep(0.01)
+        return i
+    def write_all(n):
+        #like save_outputs, which calls the instrumented write_outlook_excel from a thread pool
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(executor.map(lambda i: module.write_one(i), range(n)))
+    module.write_one = write_one
+    module.write_all = write_all
+    return module
+
+
+def test_worker_thread_calls_dont_change_the_stage_tree(tmp_path):
+    module = make_module()
+    instrumentation.instrument_functions({'fake': module}, {'fake': ['write_one', 'write_all']})
+    instrumentation.start_trace(output_dir=str(tmp_path))
+    instrumentation.run_stage('save', module.write_all, 16)
+    module.write_one(99)
+    records = {record['name']: record for record in instrumentation._trace['records']}
+    #only the main thread's calls are recorded, each under the right parent
+    assert sorted(record['name'] for record in instrumentation._trace['records']) == ['save', 'write_all', 'write_one']
+    assert records['save']['parent'] is None
+    assert records['write_all']['parent'] == 'save' and records['write_all']['depth'] == 1
+    assert records['write_one']['parent'] is None and records['write_one']['depth'] == 0
+    assert instrumentation.stage_stack() == []
+    summary = instrumentation.finish_trace()
+    assert len(summary) == 3
@@ -0,0 +1,46 @@
+import os
+import pandas as pd
+import pytest
+
+import data_processing as data_processing
+import synthetic_inputs as synthetic_inputs
+from utility_functions import OUTLOOK_ID_COLUMNS
+
+
+@pytest.fixture
+def outlook_files(tmp_path, monkeypatch):
+    """Synthetic merged_file_energy files for 16 economies (and APEC) in tmp_path/input_data, with tmp_path as the working directory so the cache in input_data/.cache starts empty."""
+    monkeypatch.chdir(tmp_path)
+    config = synthetic_inputs.generate_synthetic_config(16, seed=3)
+    return synthetic_inputs.write_synthetic_outlook_files(config, root='input_data', seed=3)
+
+
+def test_cold_cache_threaded_load(outlook_files):
+    #every thread finds the cache folder missing and makes it at the same time
+    all_data, report = data_processing.load_outlook_energy_files(outlook_files, max_workers=8)
+    expected = pd.concat([pd.read_csv(path) for path in outlook_files], ignore_index=True)
+    assert len(all_data) == len(expected)
+    assert len(report) == len(outlook_files)
+    cache_files = os.listdir(data_processing.OUTLOOK_CACHE_DIR)
+    #one parquet for each file and no temp files left behind
+    assert len(cache_files) == len(outlook_files)
+    assert all(file.endswith('.parquet') and not file.startswith('.') for file in cache_files)
+    #and the second load reads the same data back from the cache
+    cached_data, _ = data_processing.load_outlook_energy_files(outlook_files, max_workers=8)
+    pd.testing.assert_frame_equal(cached_data, all_data)
+    assert list(all_data.columns[:len(OUTLOOK_ID_COLUMNS)]) == OUTLOOK_ID_COLUMNS
+
+
+def test_unreadable_cache_file_is_read_again(outlook_files):
+    data_processing.load_outlook_energy_files(outlook_files[:1])
+    cache_path = os.path.join(data_processing.OUTLOOK_CACHE_DIR, os.listdir(data_processing.OUTLOOK_CACHE_DIR)[0])
+    with open(cache_path, 'wb') as file:
+        file.write(b'not parquet')
+    all_data, _ = data_processing.load_outlook_energy_files(outlook_files[:1])
+    assert len(all_data) == len(pd.read_csv(outlook_files[0]))
+
+
+def test_no_files_gives_empty_table():
+    all_data, report = data_processing.load_outlook_energy_files([])
+    assert list(all_data.columns) == OUTLOOK_ID_COLUMNS
+    assert len(all_data) == 0 and len(report) == 0
@@ -0,0 +1,29 @@
+import os
+import yaml
+
+import projection_functions as projection_functions
+from engine_equivalence import compare_tables
+from utility_functions import find_project_root
+
+
+def load_parameters():
+    with open(os.path.join(find_project_root(), 'config', 'parameters.yml'), 'r') as file:
+        return yaml.safe_load(file)
+
+
+def test_truncated_cache_file_is_projected_again(tmp_path):
+    config = load_parameters()
+    reference = projection_functions.project_energy_use(config)
+    cache_dir = str(tmp_path / 'cache')
+    projection_functions.project_energy_use(config, cache_dir=cache_dir)
+    #cut one cached file short, like a run that was stopped part way through writing it
+    cache_file = os.path.join(cache_dir, sorted(os.listdir(cache_dir))[0])
+    with open(cache_file, 'rb') as file:
+        data = file.read()
+    with open(cache_file, 'wb') as file:
+        file.write(data[:len(data) // 2])
+    projections = projection_functions.project_energy_use(config, cache_dir=cache_dir)
+    assert compare_tables(reference, projections)[0]
+    #and the file is whole again
+    assert compare_tables(reference, projection_functions.project_energy_use(config, cache_dir=cache_dir))[0]
+    assert not any(file.endswith('.tmp') for file in os.listdir(cache_dir))
@@ -0,0 +1,35 @@
+import os
+import plotly.graph_objects as go
+
+import plotting as plotting
+
+
+def test_static_export_writes_each_format_once(tmp_path, monkeypatch):
+    #a stand in for kaleido, so export_static_images finds it, and for the write_image call it would make
+    fake_kaleido = tmp_path / 'fake_packages' / 'kaleido'
+    fake_kaleido.mkdir(parents=True)
+    (fake_kaleido / '__init__.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path / 'fake_packages'))
+    written = []
+    def write_image(fig, path, format=None, scale=None):
+        written.append((os.path.basename(path), format, scale))
+        with open(path, 'w') as file:
+            file.write(format)
+    monkeypatch.setattr(go.Figure, 'write_image', write_image)
+    
+    output_dir = str(tmp_path / 'static')
+    figures = {'projections': go.Figure(go.Scatter(x=[2021, 2022], y=[1, 2]))}
+    #one worker, so the export runs in this process where write_image is replaced
+    timings = plotting.export_static_images(figures, formats=['png', 'svg'], scale=2, output_dir=output_dir, max_workers=1)
+    assert sorted(written) == [('projections.png', 'png', 2), ('projections.svg', 'svg', 2)]
+    assert len(timings) == 1
+    #nothing changed, so the second export skips it
+    written.clear()
+    timings = plotting.export_static_images(figures, formats=['png', 'svg'], scale=2, output_dir=output_dir, max_workers=1)
+    assert written == [] and len(timings) == 0
+
+
+def test_static_export_settings_drop_enabled():
+    config = {'static_export': {'enabled': False, 'formats': ['png'], 'scale': 2}}
+    assert plotting.static_export_settings(config) == {'formats': ['png'], 'scale': 2}
+    assert plotting.static_export_settings({}) == {}